@@ -0,0 +1,245 @@
+import asyncio
+import ipaddress
+import json
+import math
+import re
+import time
+from collections import OrderedDict, deque
+
+from notifications import TokenBucket
+
+PRIORITIES = ('critical', 'normal', 'low')
+
+# (method or None for any, path pattern, priority); the first match wins.
+# None as the priority exempts the route (long-lived streams, metrics).
+DEFAULT_RULES = [
+    (None, r'/api/incidents/stream', None),
+    (None, r'/api/metrics(/.*)?', None),
+    ('POST', r'/api/incidents', 'critical'),
+    (None, r'/api/incidents/[^/]+/(respond|arrive|resolve|messages)', 'critical'),
+    (None, r'/api/checkins(/.*)?', 'critical'),
+    ('GET', r'/api/incidents(/nearby|/history)?', 'low'),
+    ('GET', r'/api/leaderboard(/.*)?', 'low'),
+    ('GET', r'/api/analytics/.*', 'low'),
+    ('GET', r'/api/status', 'low'),
+    ('PUT', r'/api/users/[^/]+/location', 'low'),
+    ('POST', r'/api/locations/batch', 'low'),
+]
+
+
+class _Shed(Exception):
+    def __init__(self, status, reason, retry_after):
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Decides which requests run when the API is overloaded.
+
+    At most ``max_concurrency`` requests run at once; the rest wait in one
+    bounded FIFO queue per priority class and a freed slot always goes to
+    the highest class waiting, so SOS traffic overtakes queued polls.
+
+    Queueing delay is the longer of the oldest waiter's wait and the event
+    loop's lag (requests also queue for the loop itself before they get
+    here). Low-priority requests are shed (503 + Retry-After) while it
+    exceeds ``target_latency``, normal ones while it exceeds ``max_wait``;
+    critical ones only when their own queue is full. Per-client token
+    buckets (429) bound what a single client can send outside the
+    critical class.
+    """
+
+    def __init__(self, max_concurrency=64, queue_sizes=None, target_latency=0.1, max_wait=2.0,
+                 client_rate=20.0, client_burst=40, max_clients=10000, rules=DEFAULT_RULES, metrics=None):
+        self.max_concurrency = max_concurrency
+        self.queue_sizes = {'critical': 1000, 'normal': 200, 'low': 100, **(queue_sizes or {})}
+        self.target_latency = target_latency
+        self.max_wait = max_wait
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.rules = [(method, re.compile(pattern + '/?'), priority) for method, pattern, priority in rules]
+        self.metrics = metrics
+        self.in_flight = 0
+        # priority -> deque of (enqueued at, future)
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        # Event loop lag, measured by start()
+        self.lag = 0.0
+        self._buckets = OrderedDict()
+        self._monitor = None
+
+    def classify(self, method, path):
+        for rule_method, pattern, priority in self.rules:
+            if (rule_method is None or rule_method == method) and pattern.fullmatch(path):
+                return priority
+        return 'normal'
+
+    def queued(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def start(self, interval=0.05):
+        self._monitor = asyncio.create_task(self._watch_lag(interval))
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        self.lag = 0.0
+
+    async def _watch_lag(self, interval):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - start - interval)
+            # Rises at once, decays over a few intervals
+            self.lag = lag if lag > self.lag else 0.7 * self.lag + 0.3 * lag
+
+    def queue_delay(self):
+        now = time.monotonic()
+        oldest = max((now - queue[0][0] for queue in self.queues.values() if queue), default=0.0)
+        return max(self.lag, oldest)
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.queue_delay() * 2))
+
+    def _bucket(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def _count(self, priority, outcome):
+        if self.metrics is not None:
+            self.metrics.admission.inc((priority, outcome))
+
+    def _admitted(self, priority, waited):
+        self._count(priority, 'admitted')
+        if self.metrics is not None:
+            self.metrics.admission_wait.observe((priority,), waited)
+
+    async def acquire(self, priority, client):
+        # Returns once the request may run; raises _Shed otherwise
+        if priority != 'critical' and self.client_rate:
+            wait = self._bucket(client).try_acquire()
+            if wait:
+                self._count(priority, 'rate_limited')
+                raise _Shed(429, 'rate limit exceeded', max(1, math.ceil(wait)))
+
+        limit = {'critical': None, 'normal': self.max_wait, 'low': self.target_latency}[priority]
+        if limit is not None and self.queue_delay() > limit:
+            self._count(priority, 'shed_latency')
+            raise _Shed(503, 'overloaded', self._retry_after())
+
+        rank = PRIORITIES.index(priority)
+        ahead = any(self.queues[p] for p in PRIORITIES[:rank + 1])
+        if self.in_flight < self.max_concurrency and not ahead:
+            self.in_flight += 1
+            self._admitted(priority, 0.0)
+            return
+
+        queue = self.queues[priority]
+        if len(queue) >= self.queue_sizes[priority]:
+            self._count(priority, 'shed_queue_full')
+            raise _Shed(503, 'overloaded', self._retry_after())
+
+        enqueued = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (enqueued, waiter)
+        queue.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), limit)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as the wait ended
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+            else:
+                waiter.cancel()
+                try:
+                    queue.remove(entry)
+                except ValueError:
+                    pass
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self._count(priority, 'shed_latency')
+                raise _Shed(503, 'overloaded', self._retry_after())
+        self._admitted(priority, time.monotonic() - enqueued)
+
+    def release(self):
+        # Hand the slot straight to the highest-priority waiter
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                _, waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+        self.in_flight -= 1
+
+
+class AdmissionMiddleware:
+    # Plain ASGI middleware in front of the routes; see AdmissionController.
+    # X-Forwarded-For only identifies the client when the peer is one of
+    # ``trusted_proxies`` (addresses or CIDR ranges); anyone else could pick
+    # a fresh rate-limit bucket per request by rewriting it.
+    def __init__(self, app, controller, trusted_proxies=()):
+        self.app = app
+        self.controller = controller
+        self.trusted_proxies = [ipaddress.ip_network(p.strip(), strict=False) for p in trusted_proxies if p.strip()]
+
+    def _trusted(self, address):
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client(self, scope):
+        peer = scope.get("client")
+        address = peer[0] if peer else "unknown"
+        if not self._trusted(address):
+            return address
+        forwarded = []
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                forwarded.extend(hop.strip() for hop in value.decode("latin-1").split(","))
+        # Nearest hop not added by one of our own proxies
+        for hop in reversed(forwarded):
+            if hop and not self._trusted(hop):
+                return hop
+        return address
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        priority = self.controller.classify(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.controller.acquire(priority, self.client(scope))
+        except _Shed as shed:
+            body = json.dumps({"detail": shed.reason}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": shed.status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(shed.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import timezone
+
+import numpy as np
+import pandas as pd
+
+import geo
+from archive import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+def _seconds_since(start, value):
+    at = parse_timestamp(value)
+    return (at - start).total_seconds() if at is not None else None
+
+
+def contribution(incident, precision):
+    # An incident's share of the rollups: (type, status, hour, cell,
+    # responding, arrived, response seconds, responses timed, arrival
+    # seconds, arrivals timed). _frame() computes the same column-wise.
+    reported = parse_timestamp(incident.get('timestamp'))
+    location = geo.point(incident.get('location'))
+    cell = geo.geohash(location[0], location[1], precision) if location else None
+    response_sum = arrival_sum = 0.0
+    responses = arrivals = 0
+    if reported is not None:
+        for times in (incident.get('responseTimes') or {}).values():
+            seconds = _seconds_since(reported, times.get('respondedAt'))
+            if seconds is not None:
+                response_sum += seconds
+                responses += 1
+            seconds = _seconds_since(reported, times.get('arrivedAt'))
+            if seconds is not None:
+                arrival_sum += seconds
+                arrivals += 1
+    return (
+        incident.get('type'),
+        incident.get('status'),
+        reported.astimezone(timezone.utc).hour if reported is not None else None,
+        cell,
+        len(incident.get('respondingHelpers') or ()),
+        len(incident.get('arrivedHelpers') or ()),
+        response_sum, responses, arrival_sum, arrivals,
+    )
+
+
+def geohash_cells(lat, lng, precision):
+    # geo.geohash over coordinate arrays
+    lng_bits, lat_bits = geo.geohash_bits(precision)
+    x = np.clip(((lng + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64), 0, (1 << lng_bits) - 1)
+    y = np.clip(((lat + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    codes = np.zeros(len(x), dtype=np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lng_bits -= 1
+            codes = (codes << 1) | ((x >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            codes = (codes << 1) | ((y >> lat_bits) & 1)
+    unique, inverse = np.unique(codes, return_inverse=True)
+    names = np.array([geo.geohash_string(int(code), precision) for code in unique], dtype=object)
+    return names[inverse]
+
+
+def _frame(incidents, precision):
+    # Contribution columns for a batch of incidents, computed with pandas
+    rows, times = [], []
+    for i, incident in enumerate(incidents):
+        location = geo.point(incident.get('location'))
+        rows.append((
+            incident.get('id'), incident.get('type'), incident.get('status'), incident.get('timestamp'),
+            location[0] if location else np.nan, location[1] if location else np.nan,
+            len(incident.get('respondingHelpers') or ()), len(incident.get('arrivedHelpers') or ()),
+        ))
+        for entry in (incident.get('responseTimes') or {}).values():
+            times.append((i, entry.get('respondedAt'), entry.get('arrivedAt')))
+    df = pd.DataFrame(rows, columns=['id', 'type', 'status', 'timestamp', 'lat', 'lng', 'responding', 'arrived'])
+    reported = pd.to_datetime(df['timestamp'], utc=True, errors='coerce', format='ISO8601')
+    hour = reported.dt.hour.astype('Int64').astype(object)
+    df['hour'] = hour.where(hour.notna(), None)
+    located = df['lat'].notna() & df['lng'].notna()
+    df['cell'] = None
+    if located.any():
+        df.loc[located, 'cell'] = geohash_cells(df.loc[located, 'lat'].to_numpy(), df.loc[located, 'lng'].to_numpy(), precision)
+
+    n = len(df)
+    for kind, column in (('response', 'respondedAt'), ('arrival', 'arrivedAt')):
+        df[f'{kind}_sum'] = 0.0
+        df[f'{kind}s'] = 0
+        if not times:
+            continue
+        t = pd.DataFrame(times, columns=['row', 'respondedAt', 'arrivedAt'])
+        at = pd.to_datetime(t[column], utc=True, errors='coerce', format='ISO8601')
+        start = reported.iloc[t['row']].reset_index(drop=True)
+        seconds = (at - start).dt.total_seconds()
+        valid = seconds.notna().to_numpy()
+        rows_ = t['row'].to_numpy()[valid]
+        df[f'{kind}_sum'] = np.bincount(rows_, weights=seconds.to_numpy()[valid], minlength=n)
+        df[f'{kind}s'] = np.bincount(rows_, minlength=n)
+    return df
+
+
+_COLUMNS = ['type', 'status', 'hour', 'cell', 'responding', 'arrived',
+            'response_sum', 'responses', 'arrival_sum', 'arrivals']
+
+
+class IncidentAnalytics:
+    """Incident rollups kept current as incidents are written.
+
+    Counts by type, status, hour of day (UTC) and geohash cell, plus helper
+    response and arrival times, are adjusted by each incident's change in
+    contribution on every write, so reading them never touches the
+    incidents. backfill() builds them once at startup from the hot
+    collection and the archive with pandas. Archiving an incident (a
+    delete) leaves its counts in place.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.ready = asyncio.Event()
+        self.total = 0
+        self.by_type = Counter()
+        self.by_status = Counter()
+        self.by_hour = [0] * 24
+        self.by_cell = Counter()
+        self.centers = {}
+        self.helpers = {'responding': 0, 'arrived': 0, 'response_sum': 0.0, 'responses': 0, 'arrival_sum': 0.0, 'arrivals': 0}
+        # _id -> contribution of incidents still in the hot collection
+        self._contributions = {}
+        # Changes seen while the backfill runs, applied after it
+        self._pending = []
+
+    def attach(self, collection):
+        collection.add_listener(self._on_change)
+
+    def _on_change(self, event):
+        if self._pending is not None:
+            self._pending.append(event)
+        else:
+            self._apply(event)
+
+    def _apply(self, event):
+        doc = event.get('fullDocument') or {}
+        _id = event.get('documentKey', {}).get('_id', doc.get('_id'))
+        if event['operationType'] == 'delete':
+            self._contributions.pop(_id, None)
+            return
+        new = contribution(doc, self.precision)
+        old = self._contributions.get(_id)
+        if new != old:
+            if old is not None:
+                self._add(old, -1)
+            self._add(new, 1)
+            self._contributions[_id] = new
+
+    def _add(self, c, sign):
+        incident_type, status, hour, cell, responding, arrived, response_sum, responses, arrival_sum, arrivals = c
+        self.total += sign
+        if incident_type is not None:
+            self.by_type[incident_type] += sign
+        if status is not None:
+            self.by_status[status] += sign
+        if hour is not None:
+            self.by_hour[hour] += sign
+        if cell is not None:
+            self.by_cell[cell] += sign
+            if self.by_cell[cell] <= 0:
+                del self.by_cell[cell]
+        helpers = self.helpers
+        helpers['responding'] += sign * responding
+        helpers['arrived'] += sign * arrived
+        helpers['response_sum'] += sign * response_sum
+        helpers['responses'] += sign * responses
+        helpers['arrival_sum'] += sign * arrival_sum
+        helpers['arrivals'] += sign * arrivals
+
+    def _add_frame(self, df):
+        if df.empty:
+            return
+        self.total += len(df)
+        self.by_type.update(df['type'].value_counts().to_dict())
+        self.by_status.update(df['status'].value_counts().to_dict())
+        for hour, count in df['hour'].dropna().value_counts().items():
+            self.by_hour[int(hour)] += int(count)
+        self.by_cell.update(df['cell'].dropna().value_counts().to_dict())
+        for key in self.helpers:
+            # Plain Python numbers, whatever the column's dtype
+            total = df[key].sum()
+            self.helpers[key] += float(total) if key.endswith('_sum') else int(total)
+
+    async def backfill(self, collection, archive=None):
+        start = time.perf_counter()
+        try:
+            hot = [doc async for doc in collection.find({})]
+            df = await asyncio.to_thread(_frame, hot, self.precision)
+            self._add_frame(df)
+            records = df[_COLUMNS].astype(object).where(df[_COLUMNS].notna(), None).itertuples(index=False, name=None)
+            self._contributions = {doc['_id']: tuple(record) for doc, record in zip(hot, records)}
+            if archive is not None:
+                # Archived copies of incidents still in the hot collection (a
+                # crash between archiving and deleting) are counted once
+                hot_ids = set(df['id'])
+                archived = await asyncio.to_thread(
+                    lambda: [doc for doc in archive.scan() if doc.get('id') not in hot_ids]
+                )
+                if archived:
+                    self._add_frame(await asyncio.to_thread(_frame, archived, self.precision))
+            logger.info(f"Analytics backfilled {self.total} incidents in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Serve what was counted rather than blocking the endpoints
+            logger.error(f"Error backfilling analytics: {e}")
+        finally:
+            pending, self._pending = self._pending, None
+            for event in pending:
+                self._apply(event)
+            self.ready.set()
+
+    def summary(self):
+        helpers = self.helpers
+        return {
+            'total': self.total,
+            'byType': {k: v for k, v in self.by_type.items() if v},
+            'byStatus': {k: v for k, v in self.by_status.items() if v},
+            'byHour': list(self.by_hour),
+            'cells': len(self.by_cell),
+            'helpers': {
+                'responding': helpers['responding'],
+                'arrived': helpers['arrived'],
+                'meanResponseSeconds': helpers['response_sum'] / helpers['responses'] if helpers['responses'] else None,
+                'meanArrivalSeconds': helpers['arrival_sum'] / helpers['arrivals'] if helpers['arrivals'] else None,
+            },
+        }
+
+    def heatmap(self, limit=None):
+        cells = self.by_cell.most_common(limit)
+        result = []
+        for cell, count in cells:
+            center = self.centers.get(cell)
+            if center is None:
+                center = self.centers[cell] = geo.geohash_center(cell)
+            result.append({'geohash': cell, 'lat': center[0], 'lng': center[1], 'count': count})
+        return {'precision': self.precision, 'cells': result}
@@ -0,0 +1,62 @@
+"""Compare two benchmark result files and flag latency regressions.
+
+    python -m benchmarks.compare baseline.json current.json --metric p95_ms --threshold 0.2
+
+Exits with status 1 when any operation's metric grew by more than the
+threshold (a fraction of the baseline value).
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(results, prefix=""):
+    # {"10000": {"find_one_by_id": {...}}} -> {"10000/find_one_by_id": {...}}
+    rows = {}
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        key = f"{prefix}{name}"
+        if "count" in value:
+            rows[key] = value
+        else:
+            rows.update(flatten(value, key + "/"))
+    return rows
+
+
+def compare(baseline, current, metric, threshold):
+    base_rows = flatten(baseline["results"])
+    current_rows = flatten(current["results"])
+    regressions = []
+    for key in sorted(base_rows.keys() & current_rows.keys()):
+        before, after = base_rows[key].get(metric), current_rows[key].get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<45} {before:>12} -> {after:<12} {change:+.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--metric", default="p95_ms")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.metric, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) in {args.metric} beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""In-process ASGI load generator replaying typical SafeCircle traffic.
+
+Run from the backend directory:
+
+    python -m benchmarks.load --users 5000 --clients 2000 --duration 30 --out benchmarks/results/load.json
+
+Every connected client polls the active incident list and reports its
+location every 5 seconds, and SOS alerts arrive at --sos-per-minute.
+Requests are issued open-loop on a Poisson schedule and latency is
+measured from each request's scheduled start, so a server that falls
+behind shows up as queueing delay instead of a lower request rate. The
+server runs against a fresh database in a temporary directory.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from seed import DEFAULT_CENTER, generate_users
+from benchmarks.results import save, summarize
+
+
+def poisson_schedule(rng, rate, duration, kind):
+    times = []
+    if rate <= 0:
+        return times
+    t = rng.expovariate(rate)
+    while t < duration:
+        times.append((t, kind))
+        t += rng.expovariate(rate)
+    return times
+
+
+def jitter(rng, spread=0.01):
+    return {"lat": DEFAULT_CENTER[0] + rng.uniform(-spread, spread), "lng": DEFAULT_CENTER[1] + rng.uniform(-spread, spread)}
+
+
+async def run_load(args):
+    import httpx
+    import server
+
+    rng = random.Random(args.seed)
+    user_ids = [f"gen-user-{i}" for i in range(args.users)]
+    await server.db.users.insert_many(list(generate_users(args.users, args.seed)))
+    await server.startup_db_client()
+
+    etag = {}
+
+    def phone():
+        # Each simulated phone is its own client for per-client rate limits
+        n = rng.randrange(args.clients)
+        return {"X-Forwarded-For": f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"}
+
+    async def poll(client):
+        headers = phone()
+        if args.etag and "poll" in etag:
+            headers["If-None-Match"] = etag["poll"]
+        response = await client.get("/api/incidents", params={"status": "active", "expand": "none", "limit": 100}, headers=headers)
+        if "etag" in response.headers:
+            etag["poll"] = response.headers["etag"]
+        return response
+
+    async def ping(client):
+        if args.ping_batch > 1:
+            updates = [{"userId": rng.choice(user_ids), **jitter(rng)} for _ in range(args.ping_batch)]
+            return await client.post("/api/locations/batch", json={"updates": updates}, headers=phone())
+        return await client.put(f"/api/users/{rng.choice(user_ids)}/location", json=jitter(rng), headers=phone())
+
+    async def sos(client):
+        return await client.post("/api/incidents", json={
+            "id": f"load-{rng.getrandbits(64):016x}",
+            "type": rng.choice(["Medical", "Assault", "Accident", "Other"]),
+            "victimId": rng.choice(user_ids),
+            "location": jitter(rng),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "status": "active",
+        }, headers=phone())
+
+    operations = {"poll": poll, "ping": ping, "sos": sos}
+    schedule = sorted(
+        poisson_schedule(rng, args.clients / args.poll_interval, args.duration, "poll")
+        + poisson_schedule(rng, args.clients / args.ping_interval / args.ping_batch, args.duration, "ping")
+        + poisson_schedule(rng, args.sos_per_minute / 60.0, args.duration, "sos")
+    )
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    loop = asyncio.get_running_loop()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        async def issue(kind, scheduled):
+            try:
+                status = (await operations[kind](client)).status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies[kind].append(loop.time() - scheduled)
+            statuses[kind][str(status)] += 1
+
+        tasks = []
+        start = loop.time()
+        for at, kind in schedule:
+            delay = start + at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(issue(kind, start + at)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+
+    await server.shutdown_db_client()
+
+    results = {kind: {**summarize(values, elapsed), "status": dict(statuses[kind])} for kind, values in latencies.items()}
+    results["total"] = {**summarize([v for values in latencies.values() for v in values], elapsed), "elapsed_s": round(elapsed, 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000, help="registered users in the dataset")
+    parser.add_argument("--clients", type=int, default=1000, help="concurrently connected phones")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic to schedule")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--ping-interval", type=float, default=5.0)
+    parser.add_argument("--ping-batch", type=int, default=1, help="send pings via /locations/batch in groups of N")
+    parser.add_argument("--sos-per-minute", type=float, default=30.0)
+    parser.add_argument("--no-etag", dest="etag", action="store_false", help="poll without If-None-Match")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-url", default="mock://", help="storage backend URL, as for MONGO_URL")
+    parser.add_argument("--out", default="benchmarks/results/load.json", help="JSON output path, or - for stdout")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ.setdefault("NOTIFICATION_PROVIDER", "fake")
+        # The in-process transport is the "proxy" that sets X-Forwarded-For
+        os.environ.setdefault("TRUSTED_PROXIES", "127.0.0.1")
+        os.environ["MONGO_URL"] = args.db_url
+        try:
+            results = asyncio.run(run_load(args))
+        finally:
+            os.chdir(cwd)
+
+    for kind, r in results.items():
+        print(f"{kind:>5}: n={r['count']} p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms {r['ops_per_sec']} req/s")
+    save(out, "load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Micro-benchmarks for MockCollection operations across dataset sizes.
+
+Run from the backend directory:
+
+    python -m benchmarks.micro --sizes 1000 10000 100000 --out benchmarks/results/micro.json
+
+Each size gets a fresh database in a temporary directory, so the
+persistence layer is exercised without touching db.json. --db-url runs the
+same workload against another backend (see storage.py), e.g.
+sqlite:///bench.db or mongodb://localhost:27017.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from storage import connect, create_indexes
+from seed import DEFAULT_CENTER, generate_users
+from benchmarks.results import save, summarize
+
+
+async def timed(operation, repeat):
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+async def bench_size(size, repeat, seed, db_url):
+    rng = random.Random(seed)
+    docs = list(generate_users(size, seed))
+    ids = [doc["id"] for doc in docs]
+    picks = [rng.choice(ids) for _ in range(repeat)]
+    phones = [rng.choice(docs)["phone"] for _ in range(repeat)]
+    # Full scans and sorts are orders of magnitude slower; sample fewer
+    heavy = max(5, repeat // 50)
+
+    client = connect(db_url)
+    db = client["safecircle_bench"]
+    if hasattr(client, "drop_database"):
+        await client.drop_database("safecircle_bench")
+    await create_indexes(db)
+    users = db.users
+    results = {}
+    try:
+        start = time.perf_counter()
+        await users.insert_many(docs)
+        elapsed = time.perf_counter() - start
+        results["insert_many"] = {"count": size, "seconds": round(elapsed, 4), "ops_per_sec": round(size / elapsed, 1)}
+
+        results["find_one_by_id"] = await timed(lambda i: users.find_one({"id": picks[i]}), repeat)
+        results["find_one_unindexed"] = await timed(lambda i: users.find_one({"phone": phones[i]}), heavy)
+        results["update_one_set_location"] = await timed(
+            lambda i: users.update_one(
+                {"id": picks[i]},
+                {"$set": {"location": {"lat": DEFAULT_CENTER[0] + rng.uniform(-0.02, 0.02), "lng": DEFAULT_CENTER[1]}}},
+            ),
+            repeat,
+        )
+        results["update_one_inc_points"] = await timed(
+            lambda i: users.update_one({"id": picks[i]}, {"$inc": {"points": 10}}), repeat
+        )
+        results["sort_indexed_top10"] = await timed(
+            lambda i: users.find({}, {"_id": 0}).sort("points", -1).limit(10).to_list(10), repeat
+        )
+        results["sort_unindexed_top50"] = await timed(
+            lambda i: users.find({}, {"_id": 0}).sort("rating", -1).limit(50).to_list(50), heavy
+        )
+        results["sort_full"] = await timed(
+            lambda i: users.find({}, {"_id": 0, "id": 1}).sort("rating", -1).to_list(None), heavy
+        )
+        results["near_1km"] = await timed(
+            lambda i: users.find(
+                {"location": {"$near": {"lat": DEFAULT_CENTER[0], "lng": DEFAULT_CENTER[1]}, "$maxDistance": 1000}},
+                {"_id": 0, "id": 1},
+            ).to_list(100),
+            repeat,
+        )
+    finally:
+        if hasattr(client, "drop_database"):
+            await client.drop_database("safecircle_bench")
+        client.close()
+    return results
+
+
+def run(sizes, repeat, seed, db_url="mock://"):
+    results = {}
+    cwd = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                results[str(size)] = asyncio.run(bench_size(size, repeat, seed, db_url))
+            finally:
+                os.chdir(cwd)
+        print(f"size={size}: " + ", ".join(
+            f"{name} p50={r['p50_ms']}ms" for name, r in results[str(size)].items() if "p50_ms" in r
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=1000, help="samples per cheap operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-url", default="mock://", help="storage backend URL, as for MONGO_URL")
+    parser.add_argument("--out", default="benchmarks/results/micro.json", help="JSON output path, or - for stdout")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    results = run(args.sizes, args.repeat, args.seed, args.db_url)
+    save(out, "micro", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, elapsed=None):
+    # latencies in seconds; elapsed is the wall time the operations took
+    # together (defaults to their sum, i.e. run back to back)
+    values = sorted(latencies)
+    total = elapsed if elapsed is not None else sum(values)
+    ms = lambda v: round(v * 1000, 4)
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "ops_per_sec": round(len(values) / total, 1) if total else 0.0,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(__file__), timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def save(path, benchmark, config, results):
+    report = {"benchmark": benchmark, "config": config, "environment": environment(), "results": results}
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return report
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+    return report
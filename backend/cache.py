@@ -0,0 +1,112 @@
+import hashlib
+import itertools
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+
+class _Entry:
+    __slots__ = ('versions', 'etag', 'body', 'headers')
+
+    def __init__(self, versions, etag, body, headers):
+        self.versions = versions
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+
+class DocumentVersions:
+    """Write counters for the individual documents of a collection.
+
+    Lets a cached response depend on the few documents it embeds instead of
+    every write to their collection. A change whose document cannot be
+    identified bumps every document at once.
+    """
+
+    def __init__(self, collection, key='id'):
+        self.key = key
+        self._clock = itertools.count(1)
+        self._versions = {}
+        self._generation = 0
+        collection.add_listener(self._on_change)
+
+    def _on_change(self, event):
+        doc_id = (event.get('fullDocument') or {}).get(self.key)
+        if doc_id is None:
+            self._generation = next(self._clock)
+        else:
+            self._versions[doc_id] = next(self._clock)
+
+    def of(self, ids):
+        return (self._generation,) + tuple(self._versions.get(doc_id, 0) for doc_id in ids)
+
+
+class ResponseCache:
+    """Pre-serialized JSON responses keyed by route + query string.
+
+    An entry stays valid while the write versions of the collections it was
+    built from are unchanged, so polls that find nothing new skip the query
+    and serialization entirely, and clients sending If-None-Match get a 304.
+    """
+
+    def __init__(self, max_entries=1024, sync=None):
+        self.max_entries = max_entries
+        # Brings collection versions up to date before they are compared,
+        # e.g. MockDatabase.sync for a database shared by several processes
+        self.sync = sync
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(request):
+        params = '&'.join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{params}"
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def _versions(self, collections, depends):
+        if self.sync is not None:
+            self.sync()
+        return tuple(collection.version for collection in collections) + tuple(depends)
+
+    async def value(self, key, collections, compute):
+        # Any other computed value, cached while the collections are unchanged
+        key = ('value', key)
+        versions = self._versions(collections, ())
+        entry = self._entries.get(key)
+        if entry is None or entry.versions != versions:
+            entry = self._store(key, _Entry(versions, None, await compute(), None))
+        else:
+            self._entries.move_to_end(key)
+        return entry.body
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def respond(self, request, collections, build, depends=()):
+        # build() -> (body bytes, extra headers or None); only called on a
+        # miss. ``depends`` adds versions beyond the collections' own (see
+        # DocumentVersions).
+        key = self.key(request)
+        versions = self._versions(collections, depends)
+        entry = self._entries.get(key)
+        if entry is not None and entry.versions == versions:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            body, headers = await build()
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            entry = self._store(key, _Entry(versions, etag, body, headers or {}))
+
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and entry.etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+import time
+
+from archive import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """Hierarchical timing wheel of deadlines keyed by id.
+
+    Level 0 has one slot per tick; each slot of level n covers a whole
+    rotation of level n-1 and is cascaded down when the wheel reaches it.
+    Arming and cancelling are a dict insert/removal whatever the number of
+    pending timers, and advancing only visits the slots that come due.
+    Deadlines beyond the top level wait in an overflow bucket.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow = {}
+        # key -> the bucket holding it
+        self._where = {}
+        # Last tick processed; everything due at or before it has fired
+        self._current = self._tick_of(time.time() if now is None else now)
+
+    def _tick_of(self, at):
+        return math.floor(at / self.tick)
+
+    def _due_tick(self, deadline):
+        # First tick at or after the deadline, so nothing fires early
+        return math.ceil(deadline / self.tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def _place(self, key, deadline, tick):
+        # Lowest level where the tick is less than a rotation ahead, so its
+        # slot comes up before the wheel wraps around to it again
+        for level in range(self.levels):
+            scale = self.slots ** level
+            if tick // scale - self._current // scale < self.slots:
+                bucket = self._wheels[level][(tick // scale) % self.slots]
+                break
+        else:
+            bucket = self._overflow
+        bucket[key] = deadline
+        self._where[key] = bucket
+
+    def arm(self, key, deadline):
+        # (Re)schedules key; a deadline already past fires on the next tick
+        self.cancel(key)
+        self._place(key, deadline, max(self._due_tick(deadline), self._current + 1))
+
+    def cancel(self, key):
+        bucket = self._where.pop(key, None)
+        if bucket is not None:
+            del bucket[key]
+            return True
+        return False
+
+    def _cascade(self, bucket):
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, deadline in entries:
+            self._place(key, deadline, max(self._due_tick(deadline), self._current))
+
+    def advance(self, now):
+        """Move the wheel up to ``now`` and return the keys that came due."""
+        expired = []
+        target = self._tick_of(now)
+        while self._current < target:
+            self._current += 1
+            tick = self._current
+            if tick % self.slots ** self.levels == 0:
+                self._cascade(self._overflow)
+            # Higher levels first, so what they hand down can cascade again
+            for level in range(self.levels - 1, 0, -1):
+                scale = self.slots ** level
+                if tick % scale == 0:
+                    self._cascade(self._wheels[level][(tick // scale) % self.slots])
+            bucket = self._wheels[0][tick % self.slots]
+            if bucket:
+                for key in bucket:
+                    del self._where[key]
+                expired.extend(bucket)
+                bucket.clear()
+        return expired
+
+
+class CheckInScheduler:
+    """Escalates check-ins whose deadline passes without a check-in.
+
+    The wheel mirrors the active documents of the checkins collection: a
+    listener re-arms or cancels a timer on every write (including writes
+    replayed from other worker processes) and start() arms the ones
+    persisted before a restart, firing those that expired meanwhile.
+    Expired ids are handed to ``on_expire`` in one batch per tick.
+    """
+
+    def __init__(self, collection, tick=1.0):
+        self.collection = collection
+        self.tick = tick
+        self.wheel = TimerWheel(tick)
+        self.on_expire = None
+        self.expired = 0
+        self._task = None
+
+    def _on_change(self, event):
+        doc = event.get('fullDocument') or {}
+        if event['operationType'] != 'delete' and doc.get('status') == 'active':
+            self.arm(doc)
+        else:
+            self.wheel.cancel(doc.get('id'))
+
+    def arm(self, doc):
+        deadline = parse_timestamp(doc.get('deadline'))
+        if deadline is not None:
+            self.wheel.arm(doc['id'], deadline.timestamp())
+
+    async def start(self, on_expire):
+        self.on_expire = on_expire
+        self.collection.add_listener(self._on_change)
+        async for doc in self.collection.find({"status": "active"}, {"_id": 0, "id": 1, "deadline": 1}):
+            self.arm(doc)
+        logger.info(f"Armed {len(self.wheel)} check-in timers")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.collection.remove_listener(self._on_change)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # Wake on tick boundaries
+            await asyncio.sleep(self.tick - time.time() % self.tick)
+            expired = self.wheel.advance(time.time())
+            if not expired:
+                continue
+            self.expired += len(expired)
+            try:
+                await self.on_expire(expired)
+            except Exception as e:
+                logger.error(f"Error escalating {len(expired)} missed check-ins: {e}")
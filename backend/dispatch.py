@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+
+from geo import EARTH_RADIUS_M
+
+ALERT_TYPES = ('medical', 'assault', 'accident', 'other')
+DEFAULT_ALERT_RADIUS_M = 1000
+# The widest radius the settings screen offers
+MAX_ALERT_RADIUS_M = 2000
+
+
+def alert_type(incident_type):
+    # Incident types are capitalized ("Medical"); preferences use lowercase keys
+    name = (incident_type or 'other').lower()
+    return name if name in ALERT_TYPES else 'other'
+
+
+def _number(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if math.isfinite(value) and value else default
+
+
+class HelperDispatcher:
+    """Columnar view of responders for fanning out an SOS.
+
+    Each user occupies one row of a set of NumPy arrays that is updated in
+    place as user documents change, so selecting and ranking every eligible
+    helper for an incident is a handful of vectorized operations rather
+    than a Python loop over the users collection.
+    """
+
+    def __init__(self, capacity=1024):
+        self._rows = {}
+        self._ids = []
+        self._free = []
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, '_lat', None)
+        arrays = {
+            '_lat': np.zeros(capacity),
+            '_lng': np.zeros(capacity),
+            '_coslat': np.zeros(capacity),
+            '_radius': np.zeros(capacity),
+            '_rating': np.zeros(capacity),
+            '_level': np.zeros(capacity, dtype=np.int32),
+            '_located': np.zeros(capacity, dtype=bool),
+            '_silent': np.zeros(capacity, dtype=bool),
+            '_alerts': np.zeros((capacity, len(ALERT_TYPES)), dtype=bool),
+        }
+        for name, array in arrays.items():
+            if old is not None:
+                current = getattr(self, name)
+                array[:len(current)] = current
+            setattr(self, name, array)
+        self._ids.extend([None] * (capacity - len(self._ids)))
+
+    def attach(self, collection):
+        collection.add_listener(self._on_change)
+
+    def load(self, users):
+        for user in users:
+            self.upsert(user)
+
+    def _on_change(self, event):
+        if event['operationType'] == 'delete':
+            self.remove(event.get('fullDocument', {}).get('id'))
+        elif event.get('fullDocument'):
+            self.upsert(event['fullDocument'])
+
+    def upsert(self, user):
+        user_id = user.get('id')
+        if user_id is None:
+            return
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self._ids):
+                    self._allocate(len(self._ids) * 2)
+                row = self._size
+                self._size += 1
+            self._rows[user_id] = row
+            self._ids[row] = user_id
+
+        # User documents are not validated beyond a dict; a location that
+        # is not a pair of finite numbers counts as no location
+        location = user.get('location') or {}
+        try:
+            lat, lng = float(location['lat']), float(location['lng'])
+            located = math.isfinite(lat) and math.isfinite(lng)
+        except (KeyError, TypeError, ValueError):
+            located = False
+        self._located[row] = located
+        if located:
+            self._lat[row] = math.radians(lat)
+            self._lng[row] = math.radians(lng)
+            self._coslat[row] = math.cos(self._lat[row])
+
+        preferences = user.get('preferences') or {}
+        receive = preferences.get('receiveAlerts') or {}
+        self._radius[row] = _number(preferences.get('alertRadius'), DEFAULT_ALERT_RADIUS_M)
+        self._silent[row] = bool(preferences.get('silentMode', False))
+        self._alerts[row] = [bool(receive.get(t, True)) for t in ALERT_TYPES]
+        self._rating[row] = _number(user.get('rating'), 0.0)
+        self._level[row] = int(_number(user.get('level'), 1))
+
+    def remove(self, user_id):
+        row = self._rows.pop(user_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._located[row] = False
+            self._free.append(row)
+
+    def candidates(self, lat, lng, incident_type, exclude=(), limit=None):
+        # Everyone whose own alert radius covers the incident, who opted in
+        # to this incident type and is not in silent mode, nearest first
+        # (ties broken by higher rating, then higher level).
+        n = self._size
+        if n == 0:
+            return []
+        lat0, lng0 = np.radians(lat), np.radians(lng)
+        a = (np.sin((self._lat[:n] - lat0) / 2) ** 2
+             + np.cos(lat0) * self._coslat[:n] * np.sin((self._lng[:n] - lng0) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        mask = (self._located[:n]
+                & ~self._silent[:n]
+                & self._alerts[:n, ALERT_TYPES.index(alert_type(incident_type))]
+                & (distance <= self._radius[:n]))
+        for user_id in exclude:
+            row = self._rows.get(user_id)
+            if row is not None:
+                mask[row] = False
+
+        rows = np.flatnonzero(mask)
+        order = np.lexsort((-self._level[rows], -self._rating[rows], distance[rows]))
+        if limit is not None:
+            order = order[:limit]
+        rows = rows[order]
+        return [
+            {'userId': self._ids[row], 'distance': dist, 'rating': rating, 'level': level}
+            for row, dist, rating, level in zip(
+                rows.tolist(),
+                np.round(distance[rows], 1).tolist(),
+                self._rating[rows].tolist(),
+                self._level[rows].tolist(),
+            )
+        ]
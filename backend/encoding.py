@@ -0,0 +1,103 @@
+"""JSON encoding for API responses.
+
+orjson is used when installed, the standard library otherwise.
+ModelEncoder renders stored documents in the shape a pydantic
+response_model gives them, without validating every document again on
+each read: writes validate documents into their canonical JSON form, so a
+read only has to pick the model's fields and fill in defaults.
+"""
+import json
+import typing
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_MISSING = object()
+
+
+def json_bytes(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, separators=(',', ':'), ensure_ascii=False, default=str).encode()
+
+
+def _unwrap(annotation):
+    # Optional[X] -> X, then List[X] -> (X, True)
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if typing.get_origin(annotation) is typing.Union and len(args) == 1:
+        annotation = args[0]
+    if typing.get_origin(annotation) in (list, List):
+        return typing.get_args(annotation)[0], True
+    return annotation, False
+
+
+class ModelEncoder:
+    def __init__(self, model):
+        self.model = model
+        self.list_adapter = TypeAdapter(List[model])
+        # (name, default factory or None if required, converter or None)
+        self.fields = []
+        for name, field in model.model_fields.items():
+            if field.is_required():
+                default = None
+            elif field.default_factory is not None:
+                default = field.default_factory
+            else:
+                default = lambda value=field.default: value
+            self.fields.append((name, default, self._converter(field.annotation)))
+
+    @staticmethod
+    def _converter(annotation):
+        inner, many = _unwrap(annotation)
+        if isinstance(inner, type) and issubclass(inner, BaseModel):
+            nested = ModelEncoder(inner)
+            if many:
+                return lambda value: [nested.row(v) for v in value] if value is not None else None
+            return lambda value: nested.row(value) if value is not None else None
+        if inner is float and not many:
+            # pydantic renders a stored 3 as 3.0
+            return lambda value: float(value) if type(value) is int else value
+        if inner is datetime and not many:
+            adapter = TypeAdapter(datetime)
+            return lambda value: value if value is None or isinstance(value, str) else adapter.dump_python(value, mode='json')
+        return None
+
+    def canonical(self, doc):
+        # Validated, JSON-ready form of a document, as it should be stored
+        return self.model.model_validate(doc).model_dump(mode='json')
+
+    def row(self, doc):
+        if isinstance(doc, BaseModel):
+            return doc.model_dump(mode='json')
+        row = {}
+        for name, default, convert in self.fields:
+            value = doc.get(name, _MISSING)
+            if value is _MISSING:
+                if default is None:
+                    # Not a valid document; let pydantic raise the same error
+                    # response_model validation would
+                    return self.canonical(doc)
+                value = default()
+            elif convert is not None:
+                value = convert(value)
+            row[name] = value
+        return row
+
+    def encode(self, doc):
+        return json_bytes(self.row(doc))
+
+    def encode_list(self, docs):
+        return json_bytes([self.row(doc) for doc in docs])
+
+    def validate(self, doc):
+        return self.model.model_validate(doc).model_dump_json().encode()
+
+    def validate_list(self, docs):
+        # Full pydantic round trip, as response_model=List[model] would do
+        return self.list_adapter.dump_json(self.list_adapter.validate_python(docs))
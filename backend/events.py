@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from geo import haversine_m, point
+
+
+def sse_frame(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+class Subscription:
+    def __init__(self, center=None, radius=None, queue_size=100):
+        self.center = center
+        self.radius = radius
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def wants(self, location):
+        if self.center is None or self.radius is None:
+            return True
+        loc = point(location)
+        if loc is None:
+            return False
+        return haversine_m(self.center[0], self.center[1], loc[0], loc[1]) <= self.radius
+
+    def offer(self, frame):
+        # Never block the writer: a subscriber that falls behind loses its
+        # oldest undelivered frames rather than stalling everyone else.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+
+
+class EventHub:
+    """In-process pub/sub for pushing change events to SSE subscribers."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscriptions = set()
+
+    def subscribe(self, lat=None, lng=None, radius=None):
+        center = (lat, lng) if lat is not None and lng is not None else None
+        subscription = Subscription(center, radius, self.queue_size)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, event, data, location=None):
+        if not self.subscriptions:
+            return
+        # Encode once, fan out the same bytes to every interested subscriber
+        frame = sse_frame(event, data)
+        for subscription in self.subscriptions:
+            if subscription.wants(location):
+                subscription.offer(frame)
+
+    def incident_listener(self, change):
+        # MockCollection listener: inserts carry the full incident, updates
+        # only the fields that changed plus the names of any removed.
+        incident = change['fullDocument']
+        if change['operationType'] == 'insert':
+            data = {k: v for k, v in incident.items() if k != '_id'}
+            self.publish('incident.created', data, incident.get('location'))
+        elif change['operationType'] == 'update':
+            description = change['updateDescription']
+            data = {
+                'id': incident.get('id'),
+                **description['updatedFields'],
+                'removedFields': list(description.get('removedFields', ())),
+            }
+            self.publish('incident.updated', data, incident.get('location'))
+
+    async def stream(self, subscription, is_disconnected, keepalive=15.0):
+        try:
+            yield b": connected\n\n"
+            while not await is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,95 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def point(value):
+    # Accepts our {lat, lng} shape, GeoJSON points and legacy [lng, lat] pairs
+    if isinstance(value, dict):
+        if 'lat' in value and 'lng' in value:
+            lat, lng = value['lat'], value['lng']
+        elif value.get('type') == 'Point':
+            lng, lat = value['coordinates'][:2]
+        elif '$geometry' in value:
+            return point(value['$geometry'])
+        else:
+            return None
+    elif isinstance(value, (list, tuple)) and len(value) >= 2:
+        lng, lat = value[0], value[1]
+    else:
+        return None
+    if lat is None or lng is None:
+        return None
+    try:
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_m):
+    # Degrees spanned by a radius around a point (clamped near the poles)
+    dlat = radius_m / METERS_PER_DEGREE
+    dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_bits(precision):
+    # Bits spent on longitude and latitude; longitude takes the first bit
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def geohash_code(lat, lng, precision):
+    # Integer form of the geohash: each coordinate quantized to its share
+    # of the bits, then interleaved starting with longitude
+    lng_bits, lat_bits = geohash_bits(precision)
+    x = min(max(int((lng + 180.0) / 360.0 * (1 << lng_bits)), 0), (1 << lng_bits) - 1)
+    y = min(max(int((lat + 90.0) / 180.0 * (1 << lat_bits)), 0), (1 << lat_bits) - 1)
+    code = 0
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lng_bits -= 1
+            code = (code << 1) | ((x >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            code = (code << 1) | ((y >> lat_bits) & 1)
+    return code
+
+
+def geohash_string(code, precision):
+    return ''.join(GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def geohash(lat, lng, precision=5):
+    return geohash_string(geohash_code(lat, lng, precision), precision)
+
+
+def geohash_center(cell):
+    # (lat, lng) at the middle of a geohash cell
+    lat0, lat1, lng0, lng1 = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng0 + lng1) / 2
+                lng0, lng1 = (mid, lng1) if bit else (lng0, mid)
+            else:
+                mid = (lat0 + lat1) / 2
+                lat0, lat1 = (mid, lat1) if bit else (lat0, mid)
+            even = not even
+    return (lat0 + lat1) / 2, (lng0 + lng1) / 2
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+
+from mock_db import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class LocationIngestor:
+    """Coalesces location reports and writes them with one bulk_write.
+
+    Reports are buffered for up to ``window`` seconds; a user reporting
+    several times within the window costs a single update carrying the
+    latest position. ``window=0`` writes each submitted batch immediately.
+    """
+
+    def __init__(self, collection, window=0.25, max_pending=5000):
+        self.collection = collection
+        self.window = window
+        self.max_pending = max_pending
+        self._pending = {}
+        self._timer = None
+        self._flush_task = None
+        self.received = 0
+        self.written = 0
+
+    async def submit(self, updates):
+        # updates: iterable of (user_id, location); later entries win
+        for user_id, location in updates:
+            self._pending[user_id] = location
+            self.received += 1
+        if not self.window or len(self._pending) >= self.max_pending:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            result = await self.collection.bulk_write(
+                [UpdateOne({"id": user_id}, {"$set": {"location": location}}) for user_id, location in pending.items()],
+                ordered=False,
+            )
+            self.written += result.modified_count
+        except Exception as e:
+            logger.error(f"Error writing {len(pending)} location updates: {e}")
+
+    async def stop(self):
+        # Let a timer-driven flush finish before writing what is left
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
@@ -0,0 +1,166 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+slow_query_logger = logging.getLogger("slow_query")
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                extra = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, extra)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Metrics:
+    """Process-wide metrics rendered in the Prometheus text format.
+
+    HTTP timings come from MetricsMiddleware, admission outcomes from
+    AdmissionController, database timings from the
+    MockDatabase observer hook (observe_db), and persistence counters are
+    read from the storage engine when the metrics are scraped.
+    """
+
+    def __init__(self, slow_query_ms=None, slow_query_history=100):
+        self.requests = Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+        self.db_ops = Histogram(
+            "db_operation_duration_seconds", "Database operation latency.", ("collection", "operation"))
+        self.scanned = Counter(
+            "db_documents_scanned_total", "Documents examined by queries.", ("collection", "operation"))
+        self.returned = Counter(
+            "db_documents_returned_total", "Documents returned or modified by operations.", ("collection", "operation"))
+        self.serialization = Histogram(
+            "serialization_duration_seconds", "Time spent validating and encoding response bodies.", ("model",))
+        self.admission = Counter(
+            "admission_requests_total", "Requests by priority class and admission outcome (admitted or why shed).",
+            ("priority", "outcome"))
+        self.admission_wait = Histogram(
+            "admission_queue_wait_seconds", "Time admitted requests waited for a slot.", ("priority",))
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = deque(maxlen=slow_query_history)
+        self.collectors = []
+
+    def observe_request(self, method, route, status, seconds):
+        self.requests.observe((method, route, str(status)), seconds)
+
+    def observe_db(self, collection, operation, query, seconds, scanned, returned):
+        key = (collection, operation)
+        self.db_ops.observe(key, seconds)
+        if scanned:
+            self.scanned.inc(key, scanned)
+        if returned:
+            self.returned.inc(key, returned)
+        if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+            entry = {
+                "collection": collection,
+                "operation": operation,
+                "query": query,
+                "ms": round(seconds * 1000, 3),
+                "scanned": scanned,
+                "returned": returned,
+                "at": time.time(),
+            }
+            self.slow_queries.append(entry)
+            slow_query_logger.warning(json.dumps(entry, default=str)[:2000])
+
+    def add_collector(self, collect):
+        # collect() -> iterable of (name, type, help, value) read at scrape time
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.db_ops, self.scanned, self.returned, self.serialization,
+                       self.admission, self.admission_wait):
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, kind, help, value in collect():
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: times every HTTP request and labels it with the
+    # matched route template (so /users/{user_id} is one series, not one per id)
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.observe_request(scope["method"], route, status[0], time.perf_counter() - start)
@@ -1,144 +1,1334 @@
 import asyncio
+import bisect
+import contextvars
 from datetime import datetime
+import functools
+import heapq
+import itertools
+import math
+import operator
+import time
 import uuid
-import json
-import os
+import geo
+from persistence import PersistenceEngine
 
 DB_FILE = "db.json"
 
+_MISSING = object()
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+# Instrumentation: set while an observed operation runs so query predicates
+# can count the documents they examine
+_scan_stats = contextvars.ContextVar('scan_stats', default=None)
+
+
+class _ScanStats:
+    __slots__ = ('scanned',)
+
+    def __init__(self):
+        self.scanned = 0
+
+
+def _counting(match):
+    stats = _scan_stats.get()
+    if stats is None:
+        return match
+
+    def counted(doc):
+        stats.scanned += 1
+        return match(doc)
+    return counted
+
+
+def _result_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, UpdateResult):
+        return result.modified_count
+    if isinstance(result, DeleteResult):
+        return result.deleted_count
+    if isinstance(result, BulkWriteResult):
+        return result.inserted_count + result.modified_count
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return 1 if result else 0
+
+
+def _observed(operation, with_query=True):
+    # Reports latency and scanned/returned counts to MockDatabase.observers.
+    # Costs one attribute check when nothing is observing; nested observed
+    # calls (insert_many -> bulk_write) are reported once, by the outermost.
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            collection = getattr(self, 'collection', self)
+            observers = collection.db.observers
+            if not observers or _scan_stats.get() is not None:
+                return await method(self, *args, **kwargs)
+            stats = _ScanStats()
+            token = _scan_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                result = await method(self, *args, **kwargs)
+            finally:
+                _scan_stats.reset(token)
+            seconds = time.perf_counter() - start
+            query = None
+            if with_query:
+                query = self.query if isinstance(self, MockCursor) else (args[0] if args else kwargs.get('query'))
+            returned = _result_count(result)
+            for observer in observers:
+                observer(collection.name, operation, query, seconds, stats.scanned, returned)
+            return result
+        return wrapper
+    return decorate
+
+
+def _synced(write=False):
+    # With an engine shared by several processes, reads first apply the
+    # writes other processes committed, and writes run inside the engine's
+    # cross-process transaction. One attribute check otherwise.
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            db = getattr(self, 'collection', self).db
+            if not db.shared:
+                return await method(self, *args, **kwargs)
+            if not write:
+                db.sync()
+                return await method(self, *args, **kwargs)
+            with db.engine.transaction(db):
+                return await method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def get_path(doc, path, default=None):
+    # Resolve a dotted path such as "location.lat" against a document
+    if '.' not in path:
+        return doc.get(path, default)
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and bool(value) and all(k.startswith('$') for k in value)
+
+
+def _equals(value, cond):
+    # Like MongoDB, a scalar condition also matches arrays containing it
+    return value == cond or (type(value) is list and cond in value)
+
+
+def _in(value, arg):
+    # Membership in a $in list; an array matches if any element does
+    try:
+        if value in arg:
+            return True
+    except TypeError:
+        pass
+    if type(value) is list:
+        return any(_in(v, arg) for v in value)
+    return False
+
+
+def _comparison(op):
+    def test(value, arg):
+        if value is None:
+            return False
+        try:
+            return op(value, arg)
+        except TypeError:
+            return False
+    return test
+
+
+_OPERATORS = {
+    '$eq': _equals,
+    '$ne': lambda value, arg: not _equals(value, arg),
+    '$gt': _comparison(operator.gt),
+    '$gte': _comparison(operator.ge),
+    '$lt': _comparison(operator.lt),
+    '$lte': _comparison(operator.le),
+}
+
+
+_GEO_OPERATORS = ('$near', '$nearSphere', '$geoWithin')
+
+
+def _is_geo_condition(cond):
+    return isinstance(cond, dict) and any(op in cond for op in _GEO_OPERATORS)
+
+
+def _geo_condition(cond):
+    # Normalize $near / $geoWithin into (center, max_distance_m, min_distance_m)
+    if '$geoWithin' in cond:
+        within = cond['$geoWithin']
+        if '$centerSphere' not in within:
+            raise ValueError("Only $centerSphere is supported for $geoWithin")
+        coords, radians = within['$centerSphere']
+        center, max_d, min_d = geo.point(coords), radians * geo.EARTH_RADIUS_M, None
+    else:
+        near = cond.get('$near', cond.get('$nearSphere'))
+        center = geo.point(near)
+        max_d = cond.get('$maxDistance')
+        min_d = cond.get('$minDistance')
+        if isinstance(near, dict) and '$geometry' in near:
+            max_d = near.get('$maxDistance', max_d)
+            min_d = near.get('$minDistance', min_d)
+    if center is None:
+        raise ValueError(f"Invalid geo query point: {cond}")
+    return center, max_d, min_d
+
+
+def _compile_geo_condition(path, cond):
+    (lat, lng), max_d, min_d = _geo_condition(cond)
+
+    def test(doc):
+        loc = geo.point(get_path(doc, path))
+        if loc is None:
+            return False
+        distance = geo.haversine_m(lat, lng, loc[0], loc[1])
+        return (max_d is None or distance <= max_d) and (min_d is None or distance >= min_d)
+    return test
+
+
+def _near_distance(query):
+    # Distance function used to order $near results, nearest first
+    for path, cond in (query or {}).items():
+        if isinstance(cond, dict) and ('$near' in cond or '$nearSphere' in cond):
+            (lat, lng), _, _ = _geo_condition(cond)
+            return lambda doc: geo.haversine_m(lat, lng, *geo.point(get_path(doc, path)))
+    return None
+
+
+def _compile_condition(path, cond):
+    if path in ('$or', '$and'):
+        clauses = [compile_query(clause) for clause in cond]
+        if path == '$or':
+            return lambda doc: any(clause(doc) for clause in clauses)
+        return lambda doc: all(clause(doc) for clause in clauses)
+    if not _is_operator_dict(cond):
+        if '.' not in path:
+            return lambda doc: _equals(doc.get(path), cond)
+        return lambda doc: _equals(get_path(doc, path), cond)
+    if _is_geo_condition(cond):
+        return _compile_geo_condition(path, cond)
+
+    tests = []
+    for op, arg in cond.items():
+        if op == '$exists':
+            tests.append(lambda doc, arg=arg: (get_path(doc, path, _MISSING) is not _MISSING) == bool(arg))
+        elif op in ('$in', '$nin'):
+            try:
+                values = frozenset(arg)
+            except TypeError:
+                values = list(arg)
+            if op == '$in':
+                tests.append(lambda doc, values=values: _in(get_path(doc, path), values))
+            else:
+                tests.append(lambda doc, values=values: not _in(get_path(doc, path), values))
+        elif op in _OPERATORS:
+            test = _OPERATORS[op]
+            tests.append(lambda doc, test=test, arg=arg: test(get_path(doc, path), arg))
+        else:
+            raise ValueError(f"Unsupported query operator: {op}")
+    if len(tests) == 1:
+        return tests[0]
+    return lambda doc: all(test(doc) for test in tests)
+
+
+def compile_query(query):
+    # Turn a query dict into a single predicate once, instead of
+    # re-interpreting the query for every document scanned.
+    if not query:
+        return lambda doc: True
+    tests = [_compile_condition(path, cond) for path, cond in query.items()]
+    if len(tests) == 1:
+        return tests[0]
+    return lambda doc: all(test(doc) for test in tests)
+
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _drop_path(doc, path):
+    # Remove a (possibly dotted) path from a shallow copy, copying the
+    # sub-documents along the way so the stored document is left untouched
+    parts = path.split('.')
+    for part in parts[:-1]:
+        child = doc.get(part)
+        if not isinstance(child, dict):
+            return
+        doc[part] = child = dict(child)
+        doc = child
+    doc.pop(parts[-1], None)
+
+
+def compile_projection(projection):
+    # Returns a function building the projected copy of a document, or None
+    # when the projection keeps every field
+    if not projection:
+        return None
+    include_id = bool(projection.get('_id', 1))
+    spec = {k: v for k, v in projection.items() if k != '_id'}
+    if spec and any(spec.values()):
+        if not all(spec.values()):
+            raise ValueError("Projection cannot mix inclusion and exclusion")
+        paths = list(spec) + (['_id'] if include_id else [])
+
+        def project(doc):
+            out = {}
+            for path in paths:
+                value = get_path(doc, path, _MISSING)
+                if value is not _MISSING:
+                    _set_path(out, path, value)
+            return out
+        return project
+
+    excluded = list(spec) + ([] if include_id else ['_id'])
+    if not excluded:
+        return None
+
+    def project(doc):
+        out = dict(doc)
+        for path in excluded:
+            _drop_path(out, path)
+        return out
+    return project
+
+
+UPDATE_OPERATORS = ('$set', '$unset', '$inc', '$push', '$addToSet', '$pull')
+
+
+def _writable_parent(doc, parts, create):
+    # Walk to the sub-document holding the last path component, copying each
+    # one on the way so the stored document is never modified in place
+    for part in parts[:-1]:
+        child = doc.get(part)
+        if child is None:
+            if not create:
+                return None
+            child = {}
+        elif isinstance(child, dict):
+            child = dict(child)
+        else:
+            raise ValueError(f"Cannot update inside non-document field {part!r}")
+        doc[part] = child
+        doc = child
+    return doc
+
+
+def _array(value, path, op):
+    if value is _MISSING or value is None:
+        return []
+    if type(value) is not list:
+        raise ValueError(f"{op} requires an array at {path!r}")
+    return value
+
+
+def _each(arg):
+    if isinstance(arg, dict) and '$each' in arg:
+        return list(arg['$each'])
+    return [arg]
+
+
+def _pull_matcher(cond):
+    if _is_operator_dict(cond):
+        match = _compile_condition('value', cond)
+        return lambda item: match({'value': item})
+    if isinstance(cond, dict):
+        match = compile_query(cond)
+        return lambda item: isinstance(item, dict) and match(item)
+    return lambda item: item == cond
+
+
+def apply_update(doc, update):
+    """Apply a MongoDB-style update to a copy of ``doc``.
+
+    Returns ``(new_doc, updated_fields, removed_fields)`` keyed by the
+    (possibly dotted) paths written, or None when nothing would change.
+    """
+    unknown = [op for op in update if op not in UPDATE_OPERATORS]
+    if unknown:
+        raise ValueError(f"Unsupported update operator: {unknown[0]}")
+    new = dict(doc)
+    updated, removed = {}, []
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            if path.split('.')[0] == '_id':
+                continue
+            parts = path.split('.')
+            parent = _writable_parent(new, parts, create=op not in ('$unset', '$pull'))
+            if parent is None:
+                continue
+            key = parts[-1]
+            current = parent.get(key, _MISSING)
+            if op == '$unset':
+                if current is not _MISSING:
+                    del parent[key]
+                    removed.append(path)
+                continue
+            if op == '$set':
+                value = arg
+            elif op == '$inc':
+                base = 0 if current is _MISSING else current
+                if not isinstance(base, (int, float)) or not isinstance(arg, (int, float)):
+                    raise ValueError(f"$inc requires numbers at {path!r}")
+                value = base + arg
+            elif op == '$push':
+                value = _array(current, path, op) + _each(arg)
+            elif op == '$addToSet':
+                value = list(_array(current, path, op))
+                for item in _each(arg):
+                    if item not in value:
+                        value.append(item)
+            else:
+                matches = _pull_matcher(arg)
+                value = [item for item in _array(current, path, op) if not matches(item)]
+            if current is not _MISSING and type(current) is type(value) and current == value:
+                continue
+            parent[key] = value
+            updated[path] = value
+    if not updated and not removed:
+        return None
+    return new, updated, removed
+
+
+def sort_value(value):
+    # Orders mixed types the way MongoDB does: null < numbers < strings < other
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, str(value))
+
+
+class _Descending:
+    # Inverts ordering for one component of a compound sort key
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _compound_sort_key(sort_keys):
+    def key(doc):
+        return tuple(
+            sort_value(get_path(doc, field)) if order != -1 else _Descending(sort_value(get_path(doc, field)))
+            for field, order in sort_keys
+        )
+    return key
+
+
+def _normalize_keys(keys):
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(k, 1) if isinstance(k, str) else tuple(k) for k in keys]
+
+
+class HashIndex:
+    # Attributes holding the index contents, as opposed to its definition
+    STATE = ('buckets',)
+
+    def __init__(self, name, fields, unique=False):
+        self.name = name
+        self.fields = fields
+        self.unique = unique
+        # key -> {_id: None}; a dict keeps bucket order deterministic
+        self.buckets = {}
+
+    def spec(self):
+        return (type(self).__name__, tuple(self.fields), self.unique)
+
+    def state(self):
+        return {attr: getattr(self, attr) for attr in self.STATE}
+
+    def defer(self, load):
+        # Drop the contents until they are first used; load(self) then
+        # installs them
+        for attr in self.STATE:
+            self.__dict__.pop(attr, None)
+        self._load = load
+
+    def __getattr__(self, name):
+        # Only reached for missing attributes, i.e. deferred contents
+        load = self.__dict__.pop('_load', None)
+        if load is None:
+            raise AttributeError(name)
+        load(self)
+        return getattr(self, name)
+
+    def key(self, doc):
+        if len(self.fields) == 1:
+            return get_path(doc, self.fields[0])
+        return tuple(get_path(doc, f) for f in self.fields)
+
+    def clear(self):
+        self.__dict__.pop('_load', None)
+        self.buckets = {}
+
+    def rebuild(self, docs):
+        self.clear()
+        for doc in docs:
+            self.add(doc)
+
+    def keys(self, doc):
+        # Multikey: an array value is indexed under each of its elements
+        key = self.key(doc)
+        if isinstance(key, list):
+            return key
+        return [key]
+
+    def add(self, doc):
+        for key in self.keys(doc):
+            try:
+                bucket = self.buckets.setdefault(key, {})
+            except TypeError:
+                # Unhashable values (sub-documents) never match an equality
+                # lookup served by this index, so they are skipped.
+                continue
+            bucket[doc['_id']] = None
+
+    def remove(self, doc):
+        for key in self.keys(doc):
+            try:
+                bucket = self.buckets.get(key)
+            except TypeError:
+                continue
+            if bucket is not None:
+                bucket.pop(doc['_id'], None)
+                if not bucket:
+                    del self.buckets[key]
+
+    def conflicts(self, doc):
+        if not self.unique:
+            return False
+        for key in self.keys(doc):
+            if key is None or (isinstance(key, tuple) and all(k is None for k in key)):
+                continue
+            try:
+                bucket = self.buckets.get(key)
+            except TypeError:
+                continue
+            if bucket and any(_id != doc['_id'] for _id in bucket):
+                return True
+        return False
+
+    def covers(self, paths):
+        for field in self.fields:
+            for path in paths:
+                if path == field or field.startswith(path + '.') or path.startswith(field + '.'):
+                    return True
+        return False
+
+    def lookup(self, query):
+        # Returns the matching _ids when every indexed field is bound by
+        # equality in the query, otherwise None (index not usable). A single
+        # field index also serves $in as a union of buckets (a multi-get).
+        values = []
+        for field in self.fields:
+            cond = query.get(field, _MISSING)
+            if cond is _MISSING:
+                return None
+            if _is_operator_dict(cond):
+                if list(cond) == ['$in'] and len(self.fields) == 1:
+                    ids = {}
+                    try:
+                        for value in cond['$in']:
+                            ids.update(self.buckets.get(value, {}))
+                    except TypeError:
+                        return None
+                    return ids
+                if list(cond) != ['$eq']:
+                    return None
+                cond = cond['$eq']
+            values.append(cond)
+        key = values[0] if len(values) == 1 else tuple(values)
+        try:
+            return self.buckets.get(key, {})
+        except TypeError:
+            return None
+
+    def info(self):
+        info = {'key': [(f, 1) for f in self.fields]}
+        if self.unique:
+            info['unique'] = True
+        return info
+
+
+class GeoIndex(HashIndex):
+    # Fixed-size lat/lng grid; a radius query only visits the cells that
+    # overlap its bounding box and the matcher does the exact distance check.
+    def __init__(self, name, field, cell_deg=0.01):
+        super().__init__(name, [field])
+        self.cell_deg = cell_deg
+
+    def spec(self):
+        return super().spec() + (self.cell_deg,)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def key(self, doc):
+        loc = geo.point(get_path(doc, self.fields[0]))
+        if loc is None:
+            return None
+        return self._cell(*loc)
+
+    def add(self, doc):
+        key = self.key(doc)
+        if key is not None:
+            self.buckets.setdefault(key, {})[doc['_id']] = None
+
+    def lookup(self, query):
+        cond = query.get(self.fields[0])
+        if not _is_geo_condition(cond):
+            return None
+        (lat, lng), max_d, _ = _geo_condition(cond)
+        if max_d is None:
+            return None
+        lat0, lng0, lat1, lng1 = geo.bounding_box(lat, lng, max_d)
+        (r0, c0), (r1, c1) = self._cell(lat0, lng0), self._cell(lat1, lng1)
+        ids = {}
+        if (r1 - r0 + 1) * (c1 - c0 + 1) <= len(self.buckets):
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    bucket = self.buckets.get((row, col))
+                    if bucket:
+                        ids.update(bucket)
+        else:
+            for (row, col), bucket in self.buckets.items():
+                if r0 <= row <= r1 and c0 <= col <= c1:
+                    ids.update(bucket)
+        return ids
+
+    def info(self):
+        return {'key': [(self.fields[0], '2dsphere')]}
+
+
+class SortedIndex(HashIndex):
+    # Single-field ordered index: equality through the hash buckets plus a
+    # sorted list of (sort key, _id) for ordered scans, ranges and ranks
+    _RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte')
+    STATE = ('buckets', 'entries')
+
+    def __init__(self, name, field, unique=False):
+        super().__init__(name, [field], unique=unique)
+        self.entries = []
+
+    def clear(self):
+        super().clear()
+        self.entries = []
+
+    def rebuild(self, docs):
+        self.clear()
+        for doc in docs:
+            HashIndex.add(self, doc)
+            self.entries.append((sort_value(self.key(doc)), doc['_id']))
+        self.entries.sort()
+
+    def add(self, doc):
+        super().add(doc)
+        bisect.insort(self.entries, (sort_value(self.key(doc)), doc['_id']))
+
+    def remove(self, doc):
+        super().remove(doc)
+        entry = (sort_value(self.key(doc)), doc['_id'])
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def ordered_ids(self, descending=False):
+        entries = reversed(self.entries) if descending else self.entries
+        return (_id for _, _id in entries)
+
+    def bounds(self, cond):
+        # [lo, hi) positions of the entries satisfying a range condition,
+        # or None if the condition is not a pure range. Bounds never cross
+        # a type bracket, matching the comparison operators in the matcher.
+        if not _is_operator_dict(cond) or not all(op in self._RANGE_OPERATORS for op in cond):
+            return None
+        lo, hi = 0, len(self.entries)
+        key = operator.itemgetter(0)
+        for op, arg in cond.items():
+            if arg is None:
+                return None
+            value = sort_value(arg)
+            lo = max(lo, bisect.bisect_left(self.entries, (value[0],), key=key))
+            hi = min(hi, bisect.bisect_left(self.entries, (value[0] + 1,), key=key))
+            if op == '$gt':
+                lo = max(lo, bisect.bisect_right(self.entries, value, key=key))
+            elif op == '$gte':
+                lo = max(lo, bisect.bisect_left(self.entries, value, key=key))
+            elif op == '$lt':
+                hi = min(hi, bisect.bisect_left(self.entries, value, key=key))
+            else:
+                hi = min(hi, bisect.bisect_right(self.entries, value, key=key))
+        return lo, max(lo, hi)
+
+    def lookup(self, query):
+        cond = query.get(self.fields[0], _MISSING)
+        if cond is not _MISSING:
+            span = self.bounds(cond)
+            if span is not None:
+                return dict.fromkeys(_id for _, _id in self.entries[span[0]:span[1]])
+        return super().lookup(query)
+
+    def info(self):
+        return {'key': [(self.fields[0], 1)], **({'unique': True} if self.unique else {})}
+
+
 class MockCursor:
-    def __init__(self, data, sort_key=None, sort_order=1, limit_n=None):
-        self.data = data
-        self.sort_key = sort_key
-        self.sort_order = sort_order
-        self.limit_n = limit_n
+    # Lazily executed: nothing is evaluated until the cursor is consumed, so
+    # sort/skip/limit are pushed down into the collection's query planner
+    def __init__(self, collection, query=None, projection=None):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = compile_projection(projection)
+        self.sort_keys = []
+        self.skip_n = 0
+        self.limit_n = None
 
     def sort(self, key, order=1):
-        self.sort_key = key
-        self.sort_order = order
+        # sort("points", -1) or sort([("timestamp", -1), ("id", -1)])
+        self.sort_keys = [(key, order)] if isinstance(key, str) else list(key)
+        return self
+
+    def skip(self, n):
+        self.skip_n = n
         return self
 
     def limit(self, n):
         self.limit_n = n
         return self
 
+    def _results(self, stable=False):
+        return self.collection._iter(self.query, self.sort_keys, self.skip_n, self.limit_n, stable)
+
+    def __aiter__(self):
+        return self._stream()
+
+    async def _stream(self):
+        # Hand control back to the event loop periodically on long scans
+        self.collection.db.sync()
+        for i, doc in enumerate(self._results(stable=True), 1):
+            yield self.projection(doc) if self.projection else doc
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+
+    @_observed('find')
+    @_synced()
     async def to_list(self, length):
-        result = list(self.data)  # Make a copy
-        if self.sort_key:
-            result.sort(key=lambda x: x.get(self.sort_key, 0), reverse=(self.sort_order == -1))
-        
-        if self.limit_n:
-            result = result[:self.limit_n]
-            
+        results = self._results()
         if length:
-            result = result[:length]
-            
-        return result
+            results = itertools.islice(results, length)
+        if self.projection:
+            return [self.projection(doc) for doc in results]
+        return list(results)
+
+class UpdateResult:
+    def __init__(self, matched_count, modified_count):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+class BulkWriteResult:
+    def __init__(self, inserted_count=0, matched_count=0, modified_count=0):
+        self.inserted_count = inserted_count
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+
+# Bulk operations, named after their pymongo counterparts
+class InsertOne:
+    def __init__(self, document):
+        self.document = document
+
+class UpdateOne:
+    def __init__(self, filter, update):
+        self.filter = filter
+        self.update = update
+
+class UpdateMany(UpdateOne):
+    pass
+
+def _stable_values(docs):
+    # Iterate a snapshot of the _ids, yielding each document's version at the
+    # time it is reached; a lazily loaded collection decodes as it goes
+    if isinstance(docs, dict):
+        return filter(None, map(docs.get, list(docs)))
+    return docs.stable_values()
+
 
 class MockCollection:
     def __init__(self, name, db):
         self.name = name
         self.db = db
-        self.data = []
+        # Primary storage keyed by _id; doubles as the _id index
+        self._docs = {}
+        self.indexes = {}
+        self.listeners = []
+        self._batch = None
+        self._affected_cache = {}
+        # Bumped on every write; lets readers cheaply detect "nothing changed"
+        self.version = 0
 
-    async def insert_one(self, document):
-        if '_id' not in document:
-            document['_id'] = str(uuid.uuid4())
-        self.data.append(document)
-        self.db.save()
-        return True
+    @property
+    def data(self):
+        return list(self._docs.values())
 
-    async def insert_many(self, documents):
+    @data.setter
+    def data(self, documents):
+        self._docs = {}
+        self.version += 1
         for doc in documents:
             if '_id' not in doc:
                 doc['_id'] = str(uuid.uuid4())
-            self.data.append(doc)
-        self.db.save()
+            self._docs[doc['_id']] = doc
+        for index in self.indexes.values():
+            index.rebuild(self._docs.values())
+
+    def _attach(self, docs, persisted=None, dirty=()):
+        # Adopt a loaded {_id: doc} mapping. Indexes saved with its snapshot
+        # are loaded on first use and patched for the documents the log
+        # replay touched; the others are rebuilt now.
+        self._docs = docs
+        self.version += 1
+        persisted = persisted or {}
+        for name, index in self.indexes.items():
+            saved = persisted.get(name)
+            if saved is not None and saved.spec == index.spec() and hasattr(docs, 'snapshot_doc'):
+                index.defer(functools.partial(self._load_index, saved, dirty))
+            else:
+                index.rebuild(docs.values())
+
+    def _load_index(self, saved, dirty, index):
+        try:
+            index.__dict__.update(saved.load())
+            for _id in dirty:
+                old = self._docs.snapshot_doc(_id)
+                if old is not None:
+                    index.remove(old)
+                doc = self._docs.get(_id)
+                if doc is not None:
+                    index.add(doc)
+        except Exception as e:
+            print(f"Error loading index {self.name}.{index.name}: {e}")
+            index.rebuild(self._docs.values())
+
+    def ensure_index(self, keys, unique=False, name=None):
+        # "field" or [(field, "hashed")] builds a hash index; an explicit
+        # [(field, 1)] / [(field, -1)] builds an ordered (sorted) index
+        ordered = not isinstance(keys, str)
+        keys = _normalize_keys(keys)
+        fields = [k for k, _ in keys]
+        name = name or '_'.join(f"{k}_{d}" for k, d in keys)
+        if name not in self.indexes:
+            if any(d in ('2dsphere', '2d') for _, d in keys):
+                index = GeoIndex(name, fields[0])
+            elif ordered and len(keys) == 1 and keys[0][1] in (1, -1):
+                index = SortedIndex(name, fields[0], unique=unique)
+            else:
+                index = HashIndex(name, fields, unique=unique)
+            for doc in self._docs.values():
+                if index.conflicts(doc):
+                    raise DuplicateKeyError(f"{self.name}: duplicate key for index {name}")
+                index.add(doc)
+            self.indexes[name] = index
+            self._affected_cache.clear()
+        return name
+
+    async def create_index(self, keys, unique=False, name=None, **kwargs):
+        return self.ensure_index(keys, unique=unique, name=name)
+
+    async def drop_index(self, name):
+        self.indexes.pop(name, None)
+        self._affected_cache.clear()
+
+    async def index_information(self):
+        info = {'_id_': {'key': [('_id', 1)]}}
+        for name, index in self.indexes.items():
+            info[name] = index.info()
+        return info
+
+    def add_listener(self, callback):
+        # callback(event) runs after every write with a change-stream style
+        # event: operationType, documentKey, fullDocument, updateDescription
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _notify(self, event):
+        # Every write funnels through here
+        self.version += 1
+        for callback in self.listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error in {self.name} listener: {e}")
+
+    def _plan(self, query):
+        # Query planner: _ids from the most selective index usable for the
+        # query, or None when it needs a full scan
+        if not query:
+            return None
+        _id = query.get('_id', _MISSING)
+        if _id is not _MISSING and not isinstance(_id, dict):
+            try:
+                return {_id: None} if _id in self._docs else {}
+            except TypeError:
+                return {}
+        if isinstance(_id, dict) and list(_id) == ['$in']:
+            return {i: None for i in _id['$in'] if i in self._docs}
+        best = None
+        for index in self.indexes.values():
+            ids = index.lookup(query)
+            if ids is not None and (best is None or len(ids) < len(best)):
+                best = ids
+        return best
+
+    def _candidates(self, query):
+        ids = self._plan(query)
+        if ids is None:
+            return self._docs.values()
+        return [self._docs[_id] for _id in ids]
+
+    def _sorted_index(self, field):
+        for index in self.indexes.values():
+            if isinstance(index, SortedIndex) and index.fields[0] == field:
+                return index
+        return None
+
+    def _iter(self, query, sort_keys=(), skip=0, limit=None, stable=False):
+        # Iterator over the matching documents. Unsorted scans stream and stop
+        # early; sort+limit keeps only a bounded heap of skip+limit documents.
+        # `stable` iterates a snapshot of references so the consumer can yield
+        # to the event loop while writes happen.
+        match = _counting(compile_query(query))
+        stop = skip + limit if limit else None
+        ids = self._plan(query)
+
+        # Walk an ordered index when it provides the requested order and no
+        # other index narrows the query
+        if len(sort_keys) == 1 and ids is None:
+            index = self._sorted_index(sort_keys[0][0])
+            if index is not None:
+                ordered = index.ordered_ids(descending=sort_keys[0][1] == -1)
+                if stable:
+                    # Writes reorder index.entries under a live iterator
+                    ordered = list(ordered)
+                docs = map(self._docs.get, ordered)
+                matches = (doc for doc in docs if doc is not None and match(doc))
+                return itertools.islice(matches, skip, stop)
+
+        if ids is not None:
+            docs = [self._docs[_id] for _id in ids]
+        elif stable:
+            docs = _stable_values(self._docs)
+        else:
+            docs = self._docs.values()
+        matches = filter(match, docs)
+
+        reverse = False
+        if not sort_keys:
+            key = _near_distance(query)
+            if key is None:
+                return itertools.islice(matches, skip, stop)
+        elif len(sort_keys) == 1:
+            (field, order), = sort_keys
+            key = lambda doc: sort_value(get_path(doc, field))
+            reverse = order == -1
+        elif len({order for _, order in sort_keys}) == 1:
+            fields = [field for field, _ in sort_keys]
+            key = lambda doc: tuple(sort_value(get_path(doc, field)) for field in fields)
+            reverse = sort_keys[0][1] == -1
+        else:
+            key = _compound_sort_key(sort_keys)
+
+        if stop is not None:
+            ordered = (heapq.nlargest if reverse else heapq.nsmallest)(stop, matches, key=key)
+        else:
+            ordered = sorted(matches, key=key, reverse=reverse)
+        return iter(ordered[skip:])
+
+    def _affected(self, paths):
+        # Indexes touched by a write to these paths, memoized per path set
+        # since the same few update shapes repeat on hot paths
+        if paths is None:
+            return list(self.indexes.values())
+        key = tuple(paths)
+        indexes = self._affected_cache.get(key)
+        if indexes is None:
+            if len(self._affected_cache) > 1024:
+                self._affected_cache.clear()
+            indexes = self._affected_cache[key] = [i for i in self.indexes.values() if i.covers(paths)]
+        return indexes
+
+    def _index(self, doc, paths=None):
+        for index in self._affected(paths):
+            index.add(doc)
+
+    def _unindex(self, doc, paths=None):
+        for index in self._affected(paths):
+            index.remove(doc)
+
+    def _check_unique(self, doc, paths=None):
+        for index in self._affected(paths):
+            if index.conflicts(doc):
+                raise DuplicateKeyError(f"{self.name}: duplicate key for index {index.name}")
+
+    def _write_op(self, op):
+        # Inside bulk_write the log records are collected and flushed together
+        if self._batch is not None:
+            self._batch.append(op)
+        else:
+            self.db.write_op(self.name, op)
+
+    def _insert(self, document):
+        if '_id' not in document:
+            document['_id'] = str(uuid.uuid4())
+        if document['_id'] in self._docs:
+            raise DuplicateKeyError(f"{self.name}: duplicate _id {document['_id']}")
+        self._check_unique(document)
+        self._docs[document['_id']] = document
+        self._index(document)
+
+    @_observed('insert_one', with_query=False)
+    @_synced(write=True)
+    async def insert_one(self, document):
+        self._insert(document)
+        self._write_op({'op': 'i', 'doc': document})
+        self._notify({'operationType': 'insert', 'documentKey': {'_id': document['_id']}, 'fullDocument': document})
         return True
 
-    async def find_one(self, query, projection=None):
-        for doc in self.data:
-            match = True
-            for k, v in query.items():
-                if doc.get(k) != v:
-                    match = False
-                    break
-            if match:
+    @_observed('insert_many', with_query=False)
+    @_synced(write=True)
+    async def insert_many(self, documents):
+        return await self.bulk_write([InsertOne(doc) for doc in documents])
+
+    def _find_one(self, query):
+        match = _counting(compile_query(query))
+        for doc in self._candidates(query):
+            if match(doc):
                 return doc
         return None
 
-    def find(self, query, projection=None):
-        results = []
-        for doc in self.data:
-            match = True
-            for k, v in query.items():
-                if doc.get(k) != v:
-                    match = False
-                    break
-            if match:
-                results.append(doc)
-        return MockCursor(results)
+    def _matching(self, query, limit=None):
+        # Materialized because updating a document re-indexes it
+        match = _counting(compile_query(query))
+        return list(itertools.islice((doc for doc in self._candidates(query) if match(doc)), limit))
+
+    @_observed('find_one')
+    @_synced()
+    async def find_one(self, query, projection=None):
+        doc = self._find_one(query)
+        project = compile_projection(projection)
+        if doc is not None and project:
+            return project(doc)
+        return doc
+
+    def find(self, query=None, projection=None):
+        return MockCursor(self, query, projection)
+
+    def _apply_update(self, doc, update):
+        # No awaits between reading and replacing the document, so every
+        # update is atomic per document under asyncio. The new version is
+        # built as a copy and swapped in, leaving earlier reads untouched.
+        result = apply_update(doc, update)
+        if result is None:
+            return None
+        new, updated, removed = result
+        paths = list(updated) + removed
+        self._unindex(doc, paths)
+        try:
+            self._check_unique(new, paths)
+        except DuplicateKeyError:
+            self._index(doc, paths)
+            raise
+        self._docs[doc['_id']] = new
+        self._index(new, paths)
+
+        # The log stores whole top-level fields so replaying it is idempotent
+        fields = {path.split('.')[0] for path in paths}
+        op = {'op': 'u', '_id': new['_id'], 'set': {f: new[f] for f in fields if f in new}}
+        unset = [f for f in fields if f not in new]
+        if unset:
+            op['unset'] = unset
+        self._write_op(op)
+        self._notify({
+            'operationType': 'update',
+            'documentKey': {'_id': new['_id']},
+            'fullDocument': new,
+            'updateDescription': {'updatedFields': updated, 'removedFields': removed},
+        })
+        return new
 
+    @_observed('update_one')
+    @_synced(write=True)
     async def update_one(self, query, update):
-        doc = await self.find_one(query)
-        if doc:
-            if "$set" in update:
-                for k, v in update["$set"].items():
-                    doc[k] = v
-            self.db.save()
-            class Result:
-                modified_count = 1
-            return Result()
-        class Result:
-            modified_count = 0
-        return Result()
+        doc = self._find_one(query)
+        if doc is None:
+            return UpdateResult(0, 0)
+        return UpdateResult(1, 0 if self._apply_update(doc, update) is None else 1)
+
+    @_observed('find_one_and_update')
+    @_synced(write=True)
+    async def find_one_and_update(self, query, update, projection=None, return_document=False):
+        # return_document=True (pymongo's ReturnDocument.AFTER) returns the
+        # updated document instead of the original
+        doc = self._find_one(query)
+        if doc is None:
+            return None
+        new = self._apply_update(doc, update)
+        result = new if return_document and new is not None else doc
+        project = compile_projection(projection)
+        return project(result) if project else result
+
+    @_observed('update_many')
+    @_synced(write=True)
+    async def update_many(self, query, update):
+        docs = self._matching(query)
+        modified = 0
+        self._batch = []
+        try:
+            for doc in docs:
+                if self._apply_update(doc, update) is not None:
+                    modified += 1
+        finally:
+            batch, self._batch = self._batch, None
+            self.db.write_ops(self.name, batch)
+        return UpdateResult(len(docs), modified)
+
+    @_observed('bulk_write', with_query=False)
+    @_synced(write=True)
+    async def bulk_write(self, requests, ordered=True):
+        """Apply InsertOne/UpdateOne/UpdateMany operations in one go.
+
+        Runs without yielding to the event loop and hands every log record
+        to the persistence engine as a single batch. With ordered=False a
+        failing operation is skipped and the rest are still applied.
+        """
+        result = BulkWriteResult()
+        errors = []
+        self._batch = []
+        try:
+            for request in requests:
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(request.document)
+                        self._write_op({'op': 'i', 'doc': request.document})
+                        self._notify({'operationType': 'insert', 'documentKey': {'_id': request.document['_id']}, 'fullDocument': request.document})
+                        result.inserted_count += 1
+                        continue
+                    docs = self._matching(request.filter, None if isinstance(request, UpdateMany) else 1)
+                    for doc in docs:
+                        if self._apply_update(doc, request.update) is not None:
+                            result.modified_count += 1
+                        result.matched_count += 1
+                except (DuplicateKeyError, ValueError) as e:
+                    if ordered:
+                        raise
+                    errors.append(e)
+        finally:
+            batch, self._batch = self._batch, None
+            self.db.write_ops(self.name, batch)
+        for e in errors:
+            print(f"Error in bulk write on {self.name}: {e}")
+        return result
+
+    def _replay(self, op):
+        # Apply a log op committed by another process sharing the database:
+        # indexes and listeners are updated as for a local write, but
+        # nothing is logged again
+        kind = op['op']
+        if kind == 'i':
+            doc = op['doc']
+            old = self._docs.get(doc['_id'])
+            if old is not None:
+                self._unindex(old)
+            self._docs[doc['_id']] = doc
+            self._index(doc)
+            self._notify({'operationType': 'insert', 'documentKey': {'_id': doc['_id']}, 'fullDocument': doc})
+        elif kind == 'u':
+            doc = self._docs.get(op['_id'])
+            if doc is None:
+                return
+            unset = op.get('unset', [])
+            paths = list(op['set']) + unset
+            new = {**doc, **op['set']}
+            for key in unset:
+                new.pop(key, None)
+            self._unindex(doc, paths)
+            self._docs[op['_id']] = new
+            self._index(new, paths)
+            self._notify({
+                'operationType': 'update',
+                'documentKey': {'_id': op['_id']},
+                'fullDocument': new,
+                'updateDescription': {'updatedFields': op['set'], 'removedFields': unset},
+            })
+        elif kind == 'd':
+            doc = self._docs.get(op['_id'])
+            if doc is None:
+                return
+            self._unindex(doc)
+            del self._docs[op['_id']]
+            self._notify({'operationType': 'delete', 'documentKey': {'_id': op['_id']}, 'fullDocument': doc})
+
+    def _delete(self, doc):
+        self._unindex(doc)
+        del self._docs[doc['_id']]
+        self._write_op({'op': 'd', '_id': doc['_id']})
+        self._notify({'operationType': 'delete', 'documentKey': {'_id': doc['_id']}, 'fullDocument': doc})
+
+    @_observed('delete_one')
+    @_synced(write=True)
+    async def delete_one(self, query):
+        docs = self._matching(query, 1)
+        for doc in docs:
+            self._delete(doc)
+        return DeleteResult(len(docs))
 
+    @_observed('delete_many')
+    @_synced(write=True)
+    async def delete_many(self, query):
+        docs = self._matching(query)
+        self._batch = []
+        try:
+            for doc in docs:
+                self._delete(doc)
+        finally:
+            batch, self._batch = self._batch, None
+            self.db.write_ops(self.name, batch)
+        return DeleteResult(len(docs))
+
+    @_observed('count_documents')
+    @_synced()
     async def count_documents(self, query):
         if not query:
-            return len(self.data)
-        count = 0
-        for doc in self.data:
-            match = True
-            for k, v in query.items():
-                if doc.get(k) != v:
-                    match = False
-                    break
-            if match:
-                count += 1
-        return count
+            return len(self._docs)
+        if len(query) == 1:
+            # A lone range condition on an ordered index counts in O(log n)
+            (field, cond), = query.items()
+            index = self._sorted_index(field)
+            span = index.bounds(cond) if index is not None else None
+            if span is not None:
+                return span[1] - span[0]
+        match = _counting(compile_query(query))
+        return sum(1 for doc in self._candidates(query) if match(doc))
+
+# (collection, keys) of the indexes the app relies on. MockDatabase builds
+# them up front; storage.create_indexes() creates them on other backends.
+INDEXES = [
+    ('users', 'id'),
+    ('incidents', 'id'),
+    ('status_checks', 'id'),
+    ('notifications', 'id'),
+    ('checkins', 'id'),
+    ('users', 'email'),
+    ('users', [('points', -1)]),
+    ('users', [('location', '2dsphere')]),
+    ('incidents', [('location', '2dsphere')]),
+    ('incidents', 'status'),
+    ('incidents', [('timestamp', -1)]),
+    ('incidents', 'victimId'),
+    ('incidents', 'respondingHelpers'),
+    ('notifications', 'status'),
+    ('checkins', 'status'),
+]
 
 class MockDatabase:
-    def __init__(self):
+    def __init__(self, engine=None):
         self.users = MockCollection('users', self)
         self.incidents = MockCollection('incidents', self)
         self.status_checks = MockCollection('status_checks', self)
+        self.notifications = MockCollection('notifications', self)
+        self.checkins = MockCollection('checkins', self)
         self.collections = {
             'users': self.users,
             'incidents': self.incidents,
-            'status_checks': self.status_checks
+            'status_checks': self.status_checks,
+            'notifications': self.notifications,
+            'checkins': self.checkins,
         }
+        for name, keys in INDEXES:
+            self.collections[name].ensure_index(keys)
+        # Callables (collection, operation, query, seconds, scanned, returned)
+        # invoked after every collection operation
+        self.observers = []
+        self.engine = engine or PersistenceEngine.from_env(DB_FILE)
+        # Other processes write to the same engine (see SQLiteEngine)
+        self.shared = self.engine.shared
         self.load()
 
     def load(self):
-        if os.path.exists(DB_FILE):
-            try:
-                with open(DB_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.users.data = data.get('users', [])
-                    self.incidents.data = data.get('incidents', [])
-                    self.status_checks.data = data.get('status_checks', [])
-            except Exception as e:
-                print(f"Error loading DB: {e}")
+        # Snapshot plus replay of the operation log written since it
+        try:
+            self.attach(self.engine.load())
+        except Exception as e:
+            print(f"Error loading DB: {e}")
+
+    def attach(self, data):
+        for name, docs in data.items():
+            collection = self.collections.get(name)
+            if collection is not None:
+                persisted = self.engine.persisted_indexes(name, list(collection.indexes))
+                collection._attach(docs, persisted, self.engine.dirty.get(name, ()))
+
+    def sync(self):
+        if self.shared:
+            self.engine.sync(self)
+
+    def replay(self, collection, op):
+        collection = self.collections.get(collection)
+        if collection is not None:
+            collection._replay(op)
+
+    def write_op(self, collection, op):
+        try:
+            self.engine.append(collection, op)
+        except Exception as e:
+            print(f"Error saving DB: {e}")
+
+    def write_ops(self, collection, ops):
+        if not ops:
+            return
+        try:
+            self.engine.append_many(collection, ops)
+        except Exception as e:
+            print(f"Error saving DB: {e}")
 
     def save(self):
-        data = {
-            'users': self.users.data,
-            'incidents': self.incidents.data,
-            'status_checks': self.status_checks.data
-        }
+        # Checkpoint: flush the log and fold it into a fresh snapshot
         try:
-            with open(DB_FILE, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
+            self.engine.compact()
         except Exception as e:
             print(f"Error saving DB: {e}")
 
@@ -149,12 +1339,21 @@ class MockDatabase:
         return self.collections.get(name)
 
     def close(self):
-        self.save()
+        try:
+            self.engine.close()
+            # Save the indexes against the snapshot just written so the next
+            # start does not rebuild them
+            for name, collection in self.collections.items():
+                self.engine.write_indexes(name, {
+                    index.name: (index.spec(), index.state()) for index in collection.indexes.values()
+                })
+        except Exception as e:
+            print(f"Error saving DB: {e}")
 
 class MockClient:
-    def __init__(self, url=None):
-        self.db = MockDatabase()
-    
+    def __init__(self, url=None, engine=None):
+        self.db = MockDatabase(engine)
+
     def __getitem__(self, name):
         return self.db
 
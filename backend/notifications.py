@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationProvider:
+    # Subclasses deliver one message; raising marks the attempt as failed
+    name = "base"
+    rate_per_second = 10.0
+    burst = 10
+    concurrency = 5
+
+    async def send(self, to, body):
+        raise NotImplementedError
+
+
+class ConsoleProvider(NotificationProvider):
+    name = "console"
+    rate_per_second = 100.0
+    burst = 100
+
+    async def send(self, to, body):
+        print(f"\n[SERVER-SIDE-NOTIFICATION] Sending SMS/WhatsApp to {to}:")
+        print(f"Message: {body}\n")
+
+
+class FakeProvider(NotificationProvider):
+    # Records deliveries in memory; fail_times makes the first N sends raise
+    name = "fake"
+    rate_per_second = 1000.0
+    burst = 1000
+
+    def __init__(self, fail_times=0, latency=0.0):
+        self.sent = []
+        self.fail_times = fail_times
+        self.latency = latency
+
+    async def send(self, to, body):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("simulated provider failure")
+        self.sent.append((to, body))
+
+
+class TwilioProvider(NotificationProvider):
+    name = "twilio"
+    rate_per_second = 1.0
+    burst = 5
+
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    async def send(self, to, body):
+        # The Twilio SDK is blocking; keep it off the event loop
+        await asyncio.to_thread(self.client.messages.create, body=body, from_=self.from_number, to=to)
+
+
+def provider_from_env():
+    name = os.environ.get('NOTIFICATION_PROVIDER', 'console')
+    if name == 'twilio':
+        account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+        auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+        from_number = os.getenv('TWILIO_PHONE_NUMBER')
+        if account_sid and auth_token and from_number:
+            return TwilioProvider(account_sid, auth_token, from_number)
+        logger.warning("Twilio credentials missing, falling back to console notifications")
+    if name == 'fake':
+        return FakeProvider()
+    return ConsoleProvider()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class NotificationOutbox:
+    """Durable queue of outgoing notifications drained by a worker pool.
+
+    Jobs are written to the ``notifications`` collection before they are
+    queued, so anything still pending when the process stops is picked up
+    again by start().
+    """
+
+    def __init__(self, collection, providers, workers=4, max_attempts=5, backoff=1.0, max_backoff=300.0):
+        self.collection = collection
+        self.providers = {p.name: p for p in providers}
+        self.default_provider = providers[0].name
+        self.buckets = {p.name: TokenBucket(p.rate_per_second, p.burst) for p in providers}
+        self.limits = {p.name: asyncio.Semaphore(p.concurrency) for p in providers}
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = None
+        self._tasks = []
+
+    async def start(self, recover=True):
+        # recover=False leaves jobs already pending to another process
+        self.queue = asyncio.Queue()
+        if recover:
+            for job in await self.collection.find({"status": "pending"}).to_list(None):
+                self._schedule(job["id"], job.get("nextAttemptAt", 0))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, to, body, incident_id=None, provider=None):
+        return (await self.enqueue_many([{"to": to, "body": body, "incidentId": incident_id, "provider": provider}]))[0]
+
+    async def enqueue_many(self, messages):
+        now = time.time()
+        jobs = [
+            {
+                "id": str(uuid.uuid4()),
+                "incidentId": message.get("incidentId"),
+                "provider": message.get("provider") or self.default_provider,
+                "to": message["to"],
+                "body": message["body"],
+                "status": "pending",
+                "attempts": 0,
+                "nextAttemptAt": now,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+            }
+            for message in messages
+        ]
+        if jobs:
+            await self.collection.insert_many(jobs)
+            for job in jobs:
+                self._schedule(job["id"], now)
+        return [job["id"] for job in jobs]
+
+    def _schedule(self, job_id, at):
+        if self.queue is None:
+            return
+        delay = at - time.time()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, job_id)
+        else:
+            self.queue.put_nowait(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._deliver(job_id)
+            except Exception as e:
+                logger.error(f"Notification worker error for {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, job_id):
+        job = await self.collection.find_one({"id": job_id})
+        if not job or job["status"] != "pending":
+            return
+        provider = self.providers.get(job["provider"])
+        if provider is None:
+            await self.collection.update_one({"id": job_id}, {"$set": {"status": "failed", "error": "unknown provider"}})
+            return
+
+        await self.buckets[provider.name].acquire()
+        attempts = job["attempts"] + 1
+        try:
+            async with self.limits[provider.name]:
+                await provider.send(job["to"], job["body"])
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                await self.collection.update_one({"id": job_id}, {"$set": {
+                    "status": "failed", "attempts": attempts, "error": str(e),
+                }})
+                logger.error(f"Notification {job_id} to {job['to']} failed permanently: {e}")
+                return
+            # Exponential backoff with jitter
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            next_at = time.time() + delay
+            await self.collection.update_one({"id": job_id}, {"$set": {
+                "attempts": attempts, "nextAttemptAt": next_at, "error": str(e),
+            }})
+            self._schedule(job_id, next_at)
+            return
+
+        await self.collection.update_one({"id": job_id}, {"$set": {
+            "status": "sent", "attempts": attempts, "sentAt": datetime.now(timezone.utc).isoformat(),
+        }})
+
+    async def join(self):
+        await self.queue.join()
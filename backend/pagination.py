@@ -0,0 +1,51 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return values
+
+
+def after_clause(sort, values):
+    # Keyset condition for "strictly after this row" under a multi-key sort:
+    # (k1 > v1) or (k1 == v1 and k2 > v2) or ... with > flipped for DESC keys
+    clauses = []
+    for i, (key, order) in enumerate(sort):
+        clause = {k: v for (k, _), v in zip(sort[:i], values[:i])}
+        clause[key] = {'$gt' if order == 1 else '$lt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+async def paginate(collection, query, sort, limit, after=None, projection=None):
+    """Fetch one page ordered by ``sort`` (whose last key must be unique).
+
+    Returns ``(documents, next_cursor)``; next_cursor is None on the last
+    page. Sort keys are always fetched so the cursor can be built even when
+    the projection would otherwise drop them.
+    """
+    if after:
+        query = {'$and': [query, after_clause(sort, decode_cursor(after, len(sort)))]}
+    if projection and any(v for k, v in projection.items() if k != '_id'):
+        projection = {**projection, **{key: 1 for key, _ in sort}}
+
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.get(key) for key, _ in sort])
+    return docs, next_cursor
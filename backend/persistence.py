@@ -0,0 +1,604 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from snapshot import PersistedIndex, SnapshotDocuments, SnapshotReader, raw_items, write_collection, write_index
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+SNAPSHOT_FORMATS = ('binary', 'json')
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), default=str)
+
+
+def _read_log(path):
+    ops = []
+    if not os.path.exists(path):
+        return ops
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-append; everything
+                # before it was written completely.
+                break
+    return ops
+
+
+def replay(collections, ops):
+    # collections: name -> {_id: doc}. Ops carry post-images, so replaying
+    # an op that is already reflected in the snapshot is harmless.
+    for op in ops:
+        docs = collections.setdefault(op['c'], {})
+        kind = op['op']
+        if kind == 'i':
+            docs[op['doc']['_id']] = op['doc']
+        elif kind == 'u':
+            doc = docs.get(op['_id'])
+            if doc is not None:
+                doc.update(op['set'])
+                for key in op.get('unset', ()):
+                    doc.pop(key, None)
+        elif kind == 'd':
+            docs.pop(op['_id'], None)
+    return collections
+
+
+class PersistenceEngine:
+    """Snapshot + append-only operation log behind MockDatabase.
+
+    Writes are serialized on the caller's thread (cost proportional to the
+    change, not the database) and appended to ``<snapshot>.log`` by a
+    background flusher. Once enough operations accumulate, the log is
+    rotated and folded into a new snapshot off the request path.
+
+    The default 'binary' snapshot is a directory of memory-mapped
+    per-collection files (see snapshot.py) named after a random token
+    that changes with every compaction; indexes saved under the same
+    token are known to match it. A JSON snapshot at ``snapshot_path`` is
+    still read when no binary one exists, and converted on load.
+    """
+
+    # Only SQLiteEngine can be shared by several processes
+    shared = False
+
+    def __init__(self, snapshot_path, fsync='interval', flush_interval=0.05, compact_every=10000, format='binary'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        if format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"format must be one of {SNAPSHOT_FORMATS}")
+        self.snapshot_path = snapshot_path
+        self.snapshot_dir = os.path.splitext(snapshot_path)[0] + '.snapshot'
+        self.manifest_path = os.path.join(self.snapshot_dir, 'MANIFEST.json')
+        self.format = format
+        self.token = None
+        # collection -> _ids touched by the log replayed on load
+        self.dirty = {}
+        self.log_path = snapshot_path + '.log'
+        self.compacting_path = snapshot_path + '.log.compacting'
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []
+        self._since_compact = 0
+        self._log = None
+        self._thread = None
+        self._closed = False
+        # Cumulative I/O counters, exported by the metrics endpoint
+        self.stats = {
+            'log_writes': 0,
+            'log_bytes': 0,
+            'log_write_seconds': 0.0,
+            'compactions': 0,
+            'compaction_seconds': 0.0,
+            'snapshot_bytes': 0,
+        }
+
+    @classmethod
+    def from_env(cls, snapshot_path):
+        return cls(
+            snapshot_path,
+            fsync=os.environ.get('DB_FSYNC', 'interval'),
+            flush_interval=float(os.environ.get('DB_FLUSH_INTERVAL', '0.05')),
+            compact_every=int(os.environ.get('DB_COMPACT_EVERY', '10000')),
+            format=os.environ.get('DB_SNAPSHOT_FORMAT', 'binary'),
+        )
+
+    def load(self):
+        # A leftover rotated log means we crashed mid-compaction; finish it
+        # before layering the active log on top.
+        if os.path.exists(self.compacting_path):
+            self._compact_rotated()
+        collections, rewrite = self._read_snapshot()
+        if rewrite:
+            # Persist generated _ids so logged updates can find them, and
+            # convert a JSON snapshot to the binary format
+            self.write_snapshot(collections)
+            collections, _ = self._read_snapshot()
+        ops = _read_log(self.log_path)
+        self._since_compact = len(ops)
+        self.dirty = {}
+        for op in ops:
+            self.dirty.setdefault(op['c'], set()).add(op['doc']['_id'] if op['op'] == 'i' else op['_id'])
+        replay(collections, ops)
+        # name -> {_id: doc} mapping; documents of a binary snapshot are
+        # decoded as they are accessed
+        return collections
+
+    def _read_manifest(self):
+        if self.format != 'binary' or not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _read_snapshot(self):
+        manifest = self._read_manifest()
+        if manifest is not None:
+            self.token = manifest['token']
+            return {
+                name: SnapshotDocuments(SnapshotReader(os.path.join(self.snapshot_dir, filename)))
+                for name, filename in manifest['collections'].items()
+            }, False
+        collections = {}
+        assigned_ids = False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                for name, docs in json.load(f).items():
+                    for doc in docs:
+                        if '_id' not in doc:
+                            doc['_id'] = str(uuid.uuid4())
+                            assigned_ids = True
+                    collections[name] = {doc['_id']: doc for doc in docs}
+        return collections, assigned_ids or (self.format == 'binary' and bool(collections))
+
+    def _open_log(self):
+        if self._log is None:
+            self._log = open(self.log_path, 'ab')
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-flusher', daemon=True)
+            self._thread.start()
+
+    def append(self, collection, op):
+        self.append_many(collection, [op])
+
+    def append_many(self, collection, ops):
+        # A batch lands in the log with a single write (and fsync in
+        # 'always' mode) however many operations it holds
+        lines = []
+        for op in ops:
+            op['c'] = collection
+            lines.append((_dumps(op) + '\n').encode())
+        with self._lock:
+            self._open_log()
+            self._pending.extend(lines)
+            if self.fsync == 'always':
+                self._write_pending()
+        if self.fsync != 'always' and len(self._pending) >= 1000:
+            self._wake.set()
+
+    def _write_pending(self):
+        # Caller holds self._lock
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        data = b''.join(batch)
+        start = time.perf_counter()
+        self._log.write(data)
+        self._log.flush()
+        if self.fsync != 'never':
+            os.fsync(self._log.fileno())
+        self.stats['log_write_seconds'] += time.perf_counter() - start
+        self.stats['log_writes'] += 1
+        self.stats['log_bytes'] += len(data)
+        self._since_compact += len(batch)
+
+    def flush(self):
+        with self._lock:
+            if self._log is not None:
+                self._write_pending()
+        if self._since_compact >= self.compact_every:
+            self.compact()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing DB log: {e}")
+
+    def compact(self):
+        with self._compact_lock:
+            with self._lock:
+                if self._log is not None:
+                    self._write_pending()
+                    self._log.close()
+                    self._log = None
+                if not os.path.exists(self.log_path):
+                    return
+                os.replace(self.log_path, self.compacting_path)
+                self._since_compact = 0
+            self._compact_rotated()
+
+    def _compact_rotated(self):
+        start = time.perf_counter()
+        collections, _ = self._read_snapshot()
+        replay(collections, _read_log(self.compacting_path))
+        self.write_snapshot(collections)
+        os.remove(self.compacting_path)
+        self.stats['compactions'] += 1
+        self.stats['compaction_seconds'] += time.perf_counter() - start
+
+    def write_snapshot(self, collections):
+        # collections: name -> {_id: doc} mapping
+        if self.format == 'binary':
+            self._write_binary_snapshot(collections)
+            return
+        tmp_path = self.snapshot_path + '.tmp'
+        body = _dumps({name: list(docs.values()) for name, docs in collections.items()}).encode()
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.stats['snapshot_bytes'] = len(body)
+
+    def _write_binary_snapshot(self, collections):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        token = uuid.uuid4().hex
+        files = {}
+        size = 0
+        for name, docs in collections.items():
+            files[name] = f"{name}.{token}.bin"
+            size += write_collection(os.path.join(self.snapshot_dir, files[name]), bytes.fromhex(token), raw_items(docs))
+        # Replacing the manifest switches to the new snapshot atomically
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'token': token, 'collections': files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self.token = token
+        self.stats['snapshot_bytes'] = size
+        # Files of older snapshots stay readable to anyone who has them open
+        for filename in os.listdir(self.snapshot_dir):
+            if filename != 'MANIFEST.json' and f".{token}." not in filename:
+                os.remove(os.path.join(self.snapshot_dir, filename))
+
+    def _index_path(self, collection, name):
+        return os.path.join(self.snapshot_dir, f"{collection}.{self.token}.{name}.idx")
+
+    def persisted_indexes(self, collection, names):
+        # Indexes saved against the current binary snapshot, by name
+        found = {}
+        if self.token is None:
+            return found
+        for name in names:
+            path = self._index_path(collection, name)
+            if os.path.exists(path):
+                try:
+                    found[name] = PersistedIndex(path)
+                except Exception as e:
+                    print(f"Error reading persisted index {path}: {e}")
+        return found
+
+    def write_indexes(self, collection, indexes):
+        # indexes: name -> (spec, state), matching the current snapshot
+        if self.token is None:
+            return
+        for name, (spec, state) in indexes.items():
+            write_index(self._index_path(collection, name), spec, state)
+
+    def primary(self):
+        # Whether this process runs the once-per-deployment jobs
+        return True
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.compact()
+
+
+class SQLiteEngine(PersistenceEngine):
+    """Stores each collection as a SQLite table of JSON documents.
+
+    Same contract as the log engine: MockDatabase keeps documents and
+    indexes in memory and hands every write over as an op, applied to the
+    tables in batched transactions by the background flusher ('always'
+    commits on the caller's thread). The database runs in WAL mode, so
+    compaction is just a checkpoint.
+
+    With ``shared=True`` several processes (server workers) use the same
+    file. Each write takes SQLite's write lock (BEGIN IMMEDIATE), first
+    applies the ops other processes committed since this one last looked,
+    and commits its own ops together with a record in the ``_changes``
+    table; reads only catch up. See transaction() and sync().
+    """
+
+    SYNCHRONOUS = {'always': 'FULL', 'interval': 'NORMAL', 'never': 'OFF'}
+
+    def __init__(self, path, fsync='interval', flush_interval=0.05, compact_every=10000, shared=False):
+        super().__init__(path, fsync=fsync, flush_interval=flush_interval, compact_every=compact_every)
+        self.path = path
+        self.shared = shared
+        self._conn = None
+        self._tables = set()
+        # Shared mode: last _changes record reflected in memory, and the
+        # data_version it was read at
+        self._seq = 0
+        self._data_version = None
+        self._stale = False
+        self._depth = 0
+        self._primary = None
+
+    @classmethod
+    def from_env(cls, path):
+        # Several uvicorn workers need the shared mode
+        workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+        return cls(
+            path,
+            fsync=os.environ.get('DB_FSYNC', 'interval'),
+            flush_interval=float(os.environ.get('DB_FLUSH_INTERVAL', '0.05')),
+            compact_every=int(os.environ.get('DB_COMPACT_EVERY', '10000')),
+            shared=os.environ.get('DB_SHARED', '1' if workers > 1 else '0') == '1',
+        )
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS[self.fsync]}')
+            self._conn.execute('PRAGMA busy_timeout=5000')
+            if self.shared:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS _changes '
+                    '(seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, op TEXT NOT NULL)'
+                )
+        return self._conn
+
+    def _table(self, name):
+        if name not in self._tables:
+            self._connect().execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+            self._tables.add(name)
+        return f'"{name}"'
+
+    def _read_tables(self, conn):
+        # Every collection plus the position in _changes they reflect, read
+        # in one transaction
+        own = not conn.in_transaction
+        if own:
+            conn.execute('BEGIN')
+        try:
+            names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            collections = {}
+            for name in names:
+                if name.startswith(('_', 'sqlite_')):
+                    continue
+                self._tables.add(name)
+                collections[name] = {}
+                for doc, in conn.execute(f'SELECT doc FROM "{name}" ORDER BY rowid'):
+                    doc = json.loads(doc)
+                    collections[name][doc['_id']] = doc
+            if self.shared:
+                self._seq = conn.execute('SELECT coalesce(max(seq), 0) FROM _changes').fetchone()[0]
+                self._data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        finally:
+            if own:
+                conn.execute('COMMIT')
+        return collections
+
+    def load(self):
+        with self._lock:
+            collections = self._read_tables(self._connect())
+        self.dirty = {}
+        return collections
+
+    def _catch_up(self, conn, db):
+        # Caller holds self._lock. data_version only changes when another
+        # connection commits, so an idle database costs one pragma.
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version and not self._stale:
+            return
+        self._data_version = version
+        first = conn.execute('SELECT min(seq) FROM _changes').fetchone()[0]
+        if self._stale or (first is not None and first > self._seq + 1):
+            # Records this process never applied were pruned (or a commit of
+            # ours failed): start over from the tables
+            print(f"Reloading shared database {self.path}")
+            self._stale = False
+            db.attach(self._read_tables(conn))
+            return
+        for seq, collection, op in conn.execute(
+            'SELECT seq, collection, op FROM _changes WHERE seq > ? ORDER BY seq', (self._seq,)
+        ).fetchall():
+            db.replay(collection, json.loads(op))
+            self._seq = seq
+
+    def sync(self, db):
+        # Apply other processes' committed writes to db before a read
+        with self._lock:
+            self._catch_up(self._connect(), db)
+
+    @contextlib.contextmanager
+    def transaction(self, db):
+        """Run a write operation on db under the cross-process write lock.
+
+        The operation sees every write committed before it, and the ops it
+        hands to append_many() are committed when it returns -- also when
+        it fails part way, since what it already applied in memory has to
+        be persisted too. Nested operations join the outer transaction.
+        """
+        if self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._catch_up(conn, db)
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+                    batch, self._pending = self._pending, []
+                    self._write_batch(conn, batch)
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                    # Memory may already hold writes that were not stored
+                    self._stale = True
+                raise
+        if self._since_compact >= self.compact_every:
+            self.compact()
+
+    def primary(self):
+        # Of the processes sharing the file, the one holding its lock file;
+        # the lock is released when that process exits
+        if not self.shared or self._primary is not None:
+            return True
+        import fcntl
+
+        lock = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._primary = lock
+        return True
+
+    def _open_log(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-flusher', daemon=True)
+            self._thread.start()
+
+    def append_many(self, collection, ops):
+        if self.shared:
+            # Written by the enclosing transaction(), which holds the lock
+            if not self._depth:
+                raise RuntimeError("Writes to a shared database must run in a transaction")
+            self._pending.extend((collection, op) for op in ops)
+            return
+        with self._lock:
+            self._open_log()
+            self._pending.extend((collection, op) for op in ops)
+            if self.fsync == 'always':
+                self._write_pending()
+        if self.fsync != 'always' and len(self._pending) >= 1000:
+            self._wake.set()
+
+    def _write_pending(self):
+        # Caller holds self._lock
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            self._write_batch(conn, batch)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _write_batch(self, conn, batch):
+        # Inside the caller's transaction
+        if not batch:
+            return
+        start = time.perf_counter()
+        written = 0
+        for collection, op in batch:
+            table = self._table(collection)
+            kind = op['op']
+            if kind == 'i':
+                doc = _dumps(op['doc'])
+                written += len(doc)
+                conn.execute(f'INSERT OR REPLACE INTO {table} (id, doc) VALUES (?, ?)', (_dumps(op['doc']['_id']), doc))
+            elif kind == 'u':
+                # Ops carry whole top-level fields; patch them in place
+                expr, params = 'doc', []
+                for key, value in op['set'].items():
+                    value = _dumps(value)
+                    written += len(value)
+                    expr = f'json_set({expr}, ?, json(?))'
+                    params += [_json_path(key), value]
+                for key in op.get('unset', ()):
+                    expr = f'json_remove({expr}, ?)'
+                    params.append(_json_path(key))
+                conn.execute(f'UPDATE {table} SET doc = {expr} WHERE id = ?', (*params, _dumps(op['_id'])))
+            elif kind == 'd':
+                conn.execute(f'DELETE FROM {table} WHERE id = ?', (_dumps(op['_id']),))
+            if self.shared:
+                self._seq = conn.execute(
+                    'INSERT INTO _changes (collection, op) VALUES (?, ?)', (collection, _dumps(op))
+                ).lastrowid
+        self.stats['log_write_seconds'] += time.perf_counter() - start
+        self.stats['log_writes'] += 1
+        self.stats['log_bytes'] += written
+        self._since_compact += len(batch)
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+        if self._since_compact >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        start = time.perf_counter()
+        with self._lock:
+            self._write_pending()
+            self._since_compact = 0
+            if self._conn is None:
+                return
+            if self.shared:
+                # Keep enough change records for processes that are a little
+                # behind; one that falls further behind reloads. A passive
+                # checkpoint does not wait for the other processes' readers.
+                self._conn.execute(
+                    'DELETE FROM _changes WHERE seq <= (SELECT max(seq) FROM _changes) - ?', (self.compact_every,)
+                )
+                self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            else:
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.stats['compactions'] += 1
+        self.stats['compaction_seconds'] += time.perf_counter() - start
+        self.stats['snapshot_bytes'] = os.path.getsize(self.path)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.compact()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            if self._primary is not None:
+                self._primary.close()
+                self._primary = None
+
+
+def _json_path(key):
+    return f'$."{key}"'
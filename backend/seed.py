@@ -1,3 +1,11 @@
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import random
+import sys
 from datetime import datetime, timedelta
 
 def get_mock_users():
@@ -146,7 +154,7 @@ def get_mock_incidents(users):
         {
             "id": "incident1",
             "type": "Medical",
-            "victim": users[0],
+            "victimId": users[0]["id"],
             "location": { "lat": 37.7749, "lng": -122.4194, "address": "Main Library, Campus" },
             "distance": 350,
             "description": "Feeling dizzy and disoriented",
@@ -164,7 +172,7 @@ def get_mock_incidents(users):
         {
             "id": "incident2",
             "type": "Assault",
-            "victim": users[2],
+            "victimId": users[2]["id"],
             "location": { "lat": 37.7739, "lng": -122.4200, "address": "North Parking Lot" },
             "distance": 580,
             "description": "Feeling unsafe, someone following me",
@@ -181,7 +189,7 @@ def get_mock_incidents(users):
         {
             "id": "incident3",
             "type": "Accident",
-            "victim": users[1],
+            "victimId": users[1]["id"],
             "location": { "lat": 37.7759, "lng": -122.4184, "address": "Sports Complex" },
             "distance": 920,
             "description": "Twisted ankle during basketball",
@@ -195,3 +203,216 @@ def get_mock_incidents(users):
             ]
         }
     ]
+
+
+# Synthetic datasets at any scale. Every record is derived from its own
+# (seed, kind, index) RNG, so output is reproducible, any slice can be
+# generated on its own, and nothing is held in memory beyond one record.
+FIRST_NAMES = ["Sarah", "Mike", "Priya", "James", "Aisha", "Lucas", "Mei", "Omar", "Elena", "Noah",
+               "Fatima", "Diego", "Hana", "Kwame", "Sofia", "Ivan", "Leila", "Arjun", "Grace", "Mateo"]
+LAST_NAMES = ["Johnson", "Chen", "Sharma", "Okafor", "Garcia", "Kim", "Novak", "Haddad", "Rossi", "Smith",
+              "Nguyen", "Silva", "Müller", "Tanaka", "Ahmed", "Cohen", "Dubois", "Kowalski", "Mensah", "Patel"]
+INCIDENT_TYPES = ["Medical", "Assault", "Accident", "Other"]
+BLOOD_TYPES = ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-"]
+BADGES = ["first-responder", "speed-demon", "guardian-angel", "night-owl", "medic", "community-hero"]
+CHAT_LINES = [
+    "On my way", "I'm 2 minutes away", "I can see you", "Stay where you are, help is coming",
+    "Campus security has been notified", "I have a first aid kit", "Are you able to move?",
+    "Ambulance is on the way", "I'm here", "Thank you so much",
+]
+DEFAULT_CENTER = (37.7749, -122.4194)
+USERS_PER_CLUSTER = 2000
+
+def _rng(seed, kind, i):
+    return random.Random(f"{seed}:{kind}:{i}")
+
+def _user_id(i):
+    return f"gen-user-{i}"
+
+def _offset(rng, center, distance_m):
+    bearing = rng.uniform(0, 2 * math.pi)
+    lat = center[0] + distance_m * math.cos(bearing) / 111320.0
+    lng = center[1] + distance_m * math.sin(bearing) / (111320.0 * math.cos(math.radians(center[0])))
+    return {"lat": round(lat, 6), "lng": round(lng, 6)}
+
+class ClusterLayout:
+    """Neighborhoods users are clustered into.
+
+    Each cluster owns a contiguous block of user indices, sized by a
+    heavy-tailed weight, so a user's cluster (and its neighbors for trusted
+    circles and helper lists) is found by bisecting the block boundaries.
+    """
+
+    def __init__(self, user_count, seed=0, center=DEFAULT_CENTER, radius_m=None):
+        rng = _rng(seed, "clusters", 0)
+        count = max(1, math.ceil(user_count / USERS_PER_CLUSTER))
+        # The region grows with the population so density stays plausible
+        radius_m = radius_m or max(5000.0, 60.0 * math.sqrt(user_count))
+        weights = [rng.paretovariate(1.5) for _ in range(count)]
+        total = sum(weights)
+        self.user_count = user_count
+        self.bounds = []
+        self.centers = []
+        self.spreads = []
+        acc = 0.0
+        for weight in weights:
+            acc += weight
+            self.bounds.append(min(user_count, round(user_count * acc / total)))
+            self.centers.append(tuple(_offset(rng, center, radius_m * math.sqrt(rng.random())).values()))
+            self.spreads.append(rng.uniform(300, 1500))
+        self.bounds[-1] = user_count
+
+    def cluster_of(self, i):
+        return bisect.bisect_right(self.bounds, i)
+
+    def block(self, cluster):
+        return (self.bounds[cluster - 1] if cluster else 0), self.bounds[cluster]
+
+    def location(self, rng, cluster):
+        # Gaussian scatter around the cluster center
+        return _offset(rng, self.centers[cluster], abs(rng.gauss(0, self.spreads[cluster])))
+
+    def neighbors(self, rng, i, k):
+        start, end = self.block(self.cluster_of(i))
+        if end - start <= 1:
+            return []
+        picks = {rng.randrange(start, end) for _ in range(k)}
+        picks.discard(i)
+        return [_user_id(j) for j in sorted(picks)]
+
+def generate_users(count, seed=0, start=0, stop=None, layout=None, center=DEFAULT_CENTER):
+    layout = layout or ClusterLayout(count, seed, center)
+    for i in range(start, count if stop is None else min(stop, count)):
+        rng = _rng(seed, "user", i)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        responses = int(rng.expovariate(1 / 8))
+        yield {
+            "id": _user_id(i),
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}.{i}@example.com",
+            "phone": f"+1 555-{i:07d}",
+            "profileComplete": rng.random() < 0.8,
+            "level": min(10, 1 + responses // 5),
+            "points": responses * 50 + rng.randint(0, 49),
+            "responses": responses,
+            "rating": round(rng.uniform(3.5, 5.0), 1) if responses else 0.0,
+            "badges": rng.sample(BADGES, min(len(BADGES), responses // 10)),
+            "bloodType": rng.choice(BLOOD_TYPES),
+            "emergencyContacts": [
+                {"name": "Emergency Contact", "relationship": "Primary", "phone": f"+1 555-{rng.randint(0, 9999999):07d}"}
+                for _ in range(rng.randint(1, 2))
+            ],
+            "trustedCircle": layout.neighbors(rng, i, rng.randint(2, 6)),
+            "preferences": {
+                "receiveAlerts": {t.lower(): rng.random() > 0.1 for t in INCIDENT_TYPES},
+                "alertRadius": rng.choice([500, 1000, 1000, 2000]),
+                "silentMode": rng.random() < 0.05,
+            },
+            "createdAt": (datetime(2024, 1, 1) + timedelta(days=rng.uniform(0, 600))).isoformat(),
+            "location": layout.location(rng, layout.cluster_of(i)),
+        }
+
+def generate_incidents(count, user_count, seed=0, start=0, stop=None, layout=None,
+                       center=DEFAULT_CENTER, now=None, span=timedelta(days=30)):
+    layout = layout or ClusterLayout(user_count, seed, center)
+    now = now or datetime.now()
+    for i in range(start, count if stop is None else min(stop, count)):
+        rng = _rng(seed, "incident", i)
+        victim = rng.randrange(user_count)
+        timestamp = now - span * (1 - math.sqrt(rng.random()))
+        helpers = layout.neighbors(rng, victim, rng.choice([0, 1, 2, 3, 3, 5, 8]))
+        arrived = helpers[:rng.randint(0, len(helpers))]
+        resolved = timestamp < now - timedelta(hours=2) or rng.random() < 0.3
+
+        response_times = {}
+        for helper in helpers:
+            responded = timestamp + timedelta(seconds=rng.uniform(10, 180))
+            response_times[helper] = {"respondedAt": responded.isoformat()}
+            if helper in arrived:
+                response_times[helper]["arrivedAt"] = (responded + timedelta(seconds=rng.uniform(60, 900))).isoformat()
+
+        participants = [_user_id(victim)] + helpers
+        chat_at = timestamp
+        messages = []
+        for m in range(rng.randint(0, 3 * len(participants)) if helpers else 0):
+            chat_at += timedelta(seconds=rng.uniform(5, 90))
+            messages.append({
+                "id": f"gen-msg-{i}-{m}",
+                "sender": rng.choice(participants),
+                "message": rng.choice(CHAT_LINES),
+                "timestamp": chat_at.isoformat(),
+            })
+
+        incident = {
+            "id": f"gen-incident-{i}",
+            "type": rng.choice(INCIDENT_TYPES),
+            "victimId": _user_id(victim),
+            "location": layout.location(rng, layout.cluster_of(victim)),
+            "description": "Synthetic incident",
+            "timestamp": timestamp.isoformat(),
+            "status": "resolved" if resolved else "active",
+            "respondingHelpers": helpers,
+            "arrivedHelpers": arrived,
+            "responseTimes": response_times,
+            "emergencyServicesNotified": ["campus-security"] if rng.random() < 0.3 else [],
+            "chatMessages": messages,
+        }
+        if resolved:
+            incident["resolvedAt"] = (max(chat_at, timestamp) + timedelta(minutes=rng.uniform(5, 60))).isoformat()
+        yield incident
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+async def seed_synthetic(db, user_count, incident_count, seed=0, batch_size=5000, log=print):
+    # Streams generated documents into the database one bulk insert at a time
+    layout = ClusterLayout(user_count, seed)
+    for name, documents in (
+        ("users", generate_users(user_count, seed, layout=layout)),
+        ("incidents", generate_incidents(incident_count, user_count, seed, layout=layout)),
+    ):
+        written = 0
+        for batch in batched(documents, batch_size):
+            await db[name].insert_many(batch)
+            written += len(batch)
+            if written % (batch_size * 20) == 0:
+                log(f"Seeded {written} {name}")
+        log(f"Seeded {written} {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic SafeCircle dataset")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--incidents", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help="write JSON lines ({collection, document}) to PATH (- for stdout) instead of the database")
+    args = parser.parse_args()
+
+    if args.jsonl:
+        out = sys.stdout if args.jsonl == "-" else open(args.jsonl, "w")
+        layout = ClusterLayout(args.users, args.seed)
+        for name, documents in (
+            ("users", generate_users(args.users, args.seed, layout=layout)),
+            ("incidents", generate_incidents(args.incidents, args.users, args.seed, layout=layout)),
+        ):
+            for document in documents:
+                out.write(json.dumps({"collection": name, "document": document}) + "\n")
+        if out is not sys.stdout:
+            out.close()
+        return
+
+    # Writes into the database the server uses (db.json in this directory)
+    from mock_db import MockDatabase
+    db = MockDatabase()
+    try:
+        asyncio.run(seed_synthetic(db, args.users, args.incidents, args.seed, args.batch_size,
+                                   log=lambda message: print(message, file=sys.stderr)))
+        db.save()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,134 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Request, Response, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, field_validator, model_validator
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone
-from seed import get_mock_users, get_mock_incidents
-from mock_db import MockClient
+from datetime import datetime, timedelta, timezone
+from seed import get_mock_users, get_mock_incidents, seed_synthetic
+from storage import connect, create_indexes
+from geo import haversine_m
+from dispatch import MAX_ALERT_RADIUS_M, HelperDispatcher
+from events import EventHub
+from notifications import NotificationOutbox, provider_from_env
+from pagination import paginate
+from cache import DocumentVersions, ResponseCache
+from encoding import ModelEncoder, json_bytes
+from ingest import LocationIngestor
+from archive import SegmentArchive, IncidentArchiver, parse_timestamp
+from checkins import CheckInScheduler
+from analytics import IncidentAnalytics
+from metrics import Metrics, MetricsMiddleware
+from admission import AdmissionController, AdmissionMiddleware
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-try:
-    # Try to connect to real MongoDB if available, otherwise use Mock
-    # Since AsyncIOMotorClient is lazy, we can't easily check here.
-    # For this environment, we'll default to MockClient to ensure it works without external dependencies.
-    # To use real MongoDB, uncomment the following lines and comment out MockClient:
-    # client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=5000)
-    
-    logger = logging.getLogger("uvicorn")
-    logger.info("Using In-Memory Mock Database (data will reset on restart)")
-    client = MockClient(mongo_url)
-except Exception as e:
-    print(f"Error initializing DB client: {e}")
-    client = MockClient(mongo_url)
+# Storage backend, chosen by MONGO_URL: mock:// (default), sqlite:///file.db
+# or a mongodb:// URL (falls back to the mock if the server is unreachable)
+logger = logging.getLogger("uvicorn")
+client = connect(os.environ.get('MONGO_URL', 'mock://'))
+logger.info(f"Using {type(client).__name__} storage backend")
 
 db_name = os.environ.get('DB_NAME', 'safecircle')
 db = client[db_name]
 
+# Columnar view of responders, ranking the helpers for an incident
+dispatcher = HelperDispatcher()
+
+# Pushes incident changes to subscribed clients instead of having them poll
+hub = EventHub()
+
+# Emergency-contact alerts are queued here and delivered by background workers
+outbox = NotificationOutbox(
+    db.notifications,
+    [provider_from_env()],
+    workers=int(os.environ.get('NOTIFICATION_WORKERS', '4')),
+)
+
+# Batched location reports are coalesced per user and written in bulk
+location_ingestor = LocationIngestor(
+    db.users,
+    window=float(os.environ.get('LOCATION_BATCH_WINDOW', '0.25')),
+)
+
+# Resolved incidents move out of the hot collection into per-day compressed
+# segments once they are older than the retention period
+incident_archive = SegmentArchive(os.environ.get('INCIDENT_ARCHIVE_DIR', 'archive/incidents'))
+archiver = IncidentArchiver(
+    db.incidents,
+    incident_archive,
+    retention=timedelta(hours=float(os.environ.get('ARCHIVE_RESOLVED_AFTER_HOURS', '24'))),
+    interval=float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '300')),
+)
+
+# Check-in deadlines are kept in a timer wheel; a missed check-in raises an
+# SOS on the user's behalf
+checkin_scheduler = CheckInScheduler(db.checkins, tick=float(os.environ.get('CHECKIN_TICK_SECONDS', '1')))
+
+# Incident rollups for the analytics endpoints, updated on every incident
+# write and backfilled (hot + archived incidents) at startup
+analytics = IncidentAnalytics(precision=int(os.environ.get('ANALYTICS_GEOHASH_PRECISION', '5')))
+
+# Hot read endpoints serve pre-serialized bodies until a write to one of
+# their collections (by any worker, with a shared database) bumps its version
+response_cache = ResponseCache(sync=db.sync if db.shared else None)
+# Per-user write versions, so expanded incident pages only go stale when a
+# user they embed changes, not on every location ping
+user_versions = DocumentVersions(db.users)
+
+# Request, database and persistence metrics for /api/metrics. Operations
+# slower than SLOW_QUERY_MS are also logged.
+slow_query_ms = os.environ.get('SLOW_QUERY_MS')
+metrics = Metrics(slow_query_ms=float(slow_query_ms) if slow_query_ms else None)
+if hasattr(db, 'observers'):
+    db.observers.append(metrics.observe_db)
+
+def runtime_metrics():
+    engine = getattr(db, 'engine', None)
+    if engine is not None:
+        stats = engine.stats
+        yield "db_log_writes_total", "counter", "Batched writes to the operation log.", stats['log_writes']
+        yield "db_log_bytes_written_total", "counter", "Bytes appended to the operation log.", stats['log_bytes']
+        yield "db_log_write_seconds_total", "counter", "Time spent writing and syncing the log.", stats['log_write_seconds']
+        yield "db_compactions_total", "counter", "Snapshot compactions (saves).", stats['compactions']
+        yield "db_compaction_seconds_total", "counter", "Time spent compacting.", stats['compaction_seconds']
+        yield "db_snapshot_bytes", "gauge", "Size of the last snapshot written.", stats['snapshot_bytes']
+    yield "response_cache_hits_total", "counter", "Cached responses served.", response_cache.hits
+    yield "response_cache_misses_total", "counter", "Responses built on a cache miss.", response_cache.misses
+    yield "sse_subscribers", "gauge", "Connected incident stream subscribers.", len(hub.subscriptions)
+    yield "location_reports_received_total", "counter", "Batched location reports received.", location_ingestor.received
+    yield "admission_in_flight", "gauge", "Requests currently admitted.", admission.in_flight
+    yield "admission_queued", "gauge", "Requests waiting for admission.", admission.queued()
+    yield "checkin_timers_pending", "gauge", "Armed check-in timers.", len(checkin_scheduler.wheel)
+    yield "checkin_timers_expired_total", "counter", "Check-in timers that expired.", checkin_scheduler.expired
+
+metrics.add_collector(runtime_metrics)
+
+# Admission control: bounded concurrency with per-priority queues, so SOS
+# and helper actions overtake polling under load; low-priority work is shed
+# while queueing (or event loop lag) exceeds the target latency
+admission = AdmissionController(
+    max_concurrency=int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '64')),
+    queue_sizes={
+        'critical': int(os.environ.get('ADMISSION_CRITICAL_QUEUE', '1000')),
+        'normal': int(os.environ.get('ADMISSION_NORMAL_QUEUE', '200')),
+        'low': int(os.environ.get('ADMISSION_LOW_QUEUE', '100')),
+    },
+    target_latency=float(os.environ.get('ADMISSION_TARGET_LATENCY_MS', '100')) / 1000,
+    max_wait=float(os.environ.get('ADMISSION_MAX_WAIT_MS', '2000')) / 1000,
+    client_rate=float(os.environ.get('CLIENT_RATE_LIMIT', '20')),
+    client_burst=int(os.environ.get('CLIENT_RATE_BURST', '40')),
+    metrics=metrics,
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -82,7 +177,11 @@ class Incident(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
     type: str
-    victim: User
+    # Stored incidents reference users by id; the victim/helpers profiles
+    # are only joined in when a client asks for them with ?expand=
+    victimId: Optional[str] = None
+    victim: Optional[User] = None
+    helpers: Optional[List[User]] = None
     location: Dict[str, Any]
     distance: Optional[float] = None
     description: Optional[str] = None
@@ -92,6 +191,93 @@ class Incident(BaseModel):
     arrivedHelpers: List[str] = []
     emergencyServicesNotified: List[str] = []
     chatMessages: List[Dict[str, Any]] = []
+    # helperId -> {"respondedAt": ..., "arrivedAt": ...}
+    responseTimes: Dict[str, Dict[str, str]] = {}
+    resolvedAt: Optional[str] = None
+
+    @field_validator("timestamp")
+    @classmethod
+    def check_timestamp(cls, value):
+        # History and archiving order incidents by this field
+        if parse_timestamp(value) is None:
+            raise ValueError("timestamp must be an ISO 8601 date-time")
+        return value
+
+    @model_validator(mode="after")
+    def check_victim_reference(self):
+        if self.victimId is None and self.victim is not None:
+            self.victimId = self.victim.id
+        if self.victimId is None:
+            raise ValueError("Incident needs a victimId or an embedded victim")
+        return self
+
+class CheckIn(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str
+    destination: Optional[str] = None
+    # Incident type raised if the user does not check in
+    type: str = "Medical"
+    location: Optional[Dict[str, Any]] = None
+    startedAt: str
+    deadline: str
+    # active -> cancelled, or expired once the SOS is raised (incidentId)
+    status: str = "active"
+    incidentId: Optional[str] = None
+
+MAX_CHECKIN_MINUTES = 24 * 60
+
+class CheckInCreate(BaseModel):
+    userId: str
+    minutes: float = Field(gt=0, le=MAX_CHECKIN_MINUTES)
+    destination: Optional[str] = None
+    type: str = "Medical"
+    location: Optional[Dict[str, Any]] = None
+
+class CheckInExtend(BaseModel):
+    minutes: float = Field(default=10, gt=0, le=MAX_CHECKIN_MINUTES)
+
+class HelperAction(BaseModel):
+    helperId: str
+
+class ChatMessageCreate(BaseModel):
+    sender: str
+    message: str
+
+# Documents are validated into canonical form when written, so responses
+# are encoded straight from storage in the response_model's shape.
+# RESPONSE_VALIDATION=strict runs every document through pydantic again.
+STRICT_RESPONSES = os.environ.get('RESPONSE_VALIDATION', 'fast') == 'strict'
+user_encoder = ModelEncoder(User)
+incident_encoder = ModelEncoder(Incident)
+status_encoder = ModelEncoder(StatusCheck)
+checkin_encoder = ModelEncoder(CheckIn)
+
+def encode_list(encoder: ModelEncoder, docs: List[Dict[str, Any]]) -> bytes:
+    start = time.perf_counter()
+    body = encoder.validate_list(docs) if STRICT_RESPONSES else encoder.encode_list(docs)
+    metrics.serialization.observe((encoder.model.__name__,), time.perf_counter() - start)
+    return body
+
+def model_response(encoder: ModelEncoder, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    # A ready Response bypasses FastAPI's response_model validation
+    if isinstance(content, list):
+        body = encode_list(encoder, content)
+    else:
+        start = time.perf_counter()
+        body = encoder.validate(content) if STRICT_RESPONSES else encoder.encode(content)
+        metrics.serialization.observe((encoder.model.__name__,), time.perf_counter() - start)
+    return Response(body, media_type="application/json", headers=headers)
+
+# List endpoints page with keyset cursors: the body stays a plain list and
+# the cursor for the next page, if any, comes back in X-Next-Cursor
+MAX_PAGE_SIZE = 1000
+STATUS_SORT = [("timestamp", 1), ("id", 1)]
+USER_SORT = [("id", 1)]
+INCIDENT_SORT = [("timestamp", -1), ("id", -1)]
+
+def cursor_headers(cursor: Optional[str]) -> Optional[Dict[str, str]]:
+    return {"X-Next-Cursor": cursor} if cursor else None
 
 # Routes
 @api_router.get("/")
@@ -111,121 +297,550 @@ async def update_user_location(user_id: str, location: LocationUpdate):
     )
     return {"status": "success"}
 
+class LocationReport(LocationUpdate):
+    userId: str
+
+class LocationBatch(BaseModel):
+    updates: List[LocationReport] = Field(..., max_length=10000)
+
+@api_router.post("/locations/batch", status_code=202)
+async def ingest_locations(batch: LocationBatch):
+    await location_ingestor.submit(
+        (report.userId, report.model_dump(exclude={"userId"})) for report in batch.updates
+    )
+    return {"status": "accepted", "count": len(batch.updates)}
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
-    doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.status_checks.insert_one(doc)
+    await db.status_checks.insert_one(status_obj.model_dump(mode="json"))
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
-    for check in status_checks:
-        if isinstance(check['timestamp'], str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
-    return status_checks
+async def get_status_checks(
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    status_checks, next_cursor = await paginate(db.status_checks, {}, STATUS_SORT, limit, after, {"_id": 0})
+    return model_response(status_encoder, status_checks, cursor_headers(next_cursor))
 
 # User Routes
 @api_router.get("/users", response_model=List[User])
-async def get_users():
-    users = await db.users.find({}, {"_id": 0}).to_list(1000)
-    return users
+async def get_users(
+    request: Request,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    async def build():
+        if fields:
+            # Sparse fieldset: return just the requested fields (plus id)
+            projection = {"_id": 0, "id": 1, **{f.strip(): 1 for f in fields.split(",") if f.strip()}}
+            users, next_cursor = await paginate(db.users, {}, USER_SORT, limit, after, projection)
+            return json_bytes(users), cursor_headers(next_cursor)
+        users, next_cursor = await paginate(db.users, {}, USER_SORT, limit, after, {"_id": 0})
+        return encode_list(user_encoder, users), cursor_headers(next_cursor)
+    return await response_cache.respond(request, [db.users], build)
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return model_response(user_encoder, user)
 
 @api_router.post("/login", response_model=User)
 async def login(login_data: LoginRequest):
     user = await db.users.find_one({"email": login_data.email}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    return user
+    return model_response(user_encoder, user)
 
 @api_router.post("/users", response_model=User)
 async def create_user(user: User):
-    await db.users.insert_one(user.model_dump())
+    await db.users.insert_one(user.model_dump(mode="json"))
     return user
 
 @api_router.put("/users/{user_id}", response_model=User)
 async def update_user(user_id: str, user_update: Dict[str, Any] = Body(...)):
+    # Validate the would-be profile and store the canonical form of the
+    # model's fields; other keys (e.g. dispatcher settings) pass through
+    current = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if current is not None:
+        try:
+            canonical = user_encoder.canonical({**current, **user_update})
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        user_update = {k: canonical[k] if k in User.model_fields else v for k, v in user_update.items()}
     result = await db.users.update_one({"id": user_id}, {"$set": user_update})
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found or no changes made")
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
     updated_user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    return updated_user
+    return model_response(user_encoder, updated_user)
 
 # Incident Routes
+EXPANDABLE_FIELDS = {"victim", "helpers"}
+
+def parse_expand(expand: Optional[str]) -> set:
+    # Victim profiles stay expanded by default so existing clients keep
+    # working; ?expand=none gives the compact, id-only payload
+    if expand is None:
+        return {"victim"}
+    fields = {f.strip() for f in expand.split(",") if f.strip()} - {"none"}
+    unknown = fields - EXPANDABLE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot expand: {', '.join(sorted(unknown))}")
+    return fields
+
+def referenced_users(incidents: List[Dict[str, Any]], expand: set) -> List[str]:
+    user_ids = {}
+    for incident in incidents:
+        if "victim" in expand and incident.get("victimId"):
+            user_ids[incident["victimId"]] = None
+        if "helpers" in expand:
+            user_ids.update(dict.fromkeys(incident.get("respondingHelpers", [])))
+            user_ids.update(dict.fromkeys(incident.get("arrivedHelpers", [])))
+    return list(user_ids)
+
+async def expand_incidents(incidents: List[Dict[str, Any]], expand: set) -> List[Dict[str, Any]]:
+    # Resolve every user referenced by the batch with a single $in multi-get
+    if not expand or not incidents:
+        return incidents
+    user_ids = referenced_users(incidents, expand)
+    users = await db.users.find({"id": {"$in": user_ids}}, {"_id": 0}).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+
+    expanded = []
+    for incident in incidents:
+        incident = dict(incident)
+        if "victim" in expand:
+            incident["victim"] = users_by_id.get(incident.get("victimId"), incident.get("victim"))
+        if "helpers" in expand:
+            helper_ids = dict.fromkeys(incident.get("respondingHelpers", []) + incident.get("arrivedHelpers", []))
+            incident["helpers"] = [users_by_id[h] for h in helper_ids if h in users_by_id]
+        expanded.append(incident)
+    return expanded
+
 @api_router.get("/incidents", response_model=List[Incident])
-async def get_incidents():
-    incidents = await db.incidents.find({}, {"_id": 0}).to_list(1000)
-    return incidents
+async def get_incidents(
+    request: Request,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    status: Optional[str] = None,
+    incident_type: Optional[str] = Query(None, alias="type"),
+    victim_id: Optional[str] = Query(None, alias="victimId"),
+    helper_id: Optional[str] = Query(None, alias="helperId"),
+    expand: Optional[str] = None,
+):
+    expand_fields = parse_expand(expand)
+    query = {}
+    if status:
+        query["status"] = status
+    if incident_type:
+        query["type"] = incident_type
+    if victim_id:
+        query["victimId"] = victim_id
+    if helper_id:
+        query["respondingHelpers"] = helper_id
+
+    # The page depends on incidents only; the users expanded into it are
+    # checked by their own versions
+    page = await response_cache.value(
+        response_cache.key(request), [db.incidents],
+        lambda: paginate(db.incidents, query, INCIDENT_SORT, limit, after, {"_id": 0}),
+    )
+
+    async def build():
+        incidents, next_cursor = page
+        incidents = await expand_incidents(incidents, expand_fields)
+        return encode_list(incident_encoder, incidents), cursor_headers(next_cursor)
+    depends = user_versions.of(referenced_users(page[0], expand_fields))
+    return await response_cache.respond(request, [db.incidents], build, depends)
 
 @api_router.post("/incidents", response_model=Incident)
 async def create_incident(incident: Incident):
-    # Save incident to database
-    await db.incidents.insert_one(incident.model_dump())
-    
-    # Notify Emergency Contacts (Server-Side Automation)
-    try:
-        victim = incident.victim
-        if victim and victim.emergencyContacts:
-            for contact in victim.emergencyContacts:
-                if contact.phone:
-                    # Construct Message
-                    location_url = f"https://www.google.com/maps?q={incident.location.lat},{incident.location.lng}"
-                    message = f"SOS ALERT! {victim.name} needs help. Type: {incident.type}. Location: {location_url}"
-                    
-                    # 1. Log to Console (Simulation)
-                    print(f"\n[SERVER-SIDE-NOTIFICATION] Sending SMS/WhatsApp to {contact.name} ({contact.phone}):")
-                    print(f"Message: {message}\n")
-                    
-                    # 2. Twilio Integration (Uncomment and add credentials to .env to enable real sending)
-                    # from twilio.rest import Client
-                    # import os
-                    # account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-                    # auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-                    # from_number = os.getenv('TWILIO_PHONE_NUMBER')
-                    # if account_sid and auth_token and from_number:
-                    #     client = Client(account_sid, auth_token)
-                    #     client.messages.create(body=message, from_=from_number, to=contact.phone)
+    victim = incident.victim
+    if victim is None:
+        victim_doc = await db.users.find_one({"id": incident.victimId}, {"_id": 0})
+        if not victim_doc:
+            raise HTTPException(status_code=404, detail="Victim not found")
+        victim = incident.victim = User(**victim_doc)
 
+    # Save incident to database, referencing the victim by id only
+    await db.incidents.insert_one(incident.model_dump(mode="json", exclude={"victim", "helpers"}))
+
+    # Nearby helpers learn of it from the incident stream; the ranked list
+    # is served on demand by GET /incidents/{id}/helpers
+    # Queue alerts for emergency contacts; the outbox workers deliver them
+    # so the SOS request never waits on the SMS provider
+    location_url = f"https://www.google.com/maps?q={incident.location.get('lat')},{incident.location.get('lng')}"
+    message = f"SOS ALERT! {victim.name} needs help. Type: {incident.type}. Location: {location_url}"
+    try:
+        await outbox.enqueue_many([
+            {"to": contact["phone"], "body": message, "incidentId": incident.id}
+            for contact in victim.emergencyContacts if contact.get("phone")
+        ])
     except Exception as e:
-        print(f"Error sending notifications: {e}")
+        logger.error(f"Error queueing notifications: {e}")
 
     return incident
 
+DEFAULT_ALERT_RADIUS_M = 1000
+
+@api_router.get("/incidents/nearby", response_model=List[Incident])
+async def get_nearby_incidents(
+    lat: float,
+    lng: float,
+    radius: Optional[float] = None,
+    user_id: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    expand_fields = parse_expand(expand)
+    # Without an explicit radius, fall back to the responder's own alert radius
+    if radius is None:
+        radius = DEFAULT_ALERT_RADIUS_M
+        if user_id:
+            user = await db.users.find_one({"id": user_id}, {"_id": 0})
+            if user:
+                radius = user.get("preferences", {}).get("alertRadius", radius)
+
+    incidents = await db.incidents.find({
+        "status": "active",
+        "location": {"$near": {"lat": lat, "lng": lng}, "$maxDistance": radius}
+    }, {"_id": 0}).to_list(1000)
+    incidents = await expand_incidents(incidents, expand_fields)
+    return model_response(incident_encoder, [
+        {**incident, "distance": round(haversine_m(lat, lng, incident["location"]["lat"], incident["location"]["lng"]))}
+        for incident in incidents
+    ])
+
+@api_router.get("/incidents/history", response_model=List[Incident])
+async def get_incident_history(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    victim_id: Optional[str] = Query(None, alias="victimId"),
+    type: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    expand: Optional[str] = None,
+):
+    # Opt-in range scan over hot and archived incidents, newest first.
+    # Only the archive segments for the requested days are read.
+    since = parse_timestamp(since) if since else None
+    until = parse_timestamp(until) if until else None
+    query = {}
+    if victim_id:
+        query["victimId"] = victim_id
+    if type:
+        query["type"] = type
+
+    def in_range(incident):
+        ts = parse_timestamp(incident.get("timestamp"))
+        return ts is not None and (since is None or ts >= since) and (until is None or ts < until)
+
+    hot = [i for i in await db.incidents.find(query, {"_id": 0}).to_list(None) if in_range(i)]
+    seen = {incident["id"] for incident in hot}
+    cold = await asyncio.to_thread(
+        lambda: [i for i in incident_archive.scan(since, until, query) if i.get("id") not in seen]
+    )
+    def newest_first(incident):
+        # Undated archived incidents (written before timestamps were
+        # validated) sort last
+        ts = parse_timestamp(incident.get("timestamp"))
+        return (ts is not None, ts or datetime.min.replace(tzinfo=timezone.utc))
+
+    incidents = sorted(hot + cold, key=newest_first, reverse=True)[:limit]
+    return model_response(incident_encoder, await expand_incidents(incidents, parse_expand(expand)))
+
+@api_router.get("/incidents/stream")
+async def stream_incidents(request: Request, lat: Optional[float] = None, lng: Optional[float] = None, radius: Optional[float] = None):
+    # Server-sent events: incident.created carries the full incident,
+    # incident.updated the changed fields and a removedFields list
+    subscription = hub.subscribe(lat, lng, radius)
+    return StreamingResponse(
+        hub.stream(subscription, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @api_router.get("/incidents/{incident_id}", response_model=Incident)
-async def get_incident(incident_id: str):
+async def get_incident(incident_id: str, expand: Optional[str] = None):
     incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
-    return incident
+    return model_response(incident_encoder, (await expand_incidents([incident], parse_expand(expand)))[0])
+
+@api_router.get("/incidents/{incident_id}/helpers")
+async def get_incident_helpers(incident_id: str, limit: Optional[int] = None):
+    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    if not incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    location = incident.get("location") or {}
+    if location.get("lat") is None or location.get("lng") is None:
+        return []
+    ranker = dispatcher
+    if not dispatcher_ready.is_set():
+        # Still warming up: rank the users the geo index finds within the
+        # widest alert radius rather than wait for every user to load
+        ranker = HelperDispatcher()
+        ranker.load(await db.users.find(
+            {"location": {"$near": {"lat": location["lat"], "lng": location["lng"]}, "$maxDistance": MAX_ALERT_RADIUS_M}},
+            {"_id": 0},
+        ).to_list(None))
+    victim_id = incident.get("victimId") or (incident.get("victim") or {}).get("id")
+    return ranker.candidates(
+        location["lat"], location["lng"], incident["type"],
+        exclude={victim_id} if victim_id else (), limit=limit,
+    )
+
+# Helper actions are single atomic updates on the incident, so concurrent
+# responders never overwrite each other's changes
+ARRIVAL_POINTS = 50
+
+async def find_incident_or_404(incident_id: str, expand: Optional[str]) -> Dict[str, Any]:
+    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    if not incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return (await expand_incidents([incident], parse_expand(expand)))[0]
+
+async def ensure_helper_exists(helper_id: str):
+    if not await db.users.find_one({"id": helper_id}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="Helper not found")
+
+@api_router.post("/incidents/{incident_id}/respond", response_model=Incident)
+async def respond_to_incident(incident_id: str, action: HelperAction, expand: Optional[str] = None):
+    await ensure_helper_exists(action.helperId)
+    now = datetime.now(timezone.utc).isoformat()
+    joined = await db.incidents.update_one(
+        {"id": incident_id, "respondingHelpers": {"$ne": action.helperId}},
+        {
+            "$addToSet": {"respondingHelpers": action.helperId},
+            "$set": {f"responseTimes.{action.helperId}.respondedAt": now},
+        },
+    )
+    if joined.modified_count:
+        # Counted once per incident, however often the helper cancels and
+        # responds again
+        counted = await db.incidents.update_one(
+            {"id": incident_id, "countedResponders": {"$ne": action.helperId}},
+            {"$addToSet": {"countedResponders": action.helperId}},
+        )
+        if counted.modified_count:
+            await db.users.update_one({"id": action.helperId}, {"$inc": {"responses": 1}})
+    return model_response(incident_encoder, await find_incident_or_404(incident_id, expand))
+
+@api_router.delete("/incidents/{incident_id}/respond", response_model=Incident)
+async def cancel_response(incident_id: str, helperId: str, expand: Optional[str] = None):
+    await db.incidents.update_one(
+        {"id": incident_id},
+        {
+            # An arrival stays on record (and its bonus is not paid twice)
+            "$pull": {"respondingHelpers": helperId},
+            "$unset": {f"responseTimes.{helperId}.respondedAt": ""},
+        },
+    )
+    return model_response(incident_encoder, await find_incident_or_404(incident_id, expand))
+
+@api_router.post("/incidents/{incident_id}/arrive", response_model=Incident)
+async def arrive_at_incident(incident_id: str, action: HelperAction, expand: Optional[str] = None):
+    await ensure_helper_exists(action.helperId)
+    now = datetime.now(timezone.utc).isoformat()
+    arrived = await db.incidents.update_one(
+        {"id": incident_id, "arrivedHelpers": {"$ne": action.helperId}},
+        {
+            "$addToSet": {"respondingHelpers": action.helperId, "arrivedHelpers": action.helperId},
+            "$set": {f"responseTimes.{action.helperId}.arrivedAt": now},
+        },
+    )
+    if arrived.modified_count:
+        await db.users.update_one({"id": action.helperId}, {"$inc": {"points": ARRIVAL_POINTS}})
+    else:
+        # Arrived before and cancelled since: responding again, no new bonus
+        await db.incidents.update_one({"id": incident_id}, {"$addToSet": {"respondingHelpers": action.helperId}})
+    return model_response(incident_encoder, await find_incident_or_404(incident_id, expand))
+
+@api_router.post("/incidents/{incident_id}/messages")
+async def post_incident_message(incident_id: str, message: ChatMessageCreate):
+    chat_message = {
+        "id": str(uuid.uuid4()),
+        "sender": message.sender,
+        "message": message.message,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    result = await db.incidents.update_one({"id": incident_id}, {"$push": {"chatMessages": chat_message}})
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return chat_message
+
+@api_router.post("/incidents/{incident_id}/resolve", response_model=Incident)
+async def resolve_incident(incident_id: str, expand: Optional[str] = None):
+    await db.incidents.update_one(
+        {"id": incident_id, "status": {"$ne": "resolved"}},
+        {"$set": {"status": "resolved", "resolvedAt": datetime.now(timezone.utc).isoformat()}},
+    )
+    return model_response(incident_encoder, await find_incident_or_404(incident_id, expand))
+
+# Check-ins: the deadline is kept server-side, so a missed check-in
+# escalates even if the user's device goes offline
+async def find_checkin_or_404(checkin_id: str) -> Dict[str, Any]:
+    checkin = await db.checkins.find_one({"id": checkin_id}, {"_id": 0})
+    if not checkin:
+        raise HTTPException(status_code=404, detail="Check-in not found")
+    return checkin
+
+@api_router.post("/checkins", response_model=CheckIn)
+async def start_checkin(request: CheckInCreate):
+    if not await db.users.find_one({"id": request.userId}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="User not found")
+    now = datetime.now(timezone.utc)
+    checkin = CheckIn(
+        userId=request.userId,
+        destination=request.destination,
+        type=request.type,
+        location=request.location,
+        startedAt=now.isoformat(),
+        deadline=(now + timedelta(minutes=request.minutes)).isoformat(),
+    )
+    await db.checkins.insert_one(checkin.model_dump(mode="json"))
+    return checkin
+
+@api_router.get("/checkins/{checkin_id}", response_model=CheckIn)
+async def get_checkin(checkin_id: str):
+    return model_response(checkin_encoder, await find_checkin_or_404(checkin_id))
+
+@api_router.post("/checkins/{checkin_id}/extend", response_model=CheckIn)
+async def extend_checkin(checkin_id: str, request: Optional[CheckInExtend] = None):
+    checkin = await find_checkin_or_404(checkin_id)
+    if checkin["status"] != "active":
+        raise HTTPException(status_code=409, detail=f"Check-in is {checkin['status']}")
+    minutes = (request or CheckInExtend()).minutes
+    deadline = max(parse_timestamp(checkin["deadline"]), datetime.now(timezone.utc)) + timedelta(minutes=minutes)
+    # Conditional on the deadline read above, so it cannot race the expiry
+    # or another extension
+    updated = await db.checkins.find_one_and_update(
+        {"id": checkin_id, "status": "active", "deadline": checkin["deadline"]},
+        {"$set": {"deadline": deadline.isoformat()}},
+        {"_id": 0},
+        return_document=True,
+    )
+    if updated is None:
+        raise HTTPException(status_code=409, detail="Check-in changed, try again")
+    return model_response(checkin_encoder, updated)
+
+@api_router.post("/checkins/{checkin_id}/cancel", response_model=CheckIn)
+async def cancel_checkin(checkin_id: str):
+    await db.checkins.update_one(
+        {"id": checkin_id, "status": "active"},
+        {"$set": {"status": "cancelled", "cancelledAt": datetime.now(timezone.utc).isoformat()}},
+    )
+    return model_response(checkin_encoder, await find_checkin_or_404(checkin_id))
+
+CHECKIN_RETRY_SECONDS = 30
+
+async def escalate_missed_checkins(checkin_ids: List[str]):
+    # Called by the scheduler with each batch of expired timers
+    now = datetime.now(timezone.utc)
+    for checkin_id in checkin_ids:
+        incident_id = str(uuid.uuid4())
+        checkin = await db.checkins.find_one_and_update(
+            {"id": checkin_id, "status": "active", "deadline": {"$lte": now.isoformat()}},
+            {"$set": {"status": "expired", "incidentId": incident_id}},
+            {"_id": 0},
+            return_document=True,
+        )
+        if checkin is None:
+            # Cancelled or extended in the meantime
+            continue
+        location = checkin.get("location")
+        if not location:
+            user = await db.users.find_one({"id": checkin["userId"]}, {"_id": 0, "location": 1})
+            location = (user or {}).get("location") or {}
+        destination = checkin.get("destination")
+        try:
+            await create_incident(Incident(
+                id=incident_id,
+                type=checkin["type"],
+                victimId=checkin["userId"],
+                location=location,
+                description=f"Missed check-in{f' on the way to {destination}' if destination else ''}",
+                timestamp=now.isoformat(),
+                status="active",
+            ))
+            logger.info(f"Check-in {checkin_id} missed; raised incident {incident_id}")
+        except Exception as e:
+            logger.error(f"Error raising incident for missed check-in {checkin_id}: {e}")
+            # Hand the claim back so the SOS is retried, not lost
+            await db.checkins.update_one(
+                {"id": checkin_id, "status": "expired", "incidentId": incident_id},
+                {"$set": {"status": "active"}, "$unset": {"incidentId": ""}},
+            )
+            checkin_scheduler.wheel.arm(checkin_id, time.time() + CHECKIN_RETRY_SECONDS)
+
+# Analytics: answered from the rollups, whatever the number of incidents
+@api_router.get("/analytics/summary")
+async def get_analytics_summary():
+    await analytics.ready.wait()
+    return analytics.summary()
+
+@api_router.get("/analytics/heatmap")
+async def get_analytics_heatmap(limit: int = Query(1000, ge=1, le=100000)):
+    await analytics.ready.wait()
+    return analytics.heatmap(limit)
+
+# Metrics
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/metrics/slow-queries")
+async def get_slow_queries():
+    return list(metrics.slow_queries)
 
 # Leaderboard Route
 @api_router.get("/leaderboard")
-async def get_leaderboard():
-    users = await db.users.find({}, {"_id": 0}).sort("points", -1).limit(10).to_list(10)
-    leaderboard = []
-    for i, user in enumerate(users):
-        leaderboard.append({
-            "rank": i + 1,
-            "user": user,
-            "points": user.get("points", 0),
-            "responses": user.get("responses", 0),
-            "change": "0" # Placeholder logic for change
-        })
-    return leaderboard
+async def get_leaderboard(request: Request):
+    async def build():
+        users = await db.users.find({}, {"_id": 0}).sort("points", -1).limit(10).to_list(10)
+        leaderboard = []
+        for i, user in enumerate(users):
+            leaderboard.append({
+                "rank": i + 1,
+                "user": user,
+                "points": user.get("points", 0),
+                "responses": user.get("responses", 0),
+                "change": "0" # Placeholder logic for change
+            })
+        return json_bytes(leaderboard), None
+    return await response_cache.respond(request, [db.users], build)
+
+@api_router.get("/leaderboard/rank/{user_id}")
+async def get_leaderboard_rank(user_id: str):
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "points": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    points = user.get("points", 0)
+    # Competition ranking: 1 + number of users with strictly more points;
+    # served from the ordered points index without scanning users
+    ahead = await db.users.count_documents({"points": {"$gt": points}})
+    return {
+        "userId": user_id,
+        "rank": ahead + 1,
+        "points": points,
+        "total": await db.users.count_documents({}),
+    }
 
 # Include the router
 app.include_router(api_router)
 
+# Innermost, so shed responses still get CORS headers and are timed.
+# TRUSTED_PROXIES (comma-separated addresses/CIDRs) are the peers whose
+# X-Forwarded-For is believed for per-client rate limits.
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    trusted_proxies=os.environ.get('TRUSTED_PROXIES', '').split(','),
+)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -233,8 +848,11 @@ app.add_middleware(
     allow_origins=["*"], # Allow all for now to ensure connectivity
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -242,12 +860,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+dispatcher_ready = asyncio.Event()
+dispatcher_warmup = None
+analytics_backfill = None
+db_sync = None
+
+async def sync_shared_db(interval):
+    # Writes made by other worker processes reach this one's listeners (SSE
+    # streams, dispatcher) even while it serves no requests
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            db.sync()
+        except Exception as e:
+            logger.error(f"Error syncing shared database: {e}")
+
+async def warm_dispatcher():
+    start = time.perf_counter()
+    try:
+        async for user in db.users.find({}):
+            try:
+                dispatcher.upsert(user)
+            except Exception as e:
+                logger.error(f"Skipping user {user.get('id')} in dispatcher: {e}")
+        logger.info(f"Dispatcher loaded in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logger.error(f"Error loading dispatcher: {e}")
+    finally:
+        # Always set, so nothing is left waiting on a failed load
+        dispatcher_ready.set()
+
 # Seed Data on Startup
-@app.on_event("startup")
-async def startup_db_client():
+async def prepare_data():
     try:
         # Check if users exist
-        if await db.users.count_documents({}) == 0:
+        synthetic_users = int(os.environ.get('SEED_USERS', '0'))
+        if synthetic_users and await db.users.count_documents({}) == 0:
+            # Production-scale synthetic dataset instead of the demo users
+            logger.info(f"Seeding {synthetic_users} synthetic users...")
+            await seed_synthetic(
+                db, synthetic_users, int(os.environ.get('SEED_INCIDENTS', '0')),
+                seed=int(os.environ.get('SEED', '0')), log=logger.info,
+            )
+        elif await db.users.count_documents({}) == 0:
             logger.info("Seeding users...")
             mock_users = get_mock_users()
             await db.users.insert_many(mock_users)
@@ -260,6 +915,56 @@ async def startup_db_client():
     except Exception as e:
         logger.error(f"Error seeding database: {e}")
 
+    # Older incidents embedded the whole victim profile; store the id instead
+    # (they have no victimId, so the victimId index finds them without a scan)
+    legacy = await db.incidents.find(
+        {"victimId": None, "victim": {"$exists": True}}, {"_id": 0, "id": 1, "victim.id": 1}
+    ).to_list(None)
+    for incident in legacy:
+        await db.incidents.update_one(
+            {"id": incident["id"]},
+            {"$set": {"victimId": (incident.get("victim") or {}).get("id")}, "$unset": {"victim": ""}},
+        )
+    if legacy:
+        logger.info(f"Normalized {len(legacy)} incidents to victimId references")
+
+@app.on_event("startup")
+async def startup_db_client():
+    await create_indexes(db)
+    # With several workers on a shared database only one of them seeds,
+    # migrates, recovers pending notifications, archives and runs the
+    # check-in timers
+    engine = getattr(db, 'engine', None)
+    primary = engine is None or engine.primary()
+    if primary:
+        await prepare_data()
+    else:
+        logger.info("Shared database: startup jobs run in another worker")
+
+    # The helper index fills in the background so startup does not wait on
+    # reading every user; dispatching waits for it instead
+    global dispatcher_warmup, analytics_backfill, db_sync
+    dispatcher.attach(db.users)
+    dispatcher_warmup = asyncio.create_task(warm_dispatcher())
+    db.incidents.add_listener(hub.incident_listener)
+    analytics.attach(db.incidents)
+    analytics_backfill = asyncio.create_task(analytics.backfill(db.incidents, incident_archive))
+    if getattr(db, 'shared', False):
+        db_sync = asyncio.create_task(sync_shared_db(float(os.environ.get('DB_SYNC_INTERVAL', '0.2'))))
+    admission.start()
+    await outbox.start(recover=primary)
+    if primary:
+        archiver.start()
+        await checkin_scheduler.start(escalate_missed_checkins)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in (dispatcher_warmup, analytics_backfill, db_sync):
+        if task is not None:
+            task.cancel()
+    await admission.stop()
+    await archiver.stop()
+    await checkin_scheduler.stop()
+    await location_ingestor.stop()
+    await outbox.stop()
     client.close()
@@ -0,0 +1,301 @@
+import array
+import json
+import mmap
+import os
+import pickle
+import struct
+
+MAGIC = b'SCSNAP01'
+# magic, token, row count, then the start of each section
+_HEADER = struct.Struct('<8s16sQQQQQQ')
+
+_MISSING = object()
+
+
+def _encode_id(_id):
+    return json.dumps(_id).encode()
+
+
+def _decode_id(data):
+    # Plain string _ids (the common case) skip the JSON parser
+    if data[:1] == b'"' and b'\\' not in data:
+        return data[1:-1].decode()
+    return json.loads(data)
+
+
+def _encode_doc(doc):
+    return json.dumps(doc, separators=(',', ':'), default=str).encode()
+
+
+def write_collection(path, token, rows):
+    """Write ``(id bytes, document bytes)`` rows as one snapshot file.
+
+    Layout after the fixed header: the document blob, the _id blob, then
+    three uint64 arrays -- document offsets, _id offsets, and the row
+    numbers in _id order used for binary search.
+    """
+    doc_offsets = array.array('Q', [0])
+    ids = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * _HEADER.size)
+        docs_start = f.tell()
+        for id_bytes, doc_bytes in rows:
+            f.write(doc_bytes)
+            doc_offsets.append(doc_offsets[-1] + len(doc_bytes))
+            ids.append(id_bytes)
+
+        ids_start = f.tell()
+        id_offsets = array.array('Q', [0])
+        for id_bytes in ids:
+            f.write(id_bytes)
+            id_offsets.append(id_offsets[-1] + len(id_bytes))
+        f.write(b'\0' * (-f.tell() % 8))
+
+        doc_offsets_start = f.tell()
+        f.write(doc_offsets.tobytes())
+        id_offsets_start = f.tell()
+        f.write(id_offsets.tobytes())
+        order_start = f.tell()
+        f.write(array.array('Q', sorted(range(len(ids)), key=ids.__getitem__)).tobytes())
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, token, len(ids), docs_start, ids_start,
+                             doc_offsets_start, id_offsets_start, order_start))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class SnapshotReader:
+    """Memory-mapped view of one collection snapshot file.
+
+    Opening costs a header read regardless of size; documents are only
+    decoded when asked for, and _ids are found by binary search.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.token, self.count, self._docs_start, self._ids_start,
+         doc_offsets_start, id_offsets_start, order_start) = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        view = memoryview(self._mm)
+        n = self.count
+        self._doc_offsets = view[doc_offsets_start:doc_offsets_start + 8 * (n + 1)].cast('Q')
+        self._id_offsets = view[id_offsets_start:id_offsets_start + 8 * (n + 1)].cast('Q')
+        self._order = view[order_start:order_start + 8 * n].cast('Q')
+
+    def __len__(self):
+        return self.count
+
+    def id_bytes(self, row):
+        return self._mm[self._ids_start + self._id_offsets[row]:self._ids_start + self._id_offsets[row + 1]]
+
+    def id(self, row):
+        return _decode_id(self.id_bytes(row))
+
+    def raw(self, row):
+        return self._mm[self._docs_start + self._doc_offsets[row]:self._docs_start + self._doc_offsets[row + 1]]
+
+    def doc(self, row):
+        return json.loads(self.raw(row).decode())
+
+    def find(self, _id):
+        # Row holding _id, or -1
+        try:
+            key = _encode_id(_id)
+        except TypeError:
+            return -1
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.id_bytes(self._order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.id_bytes(self._order[lo]) == key:
+            return self._order[lo]
+        return -1
+
+
+class SnapshotDocuments:
+    """The ``{_id: document}`` mapping of a collection backed by a snapshot.
+
+    Snapshot rows are decoded on first access and kept in an overlay that
+    also holds every document written since the snapshot was taken.
+    Iterating over all values decodes the remaining rows once, after which
+    the overlay is a plain dict in snapshot order.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._docs = {}
+        self._gone = set()
+        self._complete = False
+        self._count = len(reader)
+
+    def _row(self, _id):
+        if self._complete or _id in self._gone:
+            return -1
+        return self.reader.find(_id)
+
+    def snapshot_doc(self, _id):
+        # The version of _id stored in the snapshot, freshly decoded
+        row = self.reader.find(_id)
+        return self.reader.doc(row) if row >= 0 else None
+
+    def get(self, _id, default=None):
+        doc = self._docs.get(_id, _MISSING)
+        if doc is not _MISSING:
+            return doc
+        row = self._row(_id)
+        if row < 0:
+            return default
+        doc = self._docs[_id] = self.reader.doc(row)
+        return doc
+
+    def __getitem__(self, _id):
+        doc = self.get(_id, _MISSING)
+        if doc is _MISSING:
+            raise KeyError(_id)
+        return doc
+
+    def __contains__(self, _id):
+        return _id in self._docs or self._row(_id) >= 0
+
+    def __setitem__(self, _id, doc):
+        if _id not in self:
+            self._count += 1
+        self._docs[_id] = doc
+
+    def __delitem__(self, _id):
+        if _id not in self:
+            raise KeyError(_id)
+        self._docs.pop(_id, None)
+        self._gone.add(_id)
+        self._count -= 1
+
+    def pop(self, _id, default=None):
+        doc = self.get(_id, _MISSING)
+        if doc is _MISSING:
+            return default
+        del self[_id]
+        return doc
+
+    def __len__(self):
+        return self._count
+
+    def _materialize(self):
+        if self._complete:
+            return
+        docs = {}
+        for row in range(len(self.reader)):
+            _id = self.reader.id(row)
+            if _id in self._gone:
+                continue
+            doc = self._docs.get(_id, _MISSING)
+            docs[_id] = self.reader.doc(row) if doc is _MISSING else doc
+        for _id, doc in self._docs.items():
+            docs.setdefault(_id, doc)
+        self._docs = docs
+        self._gone = set()
+        self._complete = True
+
+    def values(self):
+        self._materialize()
+        return self._docs.values()
+
+    def keys(self):
+        self._materialize()
+        return self._docs.keys()
+
+    def items(self):
+        self._materialize()
+        return self._docs.items()
+
+    def __iter__(self):
+        # _ids only, leaving the documents undecoded
+        if self._complete:
+            return iter(self._docs)
+        return self._ids()
+
+    def _ids(self):
+        for row in range(len(self.reader)):
+            _id = self.reader.id(row)
+            if _id not in self._gone:
+                yield _id
+        for _id in self._docs:
+            if _id in self._gone or self.reader.find(_id) < 0:
+                yield _id
+
+    def stable_values(self):
+        # Current version of each document, decoded when the iteration gets
+        # to it; documents deleted meanwhile are skipped, so it is safe to
+        # consume while the collection changes
+        if self._complete:
+            yield from filter(None, map(self._docs.get, list(self._docs)))
+            return
+        added = [_id for _id in self._docs if _id in self._gone or self.reader.find(_id) < 0]
+        for row in range(len(self.reader)):
+            _id = self.reader.id(row)
+            doc = self._docs.get(_id)
+            if doc is None and not self._complete and _id not in self._gone:
+                doc = self._docs[_id] = self.reader.doc(row)
+            if doc is not None:
+                yield doc
+        yield from filter(None, map(self._docs.get, added))
+
+    def raw_items(self):
+        # (id bytes, document bytes) for every live document. Rows that were
+        # never decoded are copied from the snapshot without parsing them.
+        if self._complete:
+            for _id, doc in self._docs.items():
+                yield _encode_id(_id), _encode_doc(doc)
+            return
+        for row in range(len(self.reader)):
+            id_bytes = self.reader.id_bytes(row)
+            _id = _decode_id(id_bytes)
+            if _id in self._gone:
+                continue
+            doc = self._docs.get(_id, _MISSING)
+            yield id_bytes, self.reader.raw(row) if doc is _MISSING else _encode_doc(doc)
+        for _id, doc in self._docs.items():
+            if _id in self._gone or self.reader.find(_id) < 0:
+                yield _encode_id(_id), _encode_doc(doc)
+
+
+def raw_items(docs):
+    if isinstance(docs, SnapshotDocuments):
+        return docs.raw_items()
+    return ((_encode_id(_id), _encode_doc(doc)) for _id, doc in docs.items())
+
+
+class PersistedIndex:
+    """An index saved next to a snapshot: its definition, then its state.
+
+    The file is opened up front so it stays readable after a later
+    compaction removes it; the state is only unpickled by load().
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self.spec = pickle.load(self._file)
+
+    def load(self):
+        try:
+            return pickle.load(self._file)
+        finally:
+            self._file.close()
+
+
+def write_index(path, spec, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
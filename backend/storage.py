@@ -0,0 +1,331 @@
+"""Storage backends behind the Motor-style collection API the app uses.
+
+``connect(url)`` picks the backend from the URL scheme:
+
+- ``mock://`` (default): MockDatabase with its snapshot + log engine
+- ``sqlite:///path/to/file.db``: MockDatabase persisted to SQLite tables;
+  the one to use with several worker processes (see SQLiteEngine's
+  shared mode)
+- ``mongodb://`` / ``mongodb+srv://``: MongoDB through Motor
+
+All of them provide what the app relies on beyond plain Motor: write
+listeners (change events) and a per-collection ``version`` counter. For
+MongoDB both are kept by this process for its own writes only.
+"""
+import logging
+import os
+
+import geo
+from mock_db import INDEXES, InsertOne, MockClient, UpdateMany, UpdateOne, compile_projection, compile_query, get_path
+from persistence import SQLiteEngine
+
+logger = logging.getLogger(__name__)
+
+
+def connect(url=None):
+    url = url or 'mock://'
+    scheme = url.split('://', 1)[0]
+    if scheme == 'mock':
+        if int(os.environ.get('WEB_CONCURRENCY', '1')) > 1:
+            logger.warning("mock:// is private to each worker process; use a sqlite:/// URL with several workers")
+        return MockClient(url)
+    if scheme == 'sqlite':
+        return MockClient(url, engine=SQLiteEngine.from_env(url[len('sqlite:///'):]))
+    if scheme in ('mongodb', 'mongodb+srv'):
+        try:
+            return MotorStorage(url)
+        except Exception as e:
+            # DB_FALLBACK=none makes an unreachable server fatal instead
+            if os.environ.get('DB_FALLBACK', 'mock') != 'mock':
+                raise
+            logger.error(f"MongoDB health check failed ({e}); falling back to the mock database")
+            return MockClient(url)
+    raise ValueError(f"Unsupported database URL scheme: {scheme}")
+
+
+async def create_indexes(db):
+    # Idempotent; backends skip indexes that already exist
+    for name, keys in INDEXES:
+        await db[name].create_index(keys)
+
+
+def pool_options():
+    # Bounded pool sized for one API process; a full pool makes callers wait
+    # at most waitQueueTimeoutMS instead of queueing without limit
+    env = os.environ.get
+    return {
+        'maxPoolSize': int(env('MONGO_MAX_POOL_SIZE', '100')),
+        'minPoolSize': int(env('MONGO_MIN_POOL_SIZE', '10')),
+        'maxIdleTimeMS': int(env('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        'waitQueueTimeoutMS': int(env('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+        'serverSelectionTimeoutMS': int(env('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(env('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        'retryWrites': True,
+    }
+
+
+def _command_listener(observers):
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        # Reports each command to the database observers, like
+        # MockDatabase does for its operations
+        def __init__(self):
+            self.started = {}
+
+        def _finish(self, event):
+            started = self.started.pop(event.request_id, None)
+            if started is None:
+                return
+            collection, query = started
+            for observe in observers:
+                observe(collection, event.command_name, query, event.duration_micros / 1e6, 0, 0)
+
+        def started(self, event):
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                self.started[event.request_id] = (collection, event.command.get('filter'))
+
+        def succeeded(self, event):
+            self._finish(event)
+
+        def failed(self, event):
+            self._finish(event)
+
+    return CommandTimer()
+
+
+class MotorStorage:
+    def __init__(self, url):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import MongoClient
+
+        options = pool_options()
+        # Startup health check on a short-lived synchronous client, so a
+        # bad URL fails here rather than on the first request
+        probe = MongoClient(url, serverSelectionTimeoutMS=options['serverSelectionTimeoutMS'])
+        try:
+            probe.admin.command('ping')
+        finally:
+            probe.close()
+        self.observers = []
+        self.client = AsyncIOMotorClient(url, event_listeners=[_command_listener(self.observers)], **options)
+        self._databases = {}
+        logger.info(f"Connected to MongoDB (pool {options['minPoolSize']}-{options['maxPoolSize']})")
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = MotorDatabase(self.client[name], self.observers)
+        return self._databases[name]
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def close(self):
+        self.client.close()
+
+
+class MotorDatabase:
+    # Not persisted by this process and never a shared SQLite file; keeps
+    # server.py from mistaking `engine` or `shared` for collection names
+    engine = None
+    shared = False
+
+    def __init__(self, database, observers):
+        self.database = database
+        self.observers = observers
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MotorCollection(self.database[name])
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+
+def _updated_fields(update, doc):
+    fields = {}
+    for op, spec in update.items():
+        if op != '$unset':
+            for path in spec:
+                fields[path] = get_path(doc, path)
+    return fields
+
+
+class MotorCollection:
+    """A Motor collection with MockCollection's listeners and version.
+
+    Updates that need a change event fetch the post-image in the same
+    round trip (find_one_and_update); bulk and multi-document writes
+    re-read the documents they touched.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.listeners = []
+        self.version = 0
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _notify(self, event):
+        self.version += 1
+        for callback in self.listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error in {self.name} listener: {e}")
+
+    def _updated(self, doc, update):
+        self._notify({
+            'operationType': 'update',
+            'documentKey': {'_id': doc['_id']},
+            'fullDocument': doc,
+            'updateDescription': {
+                'updatedFields': _updated_fields(update, doc),
+                'removedFields': list(update.get('$unset', ())),
+            },
+        })
+
+    def _deleted(self, doc):
+        self._notify({'operationType': 'delete', 'documentKey': {'_id': doc['_id']}, 'fullDocument': doc})
+
+    async def create_index(self, keys, **kwargs):
+        # Stored locations are {lat, lng} sub-documents, which a 2dsphere
+        # index rejects; radius queries use a compound lat/lng index instead
+        if not isinstance(keys, str):
+            keys = [
+                pair for field, direction in keys
+                for pair in ([(f"{field}.lat", 1), (f"{field}.lng", 1)] if direction in ('2dsphere', '2d') else [(field, direction)])
+            ]
+        return await self.collection.create_index(keys, **kwargs)
+
+    def find(self, query=None, projection=None):
+        query = query or {}
+        for field, cond in query.items():
+            if isinstance(cond, dict) and ('$near' in cond or '$nearSphere' in cond):
+                return NearCursor(self.collection, query, field, projection)
+        return self.collection.find(query, projection)
+
+    async def insert_one(self, document):
+        result = await self.collection.insert_one(document)
+        self._notify({'operationType': 'insert', 'documentKey': {'_id': document['_id']}, 'fullDocument': document})
+        return result
+
+    async def insert_many(self, documents):
+        documents = list(documents)
+        result = await self.collection.insert_many(documents)
+        for document in documents:
+            self._notify({'operationType': 'insert', 'documentKey': {'_id': document['_id']}, 'fullDocument': document})
+        return result
+
+    async def update_one(self, query, update):
+        from pymongo import ReturnDocument
+        from pymongo.results import UpdateResult
+
+        doc = await self.collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if doc is None:
+            return UpdateResult({'n': 0, 'nModified': 0}, True)
+        self._updated(doc, update)
+        return UpdateResult({'n': 1, 'nModified': 1}, True)
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=False):
+        from pymongo import ReturnDocument
+
+        before = await self.collection.find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+        if before is None:
+            return None
+        after = await self.collection.find_one({'_id': before['_id']})
+        if after is not None:
+            self._updated(after, update)
+        result = after if return_document and after is not None else before
+        project = compile_projection(projection)
+        return project(result) if project else result
+
+    async def update_many(self, query, update):
+        ids = [doc['_id'] async for doc in self.collection.find(query, {'_id': 1})]
+        result = await self.collection.update_many({'$and': [query, {'_id': {'$in': ids}}]}, update)
+        async for doc in self.collection.find({'_id': {'$in': ids}}):
+            self._updated(doc, update)
+        return result
+
+    async def bulk_write(self, requests, ordered=True):
+        # Takes the mock_db request classes the app builds (pymongo's own
+        # pass through, without change events)
+        import pymongo
+
+        converted = []
+        for request in requests:
+            if isinstance(request, InsertOne):
+                request = pymongo.InsertOne(request.document)
+            elif isinstance(request, UpdateOne):
+                kind = pymongo.UpdateMany if isinstance(request, UpdateMany) else pymongo.UpdateOne
+                request = kind(request.filter, request.update)
+            converted.append(request)
+        result = await self.collection.bulk_write(converted, ordered=ordered)
+        for request in requests:
+            if isinstance(request, InsertOne):
+                doc = request.document
+                self._notify({'operationType': 'insert', 'documentKey': {'_id': doc.get('_id')}, 'fullDocument': doc})
+            elif isinstance(request, UpdateOne) and self.listeners:
+                async for doc in self.collection.find(request.filter):
+                    self._updated(doc, request.update)
+            else:
+                self.version += 1
+        return result
+
+    async def delete_one(self, query):
+        from pymongo.results import DeleteResult
+
+        doc = await self.collection.find_one_and_delete(query)
+        if doc is not None:
+            self._deleted(doc)
+        return DeleteResult({'n': int(doc is not None)}, True)
+
+    async def delete_many(self, query):
+        docs = await self.collection.find(query).to_list(None)
+        result = await self.collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        for doc in docs:
+            self._deleted(doc)
+        return result
+
+
+class NearCursor:
+    # Mongo's $near needs GeoJSON, but locations are stored as {lat, lng}:
+    # fetch the bounding box through the lat/lng index, then apply the exact
+    # condition and order by distance like the mock backend does
+    def __init__(self, collection, query, field, projection=None):
+        self.collection = collection
+        self.query = query
+        self.field = field
+        self.projection = projection
+
+    async def to_list(self, length):
+        cond = self.query[self.field]
+        center = geo.point(cond.get('$near', cond.get('$nearSphere')))
+        max_d = cond.get('$maxDistance')
+        if center is None or max_d is None:
+            raise ValueError("$near on MongoDB needs a {lat, lng} point and $maxDistance")
+        lat0, lng0, lat1, lng1 = geo.bounding_box(center[0], center[1], max_d)
+        query = {k: v for k, v in self.query.items() if k != self.field}
+        query[f"{self.field}.lat"] = {'$gte': lat0, '$lte': lat1}
+        query[f"{self.field}.lng"] = {'$gte': lng0, '$lte': lng1}
+        match = compile_query({self.field: cond})
+        docs = [doc async for doc in self.collection.find(query) if match(doc)]
+        docs.sort(key=lambda doc: geo.haversine_m(*center, *geo.point(get_path(doc, self.field))))
+        if length:
+            docs = docs[:length]
+        project = compile_projection(self.projection)
+        return [project(doc) for doc in docs] if project else docs
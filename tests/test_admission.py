@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from admission import AdmissionController, AdmissionMiddleware, _Shed  # noqa: E402
+
+
+def scope(path='/api/status', method='GET', peer='10.0.0.5', forwarded=None):
+    headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded else []
+    return {'type': 'http', 'method': method, 'path': path, 'client': (peer, 1234), 'headers': headers}
+
+
+async def call(middleware, scope):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), json.loads(sent[1]['body'])
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def test_classify(self):
+        controller = AdmissionController()
+        self.assertEqual(controller.classify('POST', '/api/incidents'), 'critical')
+        self.assertEqual(controller.classify('POST', '/api/incidents/i1/respond'), 'critical')
+        self.assertEqual(controller.classify('GET', '/api/incidents/'), 'low')
+        self.assertEqual(controller.classify('GET', '/api/incidents/stream'), None)
+        self.assertEqual(controller.classify('POST', '/api/users'), 'normal')
+
+    def test_low_priority_is_shed_when_over_capacity(self):
+        controller = AdmissionController(max_concurrency=1, target_latency=0.05, client_rate=0)
+
+        async def run():
+            await controller.acquire('low', 'a')
+            with self.assertRaises(_Shed) as shed:
+                await controller.acquire('low', 'b')
+            self.assertEqual(shed.exception.status, 503)
+            self.assertGreaterEqual(shed.exception.retry_after, 1)
+            self.assertEqual(controller.queued(), 0)
+            # A critical request waits for the slot instead
+            critical = asyncio.create_task(controller.acquire('critical', 'c'))
+            await asyncio.sleep(0.1)
+            self.assertFalse(critical.done())
+            controller.release()
+            await critical
+            self.assertEqual(controller.in_flight, 1)
+            controller.release()
+            self.assertEqual(controller.in_flight, 0)
+
+        asyncio.run(run())
+
+    def test_low_priority_is_shed_on_event_loop_lag(self):
+        controller = AdmissionController(target_latency=0.05, max_wait=1.0, client_rate=0)
+
+        async def run():
+            controller.lag = 0.2
+            with self.assertRaises(_Shed):
+                await controller.acquire('low', 'a')
+            await controller.acquire('normal', 'a')
+            await controller.acquire('critical', 'a')
+            self.assertEqual(controller.in_flight, 2)
+
+        asyncio.run(run())
+
+    def test_critical_overtakes_queued_requests(self):
+        controller = AdmissionController(max_concurrency=1, target_latency=5, max_wait=5, client_rate=0)
+        order = []
+
+        async def request(priority, name):
+            await controller.acquire(priority, name)
+            order.append(name)
+
+        async def run():
+            await controller.acquire('critical', 'first')
+            tasks = [asyncio.create_task(request('low', 'low')),
+                     asyncio.create_task(request('normal', 'normal'))]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(request('critical', 'sos')))
+            await asyncio.sleep(0)
+            for _ in range(3):
+                controller.release()
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        self.assertEqual(order, ['sos', 'normal', 'low'])
+
+    def test_full_queue_sheds(self):
+        controller = AdmissionController(max_concurrency=1, queue_sizes={'critical': 1}, client_rate=0)
+
+        async def run():
+            await controller.acquire('critical', 'a')
+            waiting = asyncio.create_task(controller.acquire('critical', 'b'))
+            await asyncio.sleep(0)
+            with self.assertRaises(_Shed) as shed:
+                await controller.acquire('critical', 'c')
+            self.assertEqual(shed.exception.status, 503)
+            controller.release()
+            await waiting
+
+        asyncio.run(run())
+
+    def test_per_client_rate_limit(self):
+        controller = AdmissionController(client_rate=1, client_burst=2)
+
+        async def run():
+            for _ in range(2):
+                await controller.acquire('low', 'a')
+            with self.assertRaises(_Shed) as shed:
+                await controller.acquire('low', 'a')
+            self.assertEqual((shed.exception.status, shed.exception.retry_after), (429, 1))
+            # Other clients and critical requests are not limited
+            await controller.acquire('low', 'b')
+            await controller.acquire('critical', 'a')
+
+        asyncio.run(run())
+
+
+class AdmissionMiddlewareTest(unittest.TestCase):
+    def middleware(self, controller=None, trusted_proxies=()):
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'{"ok": true}'})
+
+        return AdmissionMiddleware(app, controller or AdmissionController(), trusted_proxies)
+
+    def test_client_ignores_forwarded_for_from_untrusted_peers(self):
+        middleware = self.middleware(trusted_proxies=['10.0.0.0/24'])
+        self.assertEqual(middleware.client(scope(peer='203.0.113.9', forwarded='1.2.3.4')), '203.0.113.9')
+        self.assertEqual(self.middleware().client(scope(forwarded='1.2.3.4')), '10.0.0.5')
+
+    def test_client_uses_the_nearest_untrusted_hop(self):
+        middleware = self.middleware(trusted_proxies=['10.0.0.0/24', '192.168.1.1'])
+        # The left-most entry is whatever the client sent
+        self.assertEqual(middleware.client(scope(forwarded='6.6.6.6, 198.51.100.7, 192.168.1.1')), '198.51.100.7')
+        self.assertEqual(middleware.client(scope(forwarded='198.51.100.7')), '198.51.100.7')
+        # Only trusted hops, or no header: fall back to the peer
+        self.assertEqual(middleware.client(scope(forwarded='10.0.0.7')), '10.0.0.5')
+        self.assertEqual(middleware.client(scope()), '10.0.0.5')
+        self.assertEqual(middleware.client({'headers': []}), 'unknown')
+
+    def test_shed_response(self):
+        controller = AdmissionController(client_rate=1, client_burst=1)
+        middleware = self.middleware(controller, trusted_proxies=['10.0.0.0/24'])
+
+        async def run():
+            first = await call(middleware, scope(forwarded='198.51.100.7'))
+            second = await call(middleware, scope(forwarded='198.51.100.7'))
+            other = await call(middleware, scope(forwarded='198.51.100.8'))
+            return first, second, other
+
+        first, second, other = asyncio.run(run())
+        self.assertEqual(first[0], 200)
+        self.assertEqual(second[0], 429)
+        self.assertEqual(second[1][b'retry-after'], b'1')
+        self.assertEqual(second[2], {'detail': 'rate limit exceeded'})
+        self.assertEqual(other[0], 200)
+        self.assertEqual(controller.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
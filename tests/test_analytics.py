@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from analytics import IncidentAnalytics  # noqa: E402
+from archive import SegmentArchive  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+def incident(i, **fields):
+    return {
+        'id': f'incident-{i}', 'type': 'medical', 'status': 'resolved',
+        'timestamp': '2026-01-01T10:00:00+00:00', 'location': {'lat': 40.7, 'lng': -74.0},
+        'respondingHelpers': ['h1'], 'arrivedHelpers': ['h1'],
+        'responseTimes': {'h1': {'respondedAt': '2026-01-01T10:01:00+00:00', 'arrivedAt': '2026-01-01T10:05:00+00:00'}},
+        **fields,
+    }
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = SegmentArchive(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_empty_hot_collection_counts_archive(self):
+        self.archive.append([incident(i) for i in range(3)])
+        analytics = IncidentAnalytics()
+        db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        asyncio.run(analytics.backfill(db.incidents, self.archive))
+        db.close()
+
+        summary = analytics.summary()
+        self.assertEqual(summary['total'], 3)
+        self.assertEqual(summary['byType'], {'medical': 3})
+        self.assertEqual(summary['byHour'][10], 3)
+        self.assertEqual(summary['helpers']['arrived'], 3)
+        self.assertEqual(summary['helpers']['meanResponseSeconds'], 60.0)
+        self.assertEqual(summary['helpers']['meanArrivalSeconds'], 300.0)
+        self.assertEqual(sum(cell['count'] for cell in analytics.heatmap()['cells']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
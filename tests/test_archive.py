@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from archive import IncidentArchiver, SegmentArchive  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+DAY = timedelta(days=1)
+
+
+class IncidentArchiverTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.archive = SegmentArchive(os.path.join(self.dir.name, 'archive'))
+        self.archiver = IncidentArchiver(self.db.incidents, self.archive, retention=DAY, interval=60)
+        self.old = (datetime.now(timezone.utc) - 3 * DAY).isoformat()
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def run_once(self):
+        return asyncio.run(self.archiver.run_once())
+
+    def test_null_resolved_at_archived_once(self):
+        # POST /api/incidents stores resolvedAt: null; the timestamp decides
+        asyncio.run(self.db.incidents.insert_many([
+            {'id': f'i{i}', 'status': 'resolved', 'resolvedAt': None, 'timestamp': self.old} for i in range(2)
+        ]))
+        self.assertEqual([self.run_once() for _ in range(3)], [2, 0, 0])
+        self.assertEqual(asyncio.run(self.db.incidents.count_documents({})), 0)
+        self.assertEqual(sorted(doc['id'] for doc in self.archive.scan()), ['i0', 'i1'])
+
+    def test_reopened_during_archive_is_kept(self):
+        asyncio.run(self.db.incidents.insert_many([
+            {'id': 'kept', 'status': 'resolved', 'resolvedAt': self.old, 'timestamp': self.old},
+            {'id': 'gone', 'status': 'resolved', 'resolvedAt': self.old, 'timestamp': self.old},
+        ]))
+        append = self.archive.append
+        loop = None
+
+        def reopen_while_appending(docs):
+            append(docs)
+            reopen = self.db.incidents.update_one({'id': 'kept'}, {'$set': {'status': 'active'}})
+            asyncio.run_coroutine_threadsafe(reopen, loop).result()
+
+        async def run():
+            nonlocal loop
+            loop = asyncio.get_running_loop()
+            await self.archiver.run_once()
+
+        self.archive.append = reopen_while_appending
+        asyncio.run(run())
+        remaining = asyncio.run(self.db.incidents.find({}, {'_id': 0, 'id': 1}).to_list(None))
+        self.assertEqual(remaining, [{'id': 'kept'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import DuplicateKeyError, InsertOne, MockDatabase, UpdateMany, UpdateOne  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+class BulkWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'db.json')
+        self.db = MockDatabase(PersistenceEngine(self.path))
+        self.users = self.db.users
+        self.users.ensure_index('phone', unique=True)
+        asyncio.run(self.users.insert_many([
+            {'id': 'u1', 'phone': '1', 'level': 1},
+            {'id': 'u2', 'phone': '2', 'level': 1},
+        ]))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def requests(self):
+        return [
+            InsertOne({'id': 'u3', 'phone': '3', 'level': 1}),
+            UpdateOne({'id': 'u1'}, {'$set': {'level': 2}}),
+            InsertOne({'id': 'dup', 'phone': '2', 'level': 1}),
+            UpdateOne({'id': 'u2'}, {'$set': {'phone': '1'}}),
+            UpdateMany({'level': 1}, {'$inc': {'level': 10}}),
+            InsertOne({'id': 'u4', 'phone': '4', 'level': 1}),
+        ]
+
+    def levels(self, db=None):
+        docs = asyncio.run((db or self.db).users.find({}, {'_id': 0}).to_list(None))
+        return {d['id']: (d['phone'], d['level']) for d in docs}
+
+    def reopen(self):
+        self.db.close()
+        self.db = MockDatabase(PersistenceEngine(self.path))
+        return self.levels()
+
+    def test_ordered_stops_at_the_first_error(self):
+        with self.assertRaises(DuplicateKeyError):
+            asyncio.run(self.users.bulk_write(self.requests()))
+        expected = {'u1': ('1', 2), 'u2': ('2', 1), 'u3': ('3', 1)}
+        self.assertEqual(self.levels(), expected)
+        # Operations applied before the error were logged
+        self.assertEqual(self.reopen(), expected)
+
+    def test_unordered_skips_failing_operations(self):
+        result = asyncio.run(self.users.bulk_write(self.requests(), ordered=False))
+        self.assertEqual(result.inserted_count, 2)
+        # u1, then u2 and u3 for UpdateMany; the failed update is not counted
+        self.assertEqual(result.matched_count, 3)
+        self.assertEqual(result.modified_count, 3)
+        expected = {'u1': ('1', 2), 'u2': ('2', 11), 'u3': ('3', 11), 'u4': ('4', 1)}
+        self.assertEqual(self.levels(), expected)
+        self.assertEqual(self.reopen(), expected)
+        self.assertEqual([d['id'] for d in asyncio.run(self.db.users.find({'phone': '1'}).to_list(None))], ['u1'])
+
+    def test_ordered_without_errors_applies_everything(self):
+        result = asyncio.run(self.users.bulk_write([
+            InsertOne({'id': 'u3', 'phone': '3'}),
+            UpdateMany({}, {'$set': {'level': 5}}),
+            UpdateOne({'id': 'missing'}, {'$set': {'level': 6}}),
+        ]))
+        self.assertEqual((result.inserted_count, result.matched_count, result.modified_count), (1, 3, 3))
+        self.assertEqual({level for _, level in self.reopen().values()}, {5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault('MONGO_URL', f"sqlite:///{os.path.join(_dir.name, 'test.db')}")
+os.environ.setdefault('INCIDENT_ARCHIVE_DIR', os.path.join(_dir.name, 'archive'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from checkins import TimerWheel  # noqa: E402
+
+
+class TimerWheelTest(unittest.TestCase):
+    def test_fires_on_the_first_tick_at_or_after_the_deadline(self):
+        wheel = TimerWheel(tick=1.0, now=100.0)
+        wheel.arm('a', 102.5)
+        self.assertEqual(wheel.advance(102.9), [])
+        self.assertEqual(wheel.advance(103.0), ['a'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_far_deadlines_cascade_and_fire_in_order(self):
+        wheel = TimerWheel(tick=1.0, slots=8, levels=2, now=0.0)
+        deadlines = {'soon': 3, 'level1': 20, 'edge': 64, 'overflow': 500}
+        for key, deadline in deadlines.items():
+            wheel.arm(key, deadline)
+        fired = {}
+        for t in range(1, 600):
+            for key in wheel.advance(t):
+                fired[key] = t
+        self.assertEqual(fired, deadlines)
+
+    def test_cancel_and_rearm(self):
+        wheel = TimerWheel(tick=1.0, now=0.0)
+        wheel.arm('a', 5)
+        wheel.arm('b', 5)
+        self.assertTrue(wheel.cancel('a'))
+        self.assertFalse(wheel.cancel('a'))
+        wheel.arm('b', 10)
+        self.assertEqual(wheel.advance(9), [])
+        self.assertEqual(wheel.advance(10), ['b'])
+
+    def test_past_deadline_fires_on_next_tick(self):
+        wheel = TimerWheel(tick=1.0, now=50.0)
+        wheel.arm('late', 10)
+        self.assertEqual(wheel.advance(51), ['late'])
+
+
+class EscalationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def call(self, fn, *args, **kwargs):
+        return self.client.portal.call(lambda: fn(*args, **kwargs))
+
+    def missed_checkin(self):
+        user = {'id': str(uuid.uuid4()), 'name': 'walker', 'email': 'walker@example.com'}
+        self.client.post('/api/users', json=user)
+        checkin = self.client.post('/api/checkins', json={
+            'userId': user['id'], 'minutes': 30, 'location': {'lat': 40.0, 'lng': -74.0},
+        }).json()
+        past = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+        self.call(server.db.checkins.update_one, {'id': checkin['id']}, {'$set': {'deadline': past}})
+        return checkin
+
+    def test_missed_checkin_raises_incident(self):
+        checkin = self.missed_checkin()
+        self.call(server.escalate_missed_checkins, [checkin['id']])
+
+        checkin = self.client.get(f"/api/checkins/{checkin['id']}").json()
+        self.assertEqual(checkin['status'], 'expired')
+        incident = self.client.get(f"/api/incidents/{checkin['incidentId']}")
+        self.assertEqual(incident.status_code, 200)
+        self.assertEqual(incident.json()['victimId'], checkin['userId'])
+
+    def test_failed_escalation_is_retried(self):
+        checkin = self.missed_checkin()
+        with mock.patch.object(server, 'create_incident', side_effect=RuntimeError('boom')):
+            self.call(server.escalate_missed_checkins, [checkin['id']])
+
+        after = self.client.get(f"/api/checkins/{checkin['id']}").json()
+        self.assertEqual(after['status'], 'active')
+        self.assertIsNone(after['incidentId'])
+        self.assertIn(checkin['id'], server.checkin_scheduler.wheel)
+
+        self.call(server.escalate_missed_checkins, [checkin['id']])
+        self.assertEqual(self.client.get(f"/api/checkins/{checkin['id']}").json()['status'], 'expired')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import MockDatabase, sort_value  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+SORTS = [
+    [('score', 1)],
+    [('score', -1)],
+    [('group', 1), ('score', 1)],
+    [('group', -1), ('score', -1)],
+    [('group', 1), ('score', -1)],
+    [('timestamp', -1)],
+]
+
+
+def keys(docs, sort):
+    return [tuple(sort_value(d.get(f)) for f, _ in sort) for d in docs]
+
+
+def full_sort(docs, sort):
+    # Reference: stable sorts from the last key to the first
+    docs = list(docs)
+    for field, order in reversed(sort):
+        docs.sort(key=lambda d: sort_value(d.get(field)), reverse=order == -1)
+    return docs
+
+
+class CursorTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.incidents = self.db.incidents
+        rng = random.Random(5)
+        docs = []
+        for i in range(500):
+            doc = {'id': f'i{i}', 'group': rng.choice('abc'), 'timestamp': f'2026-01-{rng.randint(1, 28):02d}'}
+            if rng.random() < 0.9:
+                doc['score'] = rng.choice([rng.randint(0, 50), rng.random() * 50, None])
+            docs.append(doc)
+        asyncio.run(self.incidents.insert_many(docs))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def find(self, sort, skip=0, limit=0, query=None):
+        cursor = self.incidents.find(query or {}).sort(sort).skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        docs = asyncio.run(cursor.to_list(None))
+        self.assertEqual(len(docs), len({d['id'] for d in docs}))
+        return docs
+
+    def test_sort_limit_matches_a_full_sort(self):
+        # Ties may come back in any order, so compare the sort keys
+        for sort in SORTS:
+            expected = keys(full_sort(self.incidents.data, sort), sort)
+            self.assertEqual(keys(self.find(sort), sort), expected, sort)
+            for skip, limit in ((0, 1), (0, 10), (5, 20), (490, 20), (0, 600)):
+                self.assertEqual(keys(self.find(sort, skip, limit), sort), expected[skip:skip + limit], (sort, skip, limit))
+
+    def test_sort_limit_with_a_filter(self):
+        query = {'group': 'b', 'score': {'$gte': 10}}
+        docs = [d for d in self.incidents.data if d['group'] == 'b'
+                and isinstance(d.get('score'), (int, float)) and d['score'] >= 10]
+        sort = [('score', -1)]
+        found = self.find(sort, 3, 15, query)
+        self.assertEqual(keys(found, sort), keys(full_sort(docs, sort), sort)[3:18])
+        self.assertTrue(all(d['group'] == 'b' for d in found))
+
+    def test_async_iteration_walks_a_snapshot(self):
+        for sort in ([('timestamp', -1)], [('score', 1)], None):
+            async def walk():
+                seen = []
+                cursor = self.incidents.find({})
+                if sort:
+                    cursor = cursor.sort(sort)
+                async for doc in cursor:
+                    seen.append(doc['id'])
+                    if len(seen) == 100:
+                        # Move documents already seen to the end of the order,
+                        # and add new ones, mid-iteration
+                        for _id in seen[:50]:
+                            await self.incidents.update_one({'id': _id}, {'$set': {'timestamp': '2000-01-01', 'score': 99}})
+                        await self.incidents.insert_one({'id': f'late-{sort}', 'timestamp': '2000-01-01'})
+                    if len(seen) % 200 == 0:
+                        await asyncio.sleep(0)
+                return seen
+
+            seen = asyncio.run(walk())
+            self.assertEqual(len(seen), len(set(seen)), sort)
+            self.assertTrue({f'i{i}' for i in range(500)} <= set(seen), sort)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from events import EventHub  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+def frames(subscription):
+    out = []
+    while not subscription.queue.empty():
+        event, data = subscription.queue.get_nowait().decode().strip().split('\n')
+        out.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return out
+
+
+class IncidentEventsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.hub = EventHub()
+        self.db.incidents.add_listener(self.hub.incident_listener)
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def test_updates_carry_changed_and_removed_fields(self):
+        subscription = self.hub.subscribe()
+
+        async def run():
+            await self.db.incidents.insert_one({'id': 'i1', 'status': 'active', 'respondingHelpers': ['h1']})
+            await self.db.incidents.update_one({'id': 'i1'}, {'$set': {'status': 'resolved'}, '$unset': {'respondingHelpers': ''}})
+
+        asyncio.run(run())
+        (created_event, created), (updated_event, updated) = frames(subscription)
+        self.assertEqual(created_event, 'incident.created')
+        self.assertEqual(created, {'id': 'i1', 'status': 'active', 'respondingHelpers': ['h1']})
+        self.assertEqual(updated_event, 'incident.updated')
+        self.assertEqual(updated, {'id': 'i1', 'status': 'resolved', 'removedFields': ['respondingHelpers']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import geo  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+CENTER = (40.7128, -74.0060)
+
+
+def north_of(center, meters):
+    # Due north, where the haversine distance is exactly the arc length
+    return center[0] + math.degrees(meters / geo.EARTH_RADIUS_M), center[1]
+
+
+class NearQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.incidents = self.db.incidents
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def near(self, radius, center=CENTER, **extra):
+        query = {'location': {'$near': {'lat': center[0], 'lng': center[1]}, '$maxDistance': radius, **extra}}
+        return asyncio.run(self.incidents.find(query).to_list(None))
+
+    def test_results_are_nearest_first(self):
+        rng = random.Random(3)
+        docs = []
+        for i in range(200):
+            lat = CENTER[0] + rng.uniform(-0.05, 0.05)
+            lng = CENTER[1] + rng.uniform(-0.05, 0.05)
+            docs.append({'id': f'i{i}', 'location': {'lat': lat, 'lng': lng}})
+        asyncio.run(self.incidents.insert_many(docs))
+
+        for radius in (300, 1500, 4000):
+            found = self.near(radius)
+            distances = [geo.haversine_m(*CENTER, d['location']['lat'], d['location']['lng']) for d in found]
+            self.assertEqual(distances, sorted(distances))
+            expected = {
+                d['id'] for d in docs
+                if geo.haversine_m(*CENTER, d['location']['lat'], d['location']['lng']) <= radius
+            }
+            self.assertEqual({d['id'] for d in found}, expected, radius)
+
+    def test_radius_edges(self):
+        asyncio.run(self.incidents.insert_many([
+            {'id': 'inside', 'location': dict(zip(('lat', 'lng'), north_of(CENTER, 999.5)))},
+            {'id': 'outside', 'location': dict(zip(('lat', 'lng'), north_of(CENTER, 1000.5)))},
+            {'id': 'center', 'location': {'lat': CENTER[0], 'lng': CENTER[1]}},
+            {'id': 'unlocated'},
+        ]))
+        self.assertEqual([d['id'] for d in self.near(1000)], ['center', 'inside'])
+        self.assertEqual([d['id'] for d in self.near(1000, **{'$minDistance': 1})], ['inside'])
+        self.assertEqual([d['id'] for d in self.near(0)], ['center'])
+
+    def test_grid_cell_boundaries(self):
+        # Points just either side of grid lines are found from a neighbouring cell
+        cell = self.incidents.indexes['location_2dsphere'].cell_deg
+        base = math.floor(CENTER[0] / cell) * cell
+        asyncio.run(self.incidents.insert_many([
+            {'id': 'below', 'location': {'lat': base - 1e-6, 'lng': CENTER[1]}},
+            {'id': 'above', 'location': {'lat': base + 1e-6, 'lng': CENTER[1]}},
+        ]))
+        found = self.near(5, center=(base, CENTER[1]))
+        self.assertEqual({d['id'] for d in found}, {'below', 'above'})
+
+    def test_location_formats(self):
+        lat, lng = north_of(CENTER, 100)
+        asyncio.run(self.incidents.insert_many([
+            {'id': 'latlng', 'location': {'lat': lat, 'lng': lng}},
+            {'id': 'geojson', 'location': {'type': 'Point', 'coordinates': [lng, lat]}},
+            {'id': 'pair', 'location': [lng, lat]},
+        ]))
+        self.assertEqual({d['id'] for d in self.near(200)}, {'latlng', 'geojson', 'pair'})
+        self.assertEqual(self.near(50), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
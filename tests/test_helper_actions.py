@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault('MONGO_URL', f"sqlite:///{os.path.join(_dir.name, 'test.db')}")
+os.environ.setdefault('INCIDENT_ARCHIVE_DIR', os.path.join(_dir.name, 'archive'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+class HelperActionsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def create_user(self, name):
+        user = {'id': str(uuid.uuid4()), 'name': name, 'email': f'{name}@example.com'}
+        return self.client.post('/api/users', json=user).json()
+
+    def test_cancel_and_respond_again_awards_once(self):
+        victim = self.create_user('victim')
+        helper = self.create_user('helper')
+        incident = self.client.post('/api/incidents', json={
+            'id': str(uuid.uuid4()), 'type': 'medical', 'victimId': victim['id'], 'status': 'active',
+            'location': {'lat': 40.0, 'lng': -74.0}, 'timestamp': '2026-01-01T00:00:00+00:00',
+        }).json()
+        url = f"/api/incidents/{incident['id']}"
+        action = {'helperId': helper['id']}
+
+        self.client.post(f'{url}/respond', json=action)
+        for _ in range(5):
+            self.client.post(f'{url}/arrive', json=action)
+            self.client.delete(f'{url}/respond', params=action)
+            self.client.post(f'{url}/respond', json=action)
+
+        after = self.client.get(f"/api/users/{helper['id']}").json()
+        self.assertEqual(after['points'] - helper['points'], server.ARRIVAL_POINTS)
+        self.assertEqual(after['responses'] - helper['responses'], 1)
+        incident = self.client.get(url).json()
+        self.assertEqual(incident['respondingHelpers'], [helper['id']])
+        self.assertEqual(incident['arrivedHelpers'], [helper['id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from ingest import LocationIngestor  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+class LocationIngestorTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        asyncio.run(self.db.users.insert_many([{'id': f'u{i}'} for i in range(3)]))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def locations(self):
+        docs = asyncio.run(self.db.users.find({}).to_list(None))
+        return {d['id']: d.get('location') for d in docs}
+
+    def test_reports_within_the_window_are_coalesced(self):
+        ingestor = LocationIngestor(self.db.users, window=0.05)
+
+        async def run():
+            await ingestor.submit([('u0', [1, 1]), ('u1', [2, 2])])
+            await ingestor.submit([('u0', [3, 3])])
+            await asyncio.sleep(0.2)
+
+        asyncio.run(run())
+        self.assertEqual((ingestor.received, ingestor.written), (3, 2))
+        self.assertEqual(self.locations(), {'u0': [3, 3], 'u1': [2, 2], 'u2': None})
+
+    def test_stop_waits_for_a_timer_flush(self):
+        ingestor = LocationIngestor(self.db.users, window=0.01)
+
+        async def run():
+            await ingestor.submit([('u0', [1, 1])])
+            await asyncio.sleep(0.05)
+            # The timer fired and its flush task was kept
+            self.assertIsNotNone(ingestor._flush_task)
+            await ingestor.submit([('u1', [2, 2])])
+            await ingestor.stop()
+
+        asyncio.run(run())
+        self.assertEqual(ingestor.written, 2)
+        self.assertEqual(self.locations(), {'u0': [1, 1], 'u1': [2, 2], 'u2': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
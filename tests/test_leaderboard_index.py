@@ -0,0 +1,70 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import MockDatabase, compile_query, sort_value  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+class PointsIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.users = self.db.users
+        rng = random.Random(11)
+        users = [{'id': f'u{i}', 'points': rng.randint(0, 40)} for i in range(200)]
+        # Odd values order by type bracket, as in MongoDB
+        users += [{'id': 'missing'}, {'id': 'null', 'points': None}, {'id': 'float', 'points': 12.5},
+                  {'id': 'text', 'points': 'lots'}]
+        asyncio.run(self.users.insert_many(users))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def top(self, n):
+        return asyncio.run(self.users.find({}).sort('points', -1).limit(n).to_list(n))
+
+    def full_sort(self):
+        return sorted(self.users.data, key=lambda u: sort_value(u.get('points')), reverse=True)
+
+    def test_index_walk_matches_a_full_sort(self):
+        self.assertIsNotNone(self.users._sorted_index('points'))
+        for n in (1, 10, 50, 204):
+            self.assertEqual(
+                [sort_value(u.get('points')) for u in self.top(n)],
+                [sort_value(u.get('points')) for u in self.full_sort()[:n]],
+            )
+        self.assertEqual(self.top(1)[0]['id'], 'text')
+
+    def test_ranges_match_a_scan(self):
+        for cond in ({'$gt': 20}, {'$gte': 20, '$lt': 30}, {'$lte': 12.5}, {'$gt': 'a'}, {'$lt': 0}):
+            query = {'points': cond}
+            found = asyncio.run(self.users.find(query).to_list(None))
+            scan = [u for u in self.users.data if compile_query(query)(u)]
+            self.assertEqual(sorted(u['id'] for u in found), sorted(u['id'] for u in scan), cond)
+
+    def test_ranks_follow_updates(self):
+        async def churn():
+            for i in range(0, 200, 7):
+                await self.users.update_one({'id': f'u{i}'}, {'$inc': {'points': 25}})
+            await self.users.delete_one({'id': 'u1'})
+
+        asyncio.run(churn())
+        numeric = [u for u in self.users.data if isinstance(u.get('points'), (int, float))]
+        for user in numeric[:20]:
+            ahead = asyncio.run(self.users.count_documents({'points': {'$gt': user['points']}}))
+            self.assertEqual(ahead, sum(1 for u in numeric if u['points'] > user['points']))
+        self.assertEqual(
+            [u.get('points') for u in self.top(30)],
+            [u.get('points') for u in self.full_sort()[:30]],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
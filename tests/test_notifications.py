@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import MockDatabase  # noqa: E402
+from notifications import FakeProvider, NotificationOutbox  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+class SlowFakeProvider(FakeProvider):
+    rate_per_second = 20.0
+    burst = 1
+
+
+class NotificationOutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def outbox(self, provider, **kwargs):
+        return NotificationOutbox(self.db.notifications, [provider], workers=2, backoff=0.01, **kwargs)
+
+    async def settled(self, ids, timeout=5.0):
+        # Jobs once none of them is pending any more
+        deadline = time.monotonic() + timeout
+        while True:
+            jobs = await self.db.notifications.find({"id": {"$in": ids}}, {"_id": 0}).to_list(None)
+            if all(job["status"] != "pending" for job in jobs) or time.monotonic() > deadline:
+                return {job["id"]: job for job in jobs}
+            await asyncio.sleep(0.01)
+
+    def test_retries_after_a_failure(self):
+        provider = FakeProvider(fail_times=1)
+
+        async def run():
+            outbox = self.outbox(provider)
+            await outbox.start()
+            job_id = await outbox.enqueue("+15550100", "help")
+            job = (await self.settled([job_id]))[job_id]
+            await outbox.stop()
+            return job
+
+        job = asyncio.run(run())
+        self.assertEqual(job["status"], "sent")
+        self.assertEqual(job["attempts"], 2)
+        self.assertEqual(provider.sent, [("+15550100", "help")])
+
+    def test_gives_up_after_max_attempts(self):
+        provider = FakeProvider(fail_times=10)
+
+        async def run():
+            outbox = self.outbox(provider, max_attempts=3)
+            await outbox.start()
+            job_id = await outbox.enqueue("+15550100", "help")
+            job = (await self.settled([job_id]))[job_id]
+            await outbox.stop()
+            return job
+
+        job = asyncio.run(run())
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["attempts"], 3)
+        self.assertEqual(job["error"], "simulated provider failure")
+        self.assertEqual(provider.sent, [])
+        self.assertEqual(provider.fail_times, 7)
+
+    def test_restart_delivers_pending_jobs(self):
+        provider = FakeProvider()
+
+        async def run():
+            # Queued by a process that stopped before delivering anything
+            ids = await self.outbox(provider).enqueue_many([{"to": f"+1555010{i}", "body": "help"} for i in range(3)])
+            follower = self.outbox(provider)
+            await follower.start(recover=False)
+            await asyncio.sleep(0.05)
+            self.assertEqual(provider.sent, [])
+            await follower.stop()
+
+            outbox = self.outbox(provider)
+            await outbox.start()
+            jobs = await self.settled(ids)
+            await outbox.stop()
+            return jobs
+
+        jobs = asyncio.run(run())
+        self.assertEqual({job["status"] for job in jobs.values()}, {"sent"})
+        self.assertEqual(len(provider.sent), 3)
+
+    def test_provider_rate_limit(self):
+        provider = SlowFakeProvider()
+
+        async def run():
+            outbox = self.outbox(provider)
+            await outbox.start()
+            start = time.monotonic()
+            ids = await outbox.enqueue_many([{"to": "+15550100", "body": str(i)} for i in range(5)])
+            await self.settled(ids)
+            elapsed = time.monotonic() - start
+            await outbox.stop()
+            return elapsed
+
+        # One message up front, then one every 1/20 s
+        self.assertGreaterEqual(asyncio.run(run()), 4 / SlowFakeProvider.rate_per_second * 0.9)
+        self.assertEqual(len(provider.sent), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from fastapi import HTTPException  # noqa: E402
+
+from mock_db import MockDatabase  # noqa: E402
+from pagination import encode_cursor, paginate  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+SORT = [('timestamp', -1), ('id', -1)]
+
+
+class KeysetPaginationTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.incidents = self.db.incidents
+        # Five incidents share each timestamp, so pages split ties
+        asyncio.run(self.incidents.insert_many([
+            {'id': f'i{i:03d}', 'status': 'active' if i % 3 else 'resolved', 'timestamp': f'2026-01-{1 + i // 5:02d}'}
+            for i in range(53)
+        ]))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def pages(self, query, limit, projection=None, between=None):
+        async def walk():
+            ids, after = [], None
+            while True:
+                docs, after = await paginate(self.incidents, query, SORT, limit, after, projection)
+                ids.extend(doc['id'] for doc in docs)
+                if after is None:
+                    return ids
+                if between is not None:
+                    await between()
+        return asyncio.run(walk())
+
+    def expected(self, query):
+        docs = asyncio.run(self.incidents.find(query).to_list(None))
+        return [d['id'] for d in sorted(docs, key=lambda d: (d['timestamp'], d['id']), reverse=True)]
+
+    def test_pages_cover_the_sorted_results_once(self):
+        for limit in (1, 4, 5, 7, 53, 100):
+            self.assertEqual(self.pages({}, limit), self.expected({}), limit)
+        self.assertEqual(self.pages({'status': 'active'}, 6), self.expected({'status': 'active'}))
+
+    def test_projection_without_sort_keys(self):
+        self.assertEqual(self.pages({}, 8, {'_id': 0, 'id': 1, 'status': 1}), self.expected({}))
+
+    def test_writes_between_pages_do_not_repeat_rows(self):
+        added = []
+
+        async def insert_newer():
+            # Newer rows land before the cursor and never shift later pages
+            added.append(f'new{len(added)}')
+            await self.incidents.insert_one({'id': added[-1], 'timestamp': '2027-01-01'})
+
+        ids = self.pages({}, 10, between=insert_newer)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, [i for i in self.expected({}) if i not in added])
+
+    def test_bad_cursor(self):
+        for cursor in ('not-base64!', encode_cursor(['2026-01-01']), encode_cursor({'a': 1}), 'e30'):
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(paginate(self.incidents, {}, SORT, 10, cursor))
+            self.assertEqual(raised.exception.status_code, 400, cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
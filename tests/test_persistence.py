@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import MockDatabase  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+
+def crash(db):
+    # Stop the flusher thread without close(): no final flush or compaction
+    engine = db.engine
+    engine._closed = True
+    engine._wake.set()
+    if engine._thread is not None:
+        engine._thread.join()
+
+
+class PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'db.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def open(self, **kwargs):
+        return MockDatabase(PersistenceEngine(self.path, **kwargs))
+
+    async def write(self, db):
+        await db.users.insert_many([{'id': f'u{i}', 'points': i} for i in range(10)])
+        await db.users.update_one({'id': 'u3'}, {'$inc': {'points': 100}, '$set': {'name': 'three'}})
+        await db.users.update_one({'id': 'u4'}, {'$unset': {'points': ''}})
+        await db.users.delete_one({'id': 'u5'})
+
+    def assert_written(self, db):
+        users = {u['id']: u for u in asyncio.run(db.users.find({}, {'_id': 0}).to_list(None))}
+        self.assertEqual(len(users), 9)
+        self.assertNotIn('u5', users)
+        self.assertEqual(users['u3'], {'id': 'u3', 'points': 103, 'name': 'three'})
+        self.assertEqual(users['u4'], {'id': 'u4'})
+        # Indexes are rebuilt or patched for the replayed writes
+        top = asyncio.run(db.users.find({}).sort('points', -1).limit(1).to_list(None))
+        self.assertEqual(top[0]['id'], 'u3')
+
+    def test_log_replayed_after_crash_without_close(self):
+        db = self.open(fsync='always')
+        asyncio.run(self.write(db))
+        crash(db)
+        self.assertTrue(os.path.exists(self.path + '.log'))
+
+        db = self.open()
+        try:
+            self.assert_written(db)
+        finally:
+            db.close()
+
+    def test_torn_final_line_is_ignored(self):
+        db = self.open(fsync='always')
+        asyncio.run(self.write(db))
+        crash(db)
+        with open(self.path + '.log', 'ab') as f:
+            f.write(b'{"op": "i", "doc": {"_id": "x", "id": "torn"')
+
+        db = self.open()
+        try:
+            self.assert_written(db)
+            self.assertIsNone(asyncio.run(db.users.find_one({'id': 'torn'})))
+        finally:
+            db.close()
+
+    def test_compaction_folds_the_log_into_the_snapshot(self):
+        db = self.open(compact_every=5)
+        asyncio.run(self.write(db))
+        db.engine.flush()
+        self.assertGreaterEqual(db.engine.stats['compactions'], 1)
+        db.close()
+        self.assertFalse(os.path.exists(self.path + '.log'))
+
+        db = self.open()
+        try:
+            self.assert_written(db)
+        finally:
+            db.close()
+
+    def test_crash_during_compaction_is_finished_on_load(self):
+        db = self.open(fsync='always')
+        asyncio.run(self.write(db))
+        crash(db)
+        # Rotated but never folded into the snapshot
+        os.replace(self.path + '.log', self.path + '.log.compacting')
+
+        db = self.open()
+        try:
+            self.assertFalse(os.path.exists(self.path + '.log.compacting'))
+            self.assert_written(db)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from mock_db import DuplicateKeyError, MockDatabase, compile_query  # noqa: E402
+from persistence import PersistenceEngine  # noqa: E402
+
+STATUSES = ['active', 'resolved', 'cancelled', None]
+VICTIMS = ['v0', 'v1', 'v2', None]
+HELPERS = ['h0', 'h1', 'h2', 'h3']
+
+QUERIES = [
+    {'id': 'i7'},
+    {'status': 'active'},
+    {'status': None},
+    {'status': {'$in': ['active', 'resolved']}},
+    {'status': {'$ne': 'active'}},
+    {'victimId': 'v1', 'status': 'active'},
+    {'victimId': None},
+    {'respondingHelpers': 'h2'},
+    {'respondingHelpers': {'$in': ['h0', 'h3']}, 'status': 'resolved'},
+    {'timestamp': {'$gte': '2026-01-10', '$lt': '2026-01-20'}},
+    {'timestamp': {'$gt': '2026-01-25'}, 'status': 'active'},
+    {'$or': [{'status': 'cancelled'}, {'victimId': 'v0'}]},
+    {'status': 'active', 'rank': {'$lt': 50}},
+]
+
+
+def incident(rng, i):
+    doc = {'id': f'i{i}', 'rank': i, 'timestamp': f'2026-01-{rng.randint(1, 31):02d}'}
+    status = rng.choice(STATUSES)
+    if status is not None:
+        doc['status'] = status
+    victim = rng.choice(VICTIMS)
+    if victim is not None or rng.random() < 0.5:
+        doc['victimId'] = victim
+    doc['respondingHelpers'] = rng.sample(HELPERS, rng.randint(0, 3))
+    return doc
+
+
+class QueryPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = MockDatabase(PersistenceEngine(os.path.join(self.dir.name, 'db.json')))
+        self.incidents = self.db.incidents
+        self.rng = random.Random(7)
+        asyncio.run(self.incidents.insert_many([incident(self.rng, i) for i in range(300)]))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def assert_matches_scan(self):
+        for query in QUERIES:
+            found = asyncio.run(self.incidents.find(query).to_list(None))
+            scan = [doc for doc in self.incidents.data if compile_query(query)(doc)]
+            self.assertEqual(sorted(d['id'] for d in found), sorted(d['id'] for d in scan), query)
+            self.assertEqual(asyncio.run(self.incidents.count_documents(query)), len(scan), query)
+
+    def test_indexed_queries_use_an_index(self):
+        for query in ({'id': 'i7'}, {'status': 'active'}, {'respondingHelpers': 'h2'},
+                      {'timestamp': {'$gte': '2026-01-10', '$lt': '2026-01-20'}}):
+            self.assertIsNotNone(self.incidents._plan(query), query)
+
+    def test_results_match_a_linear_scan(self):
+        self.assert_matches_scan()
+
+    def test_results_match_after_updates_and_deletes(self):
+        async def churn():
+            for i in range(0, 300, 3):
+                await self.incidents.update_one({'id': f'i{i}'}, {
+                    '$set': {'status': self.rng.choice(STATUSES[:3]), 'timestamp': '2026-01-15'},
+                    '$addToSet': {'respondingHelpers': 'h1'},
+                })
+            await self.incidents.update_many({'victimId': 'v2'}, {'$unset': {'victimId': ''}})
+            await self.incidents.delete_many({'status': 'cancelled', 'rank': {'$lt': 150}})
+            await self.incidents.update_many({'respondingHelpers': 'h0'}, {'$pull': {'respondingHelpers': 'h0'}})
+
+        asyncio.run(churn())
+        self.assert_matches_scan()
+
+    def test_unique_index_rejects_duplicates(self):
+        self.db.users.ensure_index('phone', unique=True)
+        asyncio.run(self.db.users.insert_one({'id': 'u1', 'phone': '555'}))
+        with self.assertRaises(DuplicateKeyError):
+            asyncio.run(self.db.users.insert_one({'id': 'u2', 'phone': '555'}))
+        asyncio.run(self.db.users.insert_one({'id': 'u3', 'phone': '556'}))
+        with self.assertRaises(DuplicateKeyError):
+            asyncio.run(self.db.users.update_one({'id': 'u3'}, {'$set': {'phone': '555'}}))
+        self.assertEqual(asyncio.run(self.db.users.count_documents({'phone': '555'})), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault('MONGO_URL', f"sqlite:///{os.path.join(_dir.name, 'test.db')}")
+os.environ.setdefault('INCIDENT_ARCHIVE_DIR', os.path.join(_dir.name, 'archive'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+class ExpandedIncidentCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def create_user(self, name):
+        user = {'id': str(uuid.uuid4()), 'name': name, 'email': f'{name}@example.com'}
+        return self.client.post('/api/users', json=user).json()
+
+    def poll(self, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/api/incidents', params={'status': 'cache-test'}, headers=headers)
+
+    def test_only_embedded_users_invalidate_the_page(self):
+        victim = self.create_user('victim')
+        bystander = self.create_user('bystander')
+        self.client.post('/api/incidents', json={
+            'id': str(uuid.uuid4()), 'type': 'medical', 'victimId': victim['id'], 'status': 'cache-test',
+            'location': {'lat': 40.0, 'lng': -74.0}, 'timestamp': '2026-01-01T00:00:00+00:00',
+        })
+        etag = self.poll().headers['ETag']
+
+        self.client.put(f"/api/users/{bystander['id']}", json={'bio': 'pinged'})
+        hits = server.response_cache.hits
+        self.assertEqual(self.poll(etag).status_code, 304)
+        self.assertEqual(server.response_cache.hits, hits + 1)
+
+        self.client.put(f"/api/users/{victim['id']}", json={'bio': 'changed'})
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['victim']['bio'], 'changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from starlette.requests import Request  # noqa: E402
+
+from cache import ResponseCache  # noqa: E402
+from mock_db import MockDatabase  # noqa: E402
+from persistence import SQLiteEngine  # noqa: E402
+
+WORKERS = 4
+WRITES = 200
+
+
+def open_db(path):
+    return MockDatabase(SQLiteEngine(path, shared=True))
+
+
+def hammer(path, worker):
+    async def run():
+        db = open_db(path)
+        for i in range(WRITES):
+            await db.users.update_one({'id': 'counter'}, {'$inc': {'n': 1}})
+            await db.incidents.insert_one({'id': f'{worker}-{i}', 'worker': worker})
+            # Read-modify-write through the in-memory copy: only correct if
+            # it reflects every other worker's writes
+            counter = await db.users.find_one({'id': 'counter'})
+            await db.users.update_one({'id': 'counter'}, {'$set': {f'last.{worker}': counter['n']}})
+        db.close()
+
+    asyncio.run(run())
+
+
+class SharedSQLiteTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'shared.db')
+        db = open_db(self.path)
+        asyncio.run(db.users.insert_one({'id': 'counter', 'n': 0}))
+        db.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_concurrent_writers_lose_no_updates(self):
+        ctx = multiprocessing.get_context('spawn')
+        procs = [ctx.Process(target=hammer, args=(self.path, w)) for w in range(WORKERS)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(120)
+            self.assertEqual(p.exitcode, 0)
+
+        db = open_db(self.path)
+        try:
+            counter = asyncio.run(db.users.find_one({'id': 'counter'}))
+            self.assertEqual(counter['n'], WORKERS * WRITES)
+            self.assertEqual(len(counter['last']), WORKERS)
+            self.assertEqual(asyncio.run(db.incidents.count_documents({})), WORKERS * WRITES)
+            for w in range(WORKERS):
+                self.assertEqual(asyncio.run(db.incidents.count_documents({'worker': w})), WRITES)
+        finally:
+            db.close()
+
+    def test_reads_see_other_process_writes(self):
+        a, b = open_db(self.path), open_db(self.path)
+        try:
+            asyncio.run(a.users.update_one({'id': 'counter'}, {'$inc': {'n': 5}}))
+            asyncio.run(a.incidents.insert_one({'id': 'x', 'status': 'active'}))
+            self.assertEqual(asyncio.run(b.users.find_one({'id': 'counter'}))['n'], 5)
+            # Replayed writes maintain b's indexes
+            self.assertEqual(len(asyncio.run(b.incidents.find({'status': 'active'}).to_list(None))), 1)
+            asyncio.run(a.incidents.delete_one({'id': 'x'}))
+            self.assertEqual(asyncio.run(b.incidents.count_documents({'status': 'active'})), 0)
+        finally:
+            a.close()
+            b.close()
+
+    def test_cached_responses_see_other_process_writes(self):
+        a, b = open_db(self.path), open_db(self.path)
+        cache = ResponseCache(sync=b.sync)
+        request = Request({'type': 'http', 'method': 'GET', 'path': '/api/users', 'query_string': b'', 'headers': []})
+
+        async def respond():
+            async def build():
+                counter = await b.users.find_one({'id': 'counter'})
+                return str(counter['n']).encode(), None
+            return (await cache.respond(request, [b.users], build)).body
+
+        try:
+            self.assertEqual(asyncio.run(respond()), b'0')
+            asyncio.run(a.users.update_one({'id': 'counter'}, {'$inc': {'n': 1}}))
+            self.assertEqual(asyncio.run(respond()), b'1')
+        finally:
+            a.close()
+            b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()